@@ -0,0 +1,258 @@
+"""Bid history as column files, and statistics computed over them with NumPy.
+
+    python -m analytics --session 2024-05-01 [--ledger orders/aukcje.db] [--json]
+
+The SQLite ledger stays the source of truth. :func:`export` copies the bids
+it has not copied yet into one raw file per column (``id.i8``, ``cena.f8``,
+...), so a season of millions of bids loads with one ``numpy.fromfile`` per
+column instead of millions of row objects. Bidders are stored as indexes into
+``users.json``; auctions, which are few and change when they end, are
+rewritten to ``auctions.json`` on every export.
+
+Exporting needs only the standard library, so it runs in the ledger thread
+(or worker) without NumPy installed; :func:`summarize` needs NumPy.
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+from array import array
+from pathlib import Path
+
+# Column name -> array typecode; the file suffix is the NumPy dtype
+COLUMNS = {
+    "id": ("q", "i8"),
+    "auction": ("q", "i8"),
+    "source": ("B", "u1"),
+    "user": ("I", "u4"),
+    "cena": ("d", "f8"),
+    "ts": ("d", "f8"),   # Unix time
+}
+SOURCES = ("discord", "youtube", "twitch")
+# Fractions of a lot's bidding time at which the price curve is sampled
+CURVE_POINTS = (0.25, 0.5, 0.75)
+
+
+def _column(directory: Path, name: str) -> Path:
+    return directory / f"{name}.{COLUMNS[name][1]}"
+
+
+def _write_json(path: Path, data):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _unix(ts: str) -> float:
+    return datetime.datetime.fromisoformat(ts).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def export(conn: sqlite3.Connection, directory: Path, batch: int = 100_000) -> int:
+    """Append the ledger's new bids to the column files; returns how many."""
+    directory.mkdir(parents=True, exist_ok=True)
+    meta_path = directory / "meta.json"
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {"rows": 0, "last_id": 0}
+    users_path = directory / "users.json"
+    users = json.loads(users_path.read_text(encoding="utf-8")) if users_path.exists() else []
+    index = {(s, i if i is not None else n): k for k, (s, i, n) in enumerate(users)}
+    # A crash between the column appends and meta.json leaves extra rows behind
+    for name, (typecode, _dtype) in COLUMNS.items():
+        path = _column(directory, name)
+        if path.exists():
+            with open(path, "r+b") as f:
+                f.truncate(meta["rows"] * array(typecode).itemsize)
+
+    added = 0
+    cursor = conn.execute(
+        "SELECT id, auction_id, source, user, user_id, cena, ts FROM bids WHERE id > ? ORDER BY id",
+        (meta["last_id"],),
+    )
+    while rows := cursor.fetchmany(batch):
+        cols = {name: array(typecode) for name, (typecode, _dtype) in COLUMNS.items()}
+        for bid_id, auction_id, source, user, user_id, cena, ts in rows:
+            key = (source, user_id if user_id is not None else user)
+            k = index.get(key)
+            if k is None:
+                k = index[key] = len(users)
+                users.append([source, user_id, user])
+            elif users[k][2] != user:
+                users[k][2] = user
+            cols["id"].append(bid_id)
+            cols["auction"].append(auction_id)
+            cols["source"].append(SOURCES.index(source) if source in SOURCES else len(SOURCES))
+            cols["user"].append(k)
+            cols["cena"].append(cena)
+            cols["ts"].append(_unix(ts))
+        for name, values in cols.items():
+            with open(_column(directory, name), "ab") as f:
+                values.tofile(f)
+        added += len(rows)
+        meta = {"rows": meta["rows"] + len(rows), "last_id": rows[-1][0]}
+        _write_json(users_path, users)
+        _write_json(meta_path, meta)
+
+    fields = ("id", "session", "nazwa", "numer", "cena_start", "cena_koncowa", "start_time", "end_time")
+    auctions = [
+        dict(zip(fields, r))
+        for r in conn.execute(f"SELECT {', '.join(fields)} FROM auctions ORDER BY id")
+    ]
+    _write_json(directory / "auctions.json", auctions)
+    return added
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Analityka wymaga pakietu numpy (pip install numpy).") from None
+    return numpy
+
+
+def load(directory: Path) -> dict:
+    """The column files as NumPy arrays, cut to the rows ``meta.json`` vouches for."""
+    np = _numpy()
+    meta_path = directory / "meta.json"
+    rows = json.loads(meta_path.read_text())["rows"] if meta_path.exists() else 0
+    return {
+        name: np.fromfile(_column(directory, name), dtype=dtype, count=rows)
+        if rows else np.empty(0, dtype=dtype)
+        for name, (_typecode, dtype) in COLUMNS.items()
+    }
+
+
+def summarize(directory: Path, session: str | None = None, top: int = 5) -> dict:
+    """Bid rate, price curves, final/start prices, top bidders and sources."""
+    np = _numpy()
+    cols = load(directory)
+    auctions = json.loads((directory / "auctions.json").read_text(encoding="utf-8"))
+    users = json.loads((directory / "users.json").read_text(encoding="utf-8")) if cols["id"].size else []
+    if session is not None:
+        auctions = [a for a in auctions if a["session"] == session]
+    a_id = np.array([a["id"] for a in auctions], dtype="i8")
+    a_start = np.array([a["cena_start"] for a in auctions], dtype="f8")
+    a_final = np.array([np.nan if a["cena_koncowa"] is None else a["cena_koncowa"] for a in auctions], dtype="f8")
+
+    keep = np.isin(cols["auction"], a_id)
+    # Bids of one auction together, in the order they were placed
+    order = np.lexsort((cols["id"][keep], cols["auction"][keep]))
+    auction, user, source, cena, ts = (
+        cols[name][keep][order] for name in ("auction", "user", "source", "cena", "ts")
+    )
+    n = auction.size
+    result = {
+        "session": session,
+        "auctions": len(auctions),
+        "bids": int(n),
+    }
+
+    ended = ~np.isnan(a_final) & (a_start > 0)
+    ratio = a_final[ended] / a_start[ended]
+    result["final_vs_start"] = {
+        "ended": int(ended.sum()),
+        "median": float(np.median(ratio)) if ratio.size else None,
+        "mean": float(ratio.mean()) if ratio.size else None,
+        "p90": float(np.percentile(ratio, 90)) if ratio.size else None,
+        "above_start": float((ratio > 1).mean()) if ratio.size else None,
+    }
+    if not n:
+        result.update(bids_per_minute=None, price_curve=None, top_bidders=[], top_winners=[], sources={})
+        return result
+
+    minute = ((ts - ts.min()) // 60).astype("i8")
+    minutes, per_minute = np.unique(minute, return_counts=True)
+    result["bids_per_minute"] = {
+        "active_minutes": int(per_minute.size),
+        "median": float(np.median(per_minute)),
+        "peak": int(per_minute.max()),
+        "peak_at": datetime.datetime.fromtimestamp(
+            ts.min() + 60 * int(minutes[per_minute.argmax()]), datetime.timezone.utc
+        ).isoformat(timespec="minutes"),
+    }
+
+    # Per lot: first bid index, bid count, start price and the time span of its bids
+    starts = np.flatnonzero(np.r_[True, auction[1:] != auction[:-1]])
+    ends = np.r_[starts[1:], n]
+    counts = ends - starts
+    lot = np.repeat(np.arange(starts.size), counts)
+    sorted_ids = np.argsort(a_id)
+    start_price = a_start[sorted_ids[np.searchsorted(a_id, auction[starts], sorter=sorted_ids)]]
+    first, last = ts[starts], ts[ends - 1]
+    span = np.where(last > first, last - first, 1.0)
+    progress = (ts - first[lot]) / span[lot]
+    rise = cena[ends - 1] - start_price
+    curved = rise > 0
+    curve = {}
+    for point in CURVE_POINTS:
+        reached = np.maximum.reduceat(np.where(progress <= point, cena, start_price[lot]), starts)
+        share = (reached - start_price)[curved] / rise[curved]
+        curve[f"{point:.0%}"] = float(np.median(share)) if share.size else None
+    result["price_curve"] = {
+        "lots": int(starts.size),
+        "median_bids": float(np.median(counts)),
+        "median_bidding_seconds": float(np.median(last - first)),
+        "median_share_of_rise_at": curve,
+    }
+
+    def ranking(counts_by_user):
+        best = np.argsort(counts_by_user)[::-1][:top]
+        return [
+            {"user": users[k][2], "source": users[k][0], "count": int(counts_by_user[k])}
+            for k in best if counts_by_user[k]
+        ]
+
+    result["top_bidders"] = ranking(np.bincount(user, minlength=len(users)))
+    result["top_winners"] = ranking(np.bincount(user[ends - 1], minlength=len(users)))
+    by_source = np.bincount(source, minlength=len(SOURCES) + 1)
+    names = SOURCES + ("other",)
+    result["sources"] = {names[i]: float(c / n) for i, c in enumerate(by_source) if c}
+    return result
+
+
+def format_summary(s: dict) -> str:
+    """The summary as a short Discord message."""
+    lines = [f"📊 {s['session'] or 'Wszystkie sesje'}: {s['auctions']} aukcji, {s['bids']} ofert"]
+    f = s["final_vs_start"]
+    if f["median"] is not None:
+        lines.append(
+            f"Cena końcowa / startowa: mediana {f['median']:.2f}x, średnio {f['mean']:.2f}x, "
+            f"p90 {f['p90']:.2f}x, powyżej startowej {f['above_start']:.0%}"
+        )
+    if s["bids"]:
+        m = s["bids_per_minute"]
+        lines.append(
+            f"Oferty/min: mediana {m['median']:.0f}, szczyt {m['peak']} ({m['peak_at']}), "
+            f"aktywne minuty {m['active_minutes']}"
+        )
+        c = s["price_curve"]
+        points = ", ".join(f"{k}: {v:.0%}" for k, v in c["median_share_of_rise_at"].items() if v is not None)
+        lines.append(
+            f"Przebieg ceny: mediana {c['median_bids']:.0f} ofert w {c['median_bidding_seconds']:.0f}s; "
+            f"wzrost osiągnięty po czasie {points}"
+        )
+        lines.append("Źródła: " + ", ".join(f"{k} {v:.0%}" for k, v in s["sources"].items()))
+        lines.append("Najaktywniejsi: " + ", ".join(f"{b['user']} ({b['count']})" for b in s["top_bidders"]))
+        lines.append("Najwięcej wygranych: " + ", ".join(f"{b['user']} ({b['count']})" for b in s["top_winners"]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ledger", type=Path, default=Path(os.getenv("LEDGER_PATH", "orders/aukcje.db")))
+    parser.add_argument("--dir", type=Path, default=Path(os.getenv("BID_COLUMNS_DIR", "orders/oferty")))
+    parser.add_argument("--session", help="only this SESSION_ID")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the raw statistics")
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.ledger)
+    try:
+        export(conn, args.dir)
+    finally:
+        conn.close()
+    summary = summarize(args.dir, args.session, args.top)
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import metrics
+
+if TYPE_CHECKING:
+    import requests
+
+API_BASE = "https://api.pokemontcg.io/v2/cards"
+
+CardAssets = tuple[str | None, str | None]
+
+
+def make_session(api_token: str | None, pool_size: int) -> "requests.Session":
+    """Return a keep-alive HTTP session for the PokemonTCG API."""
+    # requests is imported here, on the first cache miss, to keep it out of startup
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    if api_token:
+        session.headers["X-Api-Key"] = api_token
+    return session
+
+
+def fetch_card_assets(nazwa: str, numer: str, session: "requests.Session") -> CardAssets:
+    """Return card and set logo image URLs from PokemonTCG API if available.
+
+    Raises ``requests.RequestException`` (or ``ValueError`` for a malformed
+    response) when the search request itself fails,
+    so callers can tell a transient error from a card that does not exist.
+    """
+    numer = numer.strip().lower()
+
+    def _parse(card):
+        if card:
+            return (
+                card.get("images", {}).get("large"),
+                card.get("set", {}).get("images", {}).get("logo"),
+            )
+        return None, None
+
+    # First try to fetch by card ID (e.g. sv2-10)
+    try:
+        resp = session.get(f"{API_BASE}/{numer}", timeout=5)
+        logging.info("GET %s -> %s", resp.url, resp.status_code)
+        resp.raise_for_status()
+        card = resp.json().get("data")
+        logging.info("Lookup result: %s", card.get("name") if card else "None")
+        return _parse(card)
+    except Exception as e:
+        logging.warning("Direct lookup for %s failed: %s", numer, e)
+
+    # Fallback to search query if direct lookup failed
+    set_id = ""
+    card_no = numer
+    if "-" in numer:
+        set_id, card_no = numer.split("-", 1)
+    parts = [f'name:"{nazwa}"', f'number:"{card_no}"']
+    if set_id:
+        parts.append(f'set.id:{set_id}')
+    query = " ".join(parts)
+    params = {"q": query, "pageSize": 1}
+    logging.info("Search query: %s", query)
+    resp = session.get(API_BASE, params=params, timeout=5)
+    logging.info("GET %s -> %s", resp.url, resp.status_code)
+    resp.raise_for_status()
+    cards = resp.json().get("data")
+    logging.info("Search returned %s result(s)", len(cards) if cards else 0)
+    if cards:
+        return _parse(cards[0])
+    logging.warning("Card image for %s (%s) not found", nazwa, numer)
+    return None, None
+
+
+class AssetCache:
+    """On-disk LRU cache of card asset URLs with a separate negative cache."""
+
+    def __init__(self, path: Path, ttl: float, negative_ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._negative: dict[str, float] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(nazwa: str, numer: str) -> str:
+        return f"{nazwa.strip().lower()}|{numer.strip().lower()}"
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable asset cache %s: %s", self.path, e)
+            return
+        now = time.time()
+        entries = sorted(data.get("entries", {}).items(), key=lambda kv: kv[1]["used"])
+        for key, entry in entries:
+            if now - entry["ts"] < self.ttl:
+                self._entries[key] = entry
+        self._negative = {
+            key: ts for key, ts in data.get("negative", {}).items()
+            if now - ts < self.negative_ttl
+        }
+
+    def get(self, nazwa: str, numer: str) -> CardAssets | None:
+        """Return cached assets, ``(None, None)`` for a known miss, or None."""
+        key = self.key(nazwa, numer)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry["ts"] < self.ttl:
+                entry["used"] = now
+                self._entries.move_to_end(key)
+                self._dirty = True
+                self.hits += 1
+                return entry["image"], entry["logo"]
+            del self._entries[key]
+        ts = self._negative.get(key)
+        if ts is not None:
+            if now - ts < self.negative_ttl:
+                self.hits += 1
+                return None, None
+            del self._negative[key]
+        self.misses += 1
+        return None
+
+    def put(self, nazwa: str, numer: str, assets: CardAssets):
+        key = self.key(nazwa, numer)
+        now = time.time()
+        self._dirty = True
+        if assets == (None, None):
+            self._negative[key] = now
+            return
+        self._negative.pop(key, None)
+        self._entries[key] = {"image": assets[0], "logo": assets[1], "ts": now, "used": now}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def dump(self) -> dict | None:
+        """Return a snapshot to persist, or None when nothing changed."""
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return {"entries": dict(self._entries), "negative": dict(self._negative)}
+
+    def write(self, data: dict):
+        """Atomically write a snapshot produced by :meth:`dump`."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+class AssetFetcher:
+    """Serve card assets from the cache and fetch misses over a pooled session."""
+
+    def __init__(self, cache: AssetCache, api_token: str | None, concurrency: int):
+        self.cache = cache
+        self.api_token = api_token
+        self.concurrency = concurrency
+        self._session: "requests.Session | None" = None
+        self._session_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="assets")
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    @property
+    def session(self) -> "requests.Session":
+        """The HTTP session, created by the first lookup that needs it."""
+        with self._session_lock:
+            if self._session is None:
+                self._session = make_session(self.api_token, self.concurrency)
+            return self._session
+
+    def _lookup(self, nazwa: str, numer: str) -> CardAssets | None:
+        """Runs in the executor; ``None`` means the request itself failed."""
+        import requests
+
+        try:
+            return fetch_card_assets(nazwa, numer, self.session)
+        except (requests.RequestException, ValueError) as e:
+            # Transient failure: do not remember it as a missing card
+            logging.warning("Search request for %s failed: %s", numer, e)
+            return None
+
+    async def get(self, nazwa: str, numer: str) -> CardAssets:
+        cached = self.cache.get(nazwa, numer)
+        if cached is not None:
+            metrics.ASSET_LOOKUPS.inc("hit")
+            return cached
+        metrics.ASSET_LOOKUPS.inc("miss")
+        key = AssetCache.key(nazwa, numer)
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(nazwa, numer))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, nazwa: str, numer: str) -> CardAssets:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            assets = await loop.run_in_executor(self._executor, self._lookup, nazwa, numer)
+        finally:
+            metrics.ASSET_FETCH_SECONDS.observe(time.perf_counter() - started)
+        if assets is None:
+            metrics.ASSET_LOOKUPS.inc("error")
+            return None, None
+        self.cache.put(nazwa, numer, assets)
+        return assets
+
+    async def prefetch(self, lots) -> list[CardAssets]:
+        """Warm the cache for every ``(nazwa, numer)`` in ``lots`` and return the assets."""
+        started = time.monotonic()
+        misses = self.cache.misses
+        # The executor bounds how many requests actually run at once
+        found = await asyncio.gather(*(self.get(nazwa, numer) for nazwa, numer in dict.fromkeys(lots)))
+        await self.save()
+        logging.info(
+            "Prefetched assets for %s card(s) in %.1fs",
+            self.cache.misses - misses,
+            time.monotonic() - started,
+        )
+        return found
+
+    async def save(self):
+        data = self.cache.dump()
+        if data is not None:
+            await asyncio.to_thread(self.cache.write, data)
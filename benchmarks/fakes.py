@@ -0,0 +1,319 @@
+"""Local stand-ins for the Discord HTTP layer and the YouTube and Twitch chats.
+
+They implement only what ``bot.py`` touches, record every call with a
+monotonic timestamp and simulate network round trips with ``asyncio.sleep``.
+The streaming chats are real local servers, so the chat sources connect to
+them over a socket exactly as they would to YouTube or Twitch.
+"""
+import asyncio
+import datetime
+import itertools
+import json
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+_ids = itertools.count(10_000)
+
+
+class Recorder:
+    """Collects timestamps of sends/edits per message and of interaction acks."""
+
+    def __init__(self):
+        self.edits: dict[int, list[float]] = defaultdict(list)
+        self.sends: dict[int, list[float]] = defaultdict(list)
+        self.acks: list[float] = []
+
+    def reset(self):
+        self.edits.clear()
+        self.sends.clear()
+        self.acks.clear()
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", content=None, embed=None, view=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(self.channel.latency)
+        self.channel.recorder.edits[self.id].append(time.monotonic())
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        return self
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(self.channel.latency)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, recorder: Recorder, latency: float):
+        self.id = channel_id
+        self.recorder = recorder
+        self.latency = latency
+        self.messages: dict[int, FakeMessage] = {}
+
+    async def send(self, content=None, *, embed=None, view=None, **_kwargs):
+        await asyncio.sleep(self.latency)
+        msg = FakeMessage(self, content, embed, view)
+        self.messages[msg.id] = msg
+        self.recorder.sends[self.id].append(time.monotonic())
+        return msg
+
+    async def fetch_message(self, message_id: int):
+        await asyncio.sleep(self.latency)
+        return self.messages[message_id]
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, dm: FakeChannel):
+        self.id = user_id
+        self.name = name
+        self.bot = False
+        self._dm = dm
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def send(self, content=None, **kwargs):
+        return await self._dm.send(content, **kwargs)
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _ack(self):
+        await asyncio.sleep(self._interaction.latency)
+        self._done = True
+        self._interaction.acked_at = time.monotonic()
+        self._interaction.recorder.acks.append(self._interaction.acked_at - self._interaction.created_at)
+
+    async def send_message(self, content=None, *, ephemeral=False, **_kwargs):
+        await self._ack()
+        self._interaction.message = FakeMessage(self._interaction.channel, content)
+
+    async def defer(self, **_kwargs):
+        await self._ack()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, ephemeral=False, wait=False, **_kwargs):
+        await asyncio.sleep(self._interaction.latency)
+        return FakeMessage(self._interaction.channel, content)
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeUser, channel: FakeChannel, recorder: Recorder, latency: float):
+        self.user = user
+        self.channel = channel
+        self.recorder = recorder
+        self.latency = latency
+        self.created_at = time.monotonic()
+        self.acked_at: float | None = None
+        self.message: FakeMessage | None = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def original_response(self):
+        return self.message
+
+
+class FakeYouTube:
+    """Minimal ``youtube.liveChatMessages().list(...).execute()`` chain.
+
+    Produces ``rate`` ``!bit`` messages per second of wall time from a pool
+    of ``authors`` and asks the poller to come back after ``interval_ms``.
+    """
+
+    def __init__(self, rate: float, authors: int, interval_ms: int = 1000):
+        self.rate = rate
+        self.authors = authors
+        self.interval_ms = interval_ms
+        self._last = time.monotonic()
+        self._carry = 0.0
+        self._n = 0
+        self.calls = 0
+        self.enabled = True
+
+    def liveChatMessages(self):
+        return self
+
+    def list(self, **_kwargs):
+        return self
+
+    def execute(self):
+        self.calls += 1
+        now = time.monotonic()
+        self._carry += (now - self._last) * self.rate if self.enabled else 0.0
+        self._last = now
+        count, self._carry = int(self._carry), self._carry - int(self._carry)
+        items = []
+        wall = time.time()
+        for i in range(count):
+            self._n += 1
+            # Spread over the time since the last poll, as if posted at a steady rate
+            posted = wall - (count - 1 - i) / self.rate if self.rate else wall
+            items.append({
+                "snippet": {"displayMessage": "!bit", "publishedAt": _iso(posted)},
+                "authorDetails": {"displayName": f"yt-{self._n % self.authors}"},
+            })
+        return {
+            "items": items,
+            "nextPageToken": str(self.calls),
+            "pollingIntervalMillis": self.interval_ms,
+        }
+
+
+def _iso(unix: float) -> str:
+    return datetime.datetime.fromtimestamp(unix, datetime.timezone.utc).isoformat()
+
+
+class FakeYouTubeStream:
+    """``liveChatMessages.streamList`` on a local HTTP port.
+
+    Every open stream gets a page with each message as soon as :meth:`say`
+    posts it. With ``available=False`` the endpoint answers 404, like an API
+    without streaming, so the fallback to polling can be exercised.
+    """
+
+    def __init__(self, available: bool = True):
+        self.available = available
+        self.connections = 0
+        self._streams: set[asyncio.Queue] = set()
+        self._n = 0
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> str:
+        """Start serving and return the base URL for ``YOUTUBE_API_URL``."""
+        app = web.Application()
+        app.router.add_get("/youtube/v3/liveChat/messages/stream", self._stream)
+        self._runner = web.AppRunner(app, access_log=None, shutdown_timeout=0.1)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def _stream(self, request):
+        if not self.available:
+            raise web.HTTPNotFound()
+        self.connections += 1
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._streams.add(queue)
+        try:
+            await response.write(b"[")
+            while True:
+                page = await queue.get()
+                if page is None:
+                    break
+                await response.write(json.dumps(page).encode("utf-8") + b",\n")
+        except ConnectionResetError:
+            pass
+        finally:
+            self._streams.discard(queue)
+        return response
+
+    def say(self, name: str, text: str):
+        self._n += 1
+        page = {
+            "nextPageToken": str(self._n),
+            "items": [{
+                "snippet": {"displayMessage": text, "publishedAt": _iso(time.time())},
+                "authorDetails": {"displayName": name},
+            }],
+        }
+        for queue in self._streams:
+            queue.put_nowait(page)
+
+    def drop(self):
+        """End every open stream, as YouTube does from time to time."""
+        for queue in self._streams:
+            queue.put_nowait(None)
+
+    async def stop(self):
+        self.drop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeTwitchIrc:
+    """Twitch chat on a local plain-text IRC port."""
+
+    def __init__(self):
+        self.logins: list[str] = []
+        self.pongs = 0
+        self._joined: dict[asyncio.StreamWriter, str] = {}
+        self._clients: set[asyncio.Task] = set()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> str:
+        """Start listening and return the URL for ``TWITCH_IRC``."""
+        self._server = await asyncio.start_server(self._client, "127.0.0.1", 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"irc://{host}:{port}"
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nick = "*"
+        self._clients.add(asyncio.current_task())
+        try:
+            while line := await reader.readline():
+                command, _, arg = line.decode("utf-8").rstrip("\r\n").partition(" ")
+                if command == "NICK":
+                    nick = arg
+                    self.logins.append(nick)
+                    writer.write(f":tmi.twitch.tv 001 {nick} :Welcome, GLHF!\r\n".encode())
+                elif command == "JOIN":
+                    writer.write(f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN {arg}\r\n".encode())
+                    self._joined[writer] = arg
+                elif command == "PONG":
+                    self.pongs += 1
+        except ConnectionResetError:
+            pass
+        finally:
+            self._joined.pop(writer, None)
+            self._clients.discard(asyncio.current_task())
+            writer.close()
+
+    def say(self, name: str, text: str):
+        login = name.lower()
+        tags = f"@display-name={name};tmi-sent-ts={int(time.time() * 1000)}"
+        for writer, channel in self._joined.items():
+            writer.write(f"{tags} :{login}!{login}@{login}.tmi.twitch.tv PRIVMSG {channel} :{text}\r\n".encode())
+
+    def ping(self):
+        for writer in self._joined:
+            writer.write(b"PING :tmi.twitch.tv\r\n")
+
+    def drop(self):
+        """Close every connection, like a Twitch server restart."""
+        for writer in list(self._joined):
+            writer.close()
+
+    async def stop(self):
+        self.drop()
+        if self._server is not None:
+            self._server.close()
+            # Handlers end once they read the end of their connection
+            if self._clients:
+                await asyncio.wait(self._clients, timeout=1)
+            await self._server.wait_closed()
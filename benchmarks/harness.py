@@ -0,0 +1,225 @@
+"""Run the real auction flow from ``bot.py`` against the local fakes."""
+import asyncio
+import importlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fakes import FakeChannel, FakeInteraction, FakeUser, Recorder
+
+ROOT = Path(__file__).resolve().parent.parent
+
+AUKCJE_KANAL_ID = 1
+OGLOSZENIA_KANAL_ID = 2
+SELLER_CHANNEL_ID = 3
+ORDER_CHANNEL_ID = 4
+DM_CHANNEL_ID = 5
+ADMIN_ID = 99
+
+
+def percentiles(values: list[float], scale: float = 1000.0) -> dict:
+    """p50/p95/p99/max of ``values`` (seconds by default, reported in ms)."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 3)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+def load_bot(workdir: Path, env: dict | None = None):
+    """Import ``bot`` with a throwaway working directory and local channel ids."""
+    (workdir / "templates").mkdir(parents=True, exist_ok=True)
+    shutil.copy(ROOT / "templates" / "auction_template.html", workdir / "templates")
+    os.environ.update({
+        "DISCORD_TOKEN": "",
+        "AUKCJE_KANAL_ID": str(AUKCJE_KANAL_ID),
+        "OGLOSZENIA_KANAL_ID": str(OGLOSZENIA_KANAL_ID),
+        "SELLER_CHANNEL_ID": str(SELLER_CHANNEL_ID),
+        "ORDER_CHANNEL_ID": str(ORDER_CHANNEL_ID),
+        "ADMIN_ID": str(ADMIN_ID),
+        "YOUTUBE_API_KEY": "",
+        "LIVE_CHAT_ID": "",
+        "LEDGER_PATH": str(workdir / "aukcje.db"),
+        "JOURNAL_DIR": str(workdir / "journal"),
+        "BID_COLUMNS_DIR": str(workdir / "oferty"),
+        **(env or {}),
+    })
+    os.chdir(workdir)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return importlib.import_module("bot")
+
+
+class Harness:
+    """Wire ``bot`` to fake channels/users and collect latency figures."""
+
+    def __init__(self, latency: float = 0.04, workdir: Path | None = None, env: dict | None = None):
+        self.workdir = workdir or Path(tempfile.mkdtemp(prefix="auction-bench-"))
+        self.bot = load_bot(self.workdir, env)
+        self.latency = latency
+        self.recorder = Recorder()
+        self.channels = {
+            cid: FakeChannel(cid, self.recorder, latency)
+            for cid in (AUKCJE_KANAL_ID, OGLOSZENIA_KANAL_ID, SELLER_CHANNEL_ID, ORDER_CHANNEL_ID)
+        }
+        self.dm = FakeChannel(DM_CHANNEL_ID, self.recorder, latency)
+        self.users: dict[int, FakeUser] = {}
+        self.end_errors: list[float] = []
+        self.close_times: list[float] = []
+        self.loop_lag: list[float] = []
+        self.ended = asyncio.Event()
+        self.results: list[dict] = []
+        self._stop = asyncio.Event()
+        self._patch()
+
+    def _patch(self):
+        b = self.bot
+        b.bot.get_channel = self.channels.get
+        b.bot.get_user = self.users.get
+
+        async def fetch_user(user_id):
+            return self.user(user_id)
+
+        b.bot.fetch_user = fetch_user
+        original = b.zakoncz_aukcje
+
+        async def zakoncz_aukcje(aukcja_id, msg):
+            aukcja = b.engine.aukcje.get(aukcja_id)
+            deadline = b.deadlines.deadline(aukcja_id)
+            if deadline is not None:
+                self.end_errors.append(time.monotonic() - deadline)
+            started = time.monotonic()
+            await original(aukcja_id, msg)
+            self.close_times.append(time.monotonic() - started)
+            if aukcja is not None:
+                self.results.append({
+                    "id": aukcja_id,
+                    "numer": aukcja.numer,
+                    "cena": round(aukcja.cena, 2),
+                    "zwyciezca": str(aukcja.zwyciezca) if aukcja.zwyciezca else None,
+                    "przedluzenie": round(aukcja.przedluzenie, 1),
+                })
+            self.ended.set()
+
+        b.zakoncz_aukcje = zakoncz_aukcje
+
+    def user(self, user_id: int, name: str | None = None) -> FakeUser:
+        if user_id not in self.users:
+            self.users[user_id] = FakeUser(user_id, name or f"user-{user_id}", self.dm)
+        return self.users[user_id]
+
+    def load_lots(self, lots: list[tuple], time_scale: float = 1.0):
+        """Queue ``(nazwa, numer, cena, przebicie, czas)`` lots with cached assets.
+
+        Like ``/zaladuj`` the lots are written to the session trace; with a
+        ``time_scale`` the auctions run that many times faster.
+        """
+        b = self.bot
+        for nazwa, numer, cena, przebicie, czas in lots:
+            b.asset_cache.put(nazwa, numer, ("https://example.invalid/card.png", None))
+            aukcja = b.Aukcja(nazwa, numer, "", cena, przebicie, czas)
+            if time_scale != 1.0:
+                aukcja.czas = float(czas) / time_scale
+            b.aukcje_kolejka.append(aukcja)
+        b.trace.record(b.slad.LOAD, replace=False, lots=[[n, m, "", c, p, t] for n, m, c, p, t in lots])
+
+    async def start(self):
+        """Start the engine and recover (empty) journal state; load lots afterwards."""
+        self.bot.engine.start()
+        self.bot.refresh_countdowns.start()
+        await self.bot.przywroc_stan()
+        asyncio.create_task(self._sample_loop_lag())
+
+    async def stop(self):
+        self._stop.set()
+        await self.bot.fanout.close()
+        await self.bot.snapshots.flush()
+        self.bot.trace.flush()
+
+    async def start_worker(self) -> asyncio.subprocess.Process:
+        """Run ``worker.py`` on ``workdir/worker.sock`` (pass that socket in ``env``)."""
+        sock = self.workdir / "worker.sock"
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "worker",
+            "--socket", str(sock),
+            "--ledger", str(self.workdir / "aukcje.db"),
+            "--output", str(self.workdir / "templates"),
+            cwd=ROOT,
+        )
+        while not sock.exists():
+            await asyncio.sleep(0.05)
+        return process
+
+    async def _sample_loop_lag(self, interval: float = 0.01):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - started - interval)
+
+    async def click(self, user_id: int) -> FakeInteraction | None:
+        """Press the bid button of a random running auction as ``user_id``."""
+        msgs = [m for m in self.bot.auction_msgs.values() if m.view is not None]
+        if not msgs:
+            return None
+        msg = random.choice(msgs)
+        interaction = FakeInteraction(self.user(user_id), msg.channel, self.recorder, self.latency)
+        await msg.view.licytuj.callback(interaction)
+        return interaction
+
+    async def run_next_auction(self):
+        """Start the next queued lot and wait until it has been closed."""
+        self.ended.clear()
+        await self.bot.start_next_auction()
+        await self.ended.wait()
+
+    async def run_parallel(self, k: int):
+        """Keep ``k`` auctions running until the queue is empty."""
+        b = self.bot
+        b.rownolegle = k
+        b.trace.record(b.slad.PARALLEL, n=k)
+        await b.uzupelnij_aukcje()
+        while b.engine.aukcje or b.aukcje_kolejka:
+            self.ended.clear()
+            await self.ended.wait()
+
+    def edit_rates(self, duration: float) -> dict:
+        """Edits per second for every message, grouped by channel."""
+        names = {
+            AUKCJE_KANAL_ID: "auction",
+            OGLOSZENIA_KANAL_ID: "announcement",
+            SELLER_CHANNEL_ID: "panel",
+        }
+        report = {}
+        for cid, name in names.items():
+            rates = []
+            peak = 0
+            for mid in self.channels[cid].messages:
+                stamps = self.recorder.edits.get(mid, [])
+                if not stamps:
+                    continue
+                rates.append(len(stamps) / duration)
+                start = 0
+                for end, stamp in enumerate(stamps):
+                    while stamp - stamps[start] > 1.0:
+                        start += 1
+                    peak = max(peak, end - start + 1)
+            report[name] = {
+                "messages": len(rates),
+                "edits": sum(len(self.recorder.edits.get(m, [])) for m in self.channels[cid].messages),
+                "mean_per_message_per_s": round(sum(rates) / len(rates), 3) if rates else 0.0,
+                "peak_per_message_1s": peak,
+            }
+        return report
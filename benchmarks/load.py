@@ -0,0 +1,176 @@
+"""Synthetic load test of the auction flow, no network needed.
+
+    python -m benchmarks.load --bidders 200 --click-rate 0.5 --chat-rate 20 --lots 3
+
+N Discord users press the bid button (each at ``--click-rate`` presses per
+second on average) while a fake chat delivers ``--chat-rate`` ``!bit``
+messages per second: polled YouTube (``--chat-source poll``), or the YouTube
+stream or Twitch IRC served on a local socket (``youtube``, ``twitch``).
+Results are written as JSON so runs can be compared.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fakes import FakeTwitchIrc, FakeYouTube, FakeYouTubeStream
+from benchmarks.harness import ROOT, Harness, percentiles
+
+
+async def bidder(harness: Harness, user_id: int, rate: float, stop: asyncio.Event, acks: list | None = None):
+    while not stop.is_set():
+        await asyncio.sleep(random.expovariate(rate))
+        interaction = await harness.click(user_id)
+        if acks is not None and interaction is not None and interaction.acked_at is not None:
+            acks.append(interaction.acked_at - interaction.created_at)
+
+
+async def chatter(chat, rate: float, authors: int, stop: asyncio.Event):
+    n = 0
+    while not stop.is_set():
+        await asyncio.sleep(random.expovariate(rate))
+        n += 1
+        chat.say(f"chat-{n % authors}", "!bit")
+
+
+async def start_chat(b, args, stop: asyncio.Event):
+    """Connect the chat source to its stand-in; returns the stand-in and the source."""
+    if args.chat_source == "poll":
+        youtube = FakeYouTube(args.chat_rate, args.chat_authors, args.chat_interval_ms)
+        poller = b.YouTubeChatPoller(youtube, "bench", b.push_chat_bids, lambda: b.engine.aktualna is not None)
+        poller.start()
+        return youtube, None
+    if args.chat_source == "youtube":
+        chat = FakeYouTubeStream()
+        source = b.YouTubeStreamSource("bench", "bench", b.push_chat_bids, await chat.start())
+    else:
+        chat = FakeTwitchIrc()
+        source = b.TwitchChatSource("bench", b.push_chat_bids, url=await chat.start())
+    source.start()
+    while not source.connected:
+        await asyncio.sleep(0.01)
+    asyncio.create_task(chatter(chat, args.chat_rate, args.chat_authors, stop))
+    return chat, source
+
+
+async def run(args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="auction-bench-"))
+    env = {"SOFT_CLOSE_WINDOW": str(args.soft_close), "TRACE_DIR": str(Path(args.trace).resolve()) if args.trace else ""}
+    if args.worker:
+        sock = str(workdir / "worker.sock")
+        env.update({"LEDGER_WORKER": sock, "SNAPSHOT_WORKER": sock})
+    harness = Harness(latency=args.latency_ms / 1000, workdir=workdir, env=env)
+    b = harness.bot
+    worker = await harness.start_worker() if args.worker else None
+    await harness.start()
+    harness.load_lots([
+        (f"Karta {i}", f"bench-{i}", "10", "1", args.duration) for i in range(args.lots)
+    ])
+
+    stop = asyncio.Event()
+    honest_acks = []
+    tasks = [
+        asyncio.create_task(bidder(harness, 1000 + i, args.click_rate, stop, honest_acks))
+        for i in range(args.bidders)
+    ] + [
+        asyncio.create_task(bidder(harness, 900_000 + i, args.spam_rate, stop))
+        for i in range(args.spammers)
+    ]
+    chat_latency = []
+    applied = b.chat_bid_applied
+
+    def chat_bid_applied(bid, future):
+        chat_latency.append(time.time() - bid.sent)
+        applied(bid, future)
+
+    b.chat_bid_applied = chat_bid_applied
+    chat = source = None
+    if args.chat_rate:
+        chat, source = await start_chat(b, args, stop)
+
+    started = time.monotonic()
+    if args.parallel > 1:
+        await harness.run_parallel(args.parallel)
+    else:
+        for _ in range(args.lots):
+            await harness.run_next_auction()
+    duration = time.monotonic() - started
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    if source is not None:
+        await source.stop()
+        await chat.stop()
+    await harness.stop()
+    if worker is not None:
+        worker.terminate()
+        await worker.wait()
+
+    return {
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "config": vars(args),
+        "duration_s": round(duration, 3),
+        "bids": {
+            "applied": b.engine.seq,
+            "discord_acks": len(harness.recorder.acks),
+            "chat_polls": chat.calls if isinstance(chat, FakeYouTube) else 0,
+            "chat": source.bids if source is not None else None,
+            "applied_per_s": round(b.engine.seq / duration, 1),
+        },
+        "lots_per_hour": round(len(harness.results) / duration * 3600, 1),
+        "ack_latency_ms": percentiles(harness.recorder.acks),
+        "honest_ack_latency_ms": percentiles(honest_acks),
+        "chat_latency_ms": percentiles(chat_latency),
+        "throttled": {f"{limit}/{policy}": n for (limit, policy), n in b.throttle.shed.items()},
+        "edits": harness.edit_rates(duration),
+        "renderer": b.renderer.stats(),
+        "loop_lag_ms": percentiles(harness.loop_lag),
+        "auction_end_error_ms": percentiles([abs(e) for e in harness.end_errors]),
+        "auction_close_ms": percentiles(harness.close_times),
+        "deferred_edits": {"sent": b.fanout.sent, "failed": b.fanout.failed, "queued": len(b.fanout)},
+        "results": harness.results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bidders", type=int, default=100)
+    parser.add_argument("--click-rate", type=float, default=0.5, help="presses per bidder per second")
+    parser.add_argument("--chat-rate", type=float, default=10.0, help="!bit messages per second")
+    parser.add_argument("--chat-source", choices=("poll", "youtube", "twitch"), default="poll")
+    parser.add_argument("--chat-authors", type=int, default=50)
+    parser.add_argument("--chat-interval-ms", type=int, default=1000)
+    parser.add_argument("--lots", type=int, default=2)
+    parser.add_argument("--duration", type=int, default=10, help="seconds per auction")
+    parser.add_argument("--parallel", type=int, default=1, help="auctions running at once")
+    parser.add_argument("--worker", action="store_true", help="ledger and snapshots in worker.py")
+    parser.add_argument("--soft-close", type=float, default=0.0, help="soft-close window in seconds")
+    parser.add_argument("--spammers", type=int, default=0, help="users pressing the button in a loop")
+    parser.add_argument("--spam-rate", type=float, default=20.0, help="presses per spammer per second")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="simulated Discord round trip")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace", help="record a session trace here for benchmarks.replay")
+    parser.add_argument("--output", type=Path, help="JSON file (default: benchmarks/results/)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    output = args.output or ROOT / "benchmarks" / "results" / (
+        f"load-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )
+    output = output.resolve()
+    report = asyncio.run(run(args))
+    report["config"]["output"] = str(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps({k: report[k] for k in ("bids", "lots_per_hour", "ack_latency_ms", "honest_ack_latency_ms", "chat_latency_ms",
+                                             "throttled", "loop_lag_ms", "auction_end_error_ms",
+                                             "auction_close_ms")}, indent=2))
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Memory used by queued lots and bid history, compared with the old layout.
+
+    python -m benchmarks.memory --lots 10000 --bids 1000000
+
+Builds ``--lots`` auctions with ``--bids`` bids spread evenly over them, from
+``--users`` distinct bidders (half Discord users, half YouTube names), once
+with the current ``Aukcja`` and once with a copy of the previous dict-backed
+class that kept ``historia`` as a list of ``(str, float, iso str)`` tuples.
+"""
+import argparse
+import datetime
+import gc
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.fakes import FakeChannel, FakeUser, Recorder
+from benchmarks.harness import ROOT, load_bot
+
+
+class LegacyAukcja:
+    """``Aukcja`` as it was before the compact layout."""
+
+    def __init__(self, nazwa, numer, opis, cena_start, przebicie, czas):
+        self.nazwa = nazwa
+        self.numer = numer
+        self.opis = opis
+        self.cena = float(str(cena_start).replace(",", "."))
+        self.przebicie = float(str(przebicie).replace(",", "."))
+        self.czas = int(czas)
+        self.historia = []
+        self.zwyciezca = None
+        self.start_time = None
+        self.order_number = None
+        self.payment_method = None
+        self.obraz_url = None
+        self.logo_url = None
+        self.ledger_id = None
+
+    def licytuj(self, user):
+        self.cena += self.przebicie
+        self.historia.append((str(user), self.cena, datetime.datetime.utcnow().isoformat()))
+        self.zwyciezca = user
+
+
+def measure(cls, lots: int, bids: int, bidders: list) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    aukcje = [cls(f"Karta {i}", str(i), "opis", "10,00", "1", 60) for i in range(lots)]
+    after_lots = tracemalloc.get_traced_memory()[0]
+    per_lot = bids // lots
+    n = 0
+    for aukcja in aukcje:
+        for _ in range(per_lot):
+            aukcja.licytuj(bidders[n % len(bidders)])
+            n += 1
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "lots_mb": round(after_lots / 2**20, 1),
+        "total_mb": round(current / 2**20, 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "bytes_per_bid": round((current - after_lots) / max(per_lot * lots, 1), 1),
+        "build_s": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lots", type=int, default=10_000)
+    parser.add_argument("--bids", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="JSON file (default: benchmarks/results/)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    output = (args.output or ROOT / "benchmarks" / "results" / (
+        f"memory-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )).resolve()
+
+    b = load_bot(Path(tempfile.mkdtemp(prefix="auction-bench-")))
+    dm = FakeChannel(0, Recorder(), 0.0)
+    bidders = [
+        FakeUser(1000 + i, f"user-{i}", dm) if i % 2 else f"yt-{i}" for i in range(args.users)
+    ]
+    random.shuffle(bidders)
+
+    report = {
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "legacy": measure(LegacyAukcja, args.lots, args.bids, bidders),
+        "compact": measure(b.Aukcja, args.lots, args.bids, bidders),
+        "interned_users": len(b.uczestnicy),
+    }
+
+    pending_ok = b.TTLMap(b.PENDING_OK_TTL, b.BOOKKEEPING_MAX)
+    for message_id in range(10 * b.BOOKKEEPING_MAX):
+        pending_ok[message_id] = message_id
+    report["bookkeeping"] = {
+        "inserted": 10 * b.BOOKKEEPING_MAX,
+        "kept": len(pending_ok),
+        "evicted": pending_ok.evicted,
+    }
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report, indent=2))
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
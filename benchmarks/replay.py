@@ -0,0 +1,283 @@
+"""Replay a recorded session trace (``TRACE_DIR``) against the local fakes.
+
+    python -m benchmarks.replay trace/trace-2024-05-01_20_00.jsonl --speed 10
+
+Lots are loaded, auctions started and bids pressed or sent through the chat
+at the recorded times, divided by ``--speed`` (auction lengths, soft close,
+the render interval and the simulated Discord latency are scaled to match).
+Bid limits and auction closes follow the ``limit`` and ``close`` records, so
+bids reach the engine in the recorded order at any speed. Final prices and
+winners are compared with the recording; latency and edit figures are written
+as JSON next to the load benchmark results so two versions can be diffed.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+import session_trace as slad
+from chat_sources import ChatBid, ChatUser
+from benchmarks.fakes import FakeInteraction
+from benchmarks.harness import ROOT, Harness, percentiles
+from throttle import Limit
+
+# Seconds an auction may run past its recorded end before the replay closes it without a close record
+BACKSTOP = 1.0
+
+
+def replay_env(config: dict, speed: float) -> dict:
+    """Settings of the recorded session with every time in them scaled by ``speed``."""
+    window, extend, limit = config.get("soft_close", [0, 0, 0])
+    env = {
+        "SOFT_CLOSE_WINDOW": str(window / speed),
+        "SOFT_CLOSE_EXTEND": str(extend / speed),
+        "SOFT_CLOSE_MAX": str(limit / speed),
+        "RENDER_MIN_INTERVAL": str(config.get("render_min_interval", 1.0) / speed),
+        "AUKCJE_ROWNOLEGLE": str(config.get("rownolegle", 1)),
+        "TRACE_DIR": "",
+    }
+    for name, (rate, burst, policy) in config.get("bid_limits", {}).items():
+        env[f"BID_LIMIT_{name.upper()}"] = f"{rate * speed},{burst},{policy}" if rate else ""
+    return env
+
+
+class RecordedThrottle:
+    """Bid limits that hold, merge, refuse and release bids as the recorded session did.
+
+    Token buckets follow the clock, and the loop reaches each bid a few
+    milliseconds earlier or later than it did live; at ``--speed`` above 1
+    that is enough to let a different bid through first. With the ``limit``
+    events of the trace the replay applies bids in the recorded order instead.
+    """
+
+    def __init__(self):
+        self.decisions: dict[tuple, deque[Limit]] = {}
+        self.released: set[tuple] = set()
+        self.shed: dict[tuple[str, str], int] = {}
+        self.finished = False
+        self._holding = Limit(1.0)
+
+    def expect(self, rec: dict):
+        """The next bid of ``rec["u"]`` ends up as the ``limit`` record says."""
+        policy = "reject" if rec["what"] == "rejected" else rec["policy"]
+        self.decisions.setdefault((rec["src"], rec["u"]), deque()).append(Limit(1.0, 1.0, policy))
+
+    def admit(self, source: str, key, count: bool = True) -> Limit | None:
+        if not count:
+            return None if self.finished or (source, key) in self.released else self._holding
+        decisions = self.decisions.get((source, key))
+        if not decisions:
+            return None
+        limit = decisions.popleft()
+        self.shed[source, limit.policy] = self.shed.get((source, limit.policy), 0) + 1
+        return limit
+
+    def wait(self, source: str, key) -> float:
+        return 0.1   # let go by the replay, see Replay._apply
+
+
+class Replay:
+    def __init__(self, records: list[dict], speed: float, latency: float):
+        self.records = records
+        self.speed = speed
+        self.config = records[0] if records and records[0]["e"] == slad.CONFIG else {}
+        workdir = Path(tempfile.mkdtemp(prefix="auction-replay-"))
+        # The Discord round trip is part of the recorded timing too, so it is scaled like the rest
+        self.harness = Harness(latency=latency / speed, workdir=workdir, env=replay_env(self.config, speed))
+        self.started: list[int] = []    # replay ledger ids in start order
+        self.recorded: list[int] = []   # recorded ledger ids in start order
+        self.skipped = 0
+        self.bid_acks: list[float] = []
+        self.started_at = 0.0
+        self._tasks: list[asyncio.Task] = []
+        # Traces that say when each auction closed and what the bid limits did are
+        # replayed in the recorded order; older ones only at the recorded times
+        self.ordered = any(r["e"] == slad.CLOSE for r in records)
+        self.throttle = None
+        if self.ordered:
+            self.throttle = self.harness.bot.engine.throttle = RecordedThrottle()
+
+    def _auction(self, recorded_id: int | None) -> int | None:
+        try:
+            return self.started[self.recorded.index(recorded_id)]
+        except (ValueError, IndexError):
+            return None
+
+    async def _start(self, rec: dict):
+        b = self.harness.bot
+        self.recorded.append(rec["id"])
+        # Lots started by the bot itself (several at once) are already running
+        while len(self.started) < len(self.recorded):
+            if not b.aukcje_kolejka:
+                return
+            if len(b.engine.aukcje) < b.rownolegle:
+                await b.start_next_auction()
+            else:
+                self.harness.ended.clear()
+                await self.harness.ended.wait()
+
+    async def _press(self, rec: dict):
+        b = self.harness.bot
+        aukcja_id = self._auction(rec.get("id"))
+        if aukcja_id is None:
+            self.skipped += 1
+            return
+        msg = b.auction_msgs.get(aukcja_id)
+        view = msg.view if msg is not None and msg.view is not None else b.LicytacjaView(aukcja_id)
+        user = self.harness.user(rec["u"], rec.get("n"))
+        channel = self.harness.channels[1]
+        interaction = FakeInteraction(user, channel, self.harness.recorder, self.harness.latency)
+        await view.licytuj.callback(interaction)
+        if interaction.acked_at is not None:
+            self.bid_acks.append(interaction.acked_at - interaction.created_at)
+
+    async def _apply(self, rec: dict):
+        b = self.harness.bot
+        event = rec["e"]
+        if event == slad.LOAD:
+            if rec.get("replace"):
+                b.aukcje_kolejka.clear()
+            self.harness.load_lots([(n, m, c, p, t) for n, m, _opis, c, p, t in rec["lots"]], self.speed)
+        elif event == slad.PARALLEL:
+            b.rownolegle = rec["n"]
+            await b.uzupelnij_aukcje()
+        elif event == slad.START:
+            await self._start(rec)
+        elif event == slad.OPEN:
+            aukcja_id = self._auction(rec["id"])
+            if aukcja_id is not None and b.engine.otwarta(aukcja_id):
+                # Starting a lot takes a few real milliseconds that --speed does not shrink;
+                # the clock runs from the recorded moment so the lot ends where it did.
+                # With a close record to follow, the deadline only backs it up
+                koniec = self.started_at + (rec["t"] + rec["czas"]) / self.speed
+                b.deadlines.schedule(aukcja_id, koniec + (BACKSTOP if self.ordered else 0.0))
+        elif event == slad.CLOSE:
+            aukcja_id = self._auction(rec["id"])
+            if aukcja_id is not None and b.engine.otwarta(aukcja_id):
+                # Bids recorded before this go in, later ones are too late, however the loop timed them
+                b.deadlines.cancel(aukcja_id)
+                b.termin_minal(aukcja_id)
+                await asyncio.sleep(0)
+        elif event == slad.BID and rec["src"] != "discord":
+            b.push_chat_bids([ChatBid(ChatUser(rec["src"], name)) for name in rec["u"]])
+        elif event == slad.BID:
+            self._tasks.append(asyncio.create_task(self._press(rec)))
+            # The press reaches the engine before the next record is applied
+            await asyncio.sleep(0)
+        elif event == slad.LIMIT and rec["what"] == "released" and self.ordered:
+            key = (rec["src"], rec["u"])
+            self.throttle.released.add(key)
+            b.engine.release_held()
+            self.throttle.released.discard(key)
+
+    async def run(self) -> dict:
+        b = self.harness.bot
+        original = b.engine.rozpocznij
+
+        def rozpocznij(aukcja):
+            self.started.append(aukcja.ledger_id)
+            original(aukcja)
+
+        b.engine.rozpocznij = rozpocznij
+        await self.harness.start()
+        ends = [r for r in self.records if r["e"] == slad.END]
+
+        records = self.records[1:] if self.config else self.records
+        started = self.started_at = time.monotonic()
+        for i, rec in enumerate(records):
+            if rec["e"] == slad.END:
+                continue
+            if rec["e"] == slad.BID and self.ordered:
+                # What the limits did with this bid is recorded right after it
+                for after in records[i + 1:]:
+                    if after["e"] != slad.LIMIT or after["what"] == "released":
+                        break
+                    self.throttle.expect(after)
+            wait = started + rec["t"] / self.speed - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._apply(rec)
+        # Auctions still running end on their own
+        while len(self.harness.results) < len(ends) and b.engine.aukcje:
+            self.harness.ended.clear()
+            await self.harness.ended.wait()
+        if self.ordered:
+            # Still held when the recording stopped; let them go so every press gets its answer
+            self.throttle.finished = True
+            b.engine.release_held()
+        await asyncio.gather(*self._tasks)
+        duration = time.monotonic() - started
+        await self.harness.stop()
+        return self.report(ends, duration)
+
+    def report(self, ends: list[dict], duration: float) -> dict:
+        b = self.harness.bot
+        throttle = self.throttle or b.throttle
+        replayed = {r["id"]: r for r in self.harness.results}
+        mismatches = []
+        for end in ends:
+            got = replayed.get(self._auction(end["id"]))
+            want = {"cena": round(end["cena"], 2), "zwyciezca": end["zwyciezca"]}
+            have = {"cena": got["cena"], "zwyciezca": got["zwyciezca"]} if got else None
+            if have != want:
+                mismatches.append({"id": end["id"], "recorded": want, "replayed": have})
+        return {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "speed": self.speed,
+            "duration_s": round(duration, 3),
+            "auctions": {"recorded": len(ends), "replayed": len(self.harness.results), "mismatched": len(mismatches)},
+            "mismatches": mismatches,
+            "bids": {
+                "recorded": sum(
+                    1 if r["src"] == "discord" else len(r["u"]) for r in self.records if r["e"] == slad.BID
+                ),
+                "applied": b.engine.seq,
+                "skipped": self.skipped,
+            },
+            "ack_latency_ms": percentiles(self.bid_acks),
+            "edits": self.harness.edit_rates(duration),
+            "renderer": b.renderer.stats(),
+            "loop_lag_ms": percentiles(self.harness.loop_lag),
+            "auction_end_error_ms": percentiles([abs(e) for e in self.harness.end_errors]),
+            "auction_close_ms": percentiles(self.harness.close_times),
+            "throttled": {f"{limit}/{policy}": n for (limit, policy), n in throttle.shed.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", type=Path)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 10 = ten times faster")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="simulated Discord round trip")
+    parser.add_argument("--output", type=Path, help="JSON file (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    # The harness changes into a temporary directory
+    trace = args.trace.resolve()
+    records = slad.read(trace)
+    if records and records[0].get("recovered"):
+        print("Warning: the recorded session resumed from a journal; lots from before are missing")
+    output = args.output or ROOT / "benchmarks" / "results" / (
+        f"replay-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )
+    output = output.resolve()
+    report = asyncio.run(Replay(records, args.speed, args.latency_ms / 1000).run())
+    report["trace"] = str(trace)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps({k: report[k] for k in ("auctions", "bids", "ack_latency_ms", "auction_end_error_ms",
+                                             "auction_close_ms")}, indent=2))
+    for m in report["mismatches"][:10]:
+        print(f"Auction {m['id']}: recorded {m['recorded']}, replayed {m['replayed']}")
+    print(f"Saved to {output}")
+    if report["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import datetime
+import sys
+import time
+from array import array
+
+# Offset from time.monotonic() to the Unix epoch, fixed for the process lifetime
+_EPOCH = time.time() - time.monotonic()
+
+
+class UserRef:
+    """Interned bidder: the same object for every bid of one user."""
+
+    __slots__ = ("source", "id", "name", "index")
+
+    def __init__(self, source: str, id: int | None, name: str, index: int):
+        self.source = source
+        self.id = id
+        self.name = name
+        self.index = index
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"UserRef({self.source!r}, {self.id!r}, {self.name!r})"
+
+
+class UserTable:
+    """Maps Discord users and chat authors to one :class:`UserRef` each."""
+
+    def __init__(self):
+        self.refs: list[UserRef] = []
+        self._index: dict[tuple, UserRef] = {}
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __getitem__(self, index: int) -> UserRef:
+        return self.refs[index]
+
+    def intern(self, user) -> UserRef:
+        if isinstance(user, UserRef):
+            return user
+        user_id = getattr(user, "id", None)
+        if user_id is not None:
+            key = ("discord", user_id)
+        else:
+            # A ChatUser carries its platform; older callers pass bare YouTube names
+            key = (getattr(user, "source", "youtube"), str(user))
+        ref = self._index.get(key)
+        name = str(user)
+        if ref is None:
+            ref = UserRef(key[0], user_id, sys.intern(name), len(self.refs))
+            self.refs.append(ref)
+            self._index[key] = ref
+        elif ref.name != name:
+            ref.name = sys.intern(name)
+        return ref
+
+    def ref(self, source: str, user_id: int | None, name: str) -> UserRef:
+        """Intern a stored ``[source, id, name]`` reference."""
+        key = ("discord", user_id) if user_id is not None else (source, name)
+        ref = self._index.get(key)
+        if ref is None:
+            ref = UserRef(source, user_id, sys.intern(name), len(self.refs))
+            self.refs.append(ref)
+            self._index[key] = ref
+        return ref
+
+
+users = UserTable()
+
+
+class BidHistory:
+    """Bids of one auction as parallel typed columns instead of a list of tuples.
+
+    Indexing and slicing still return ``(name, cena, iso time)`` tuples, so
+    readers of the old list format keep working. The columns are allocated on
+    the first bid, so lots waiting in the queue carry no arrays.
+    """
+
+    __slots__ = ("users", "ceny", "czasy", "table")
+
+    def __init__(self, table: UserTable = users):
+        self.table = table
+        self.users = self.ceny = self.czasy = ()   # czasy: time.monotonic()
+
+    def __len__(self):
+        return len(self.users)
+
+    def append(self, user: UserRef, cena: float, czas: float | None = None):
+        if not self.users:
+            self.users, self.ceny, self.czasy = array("I"), array("d"), array("d")
+        self.users.append(user.index)
+        self.ceny.append(cena)
+        self.czasy.append(time.monotonic() if czas is None else czas)
+
+    def clear(self):
+        self.users = self.ceny = self.czasy = ()
+
+    def user(self, i: int) -> UserRef:
+        return self.table[self.users[i]]
+
+    def iso(self, i: int) -> str:
+        return datetime.datetime.utcfromtimestamp(self.czasy[i] + _EPOCH).isoformat()
+
+    def _row(self, i: int) -> tuple:
+        return (self.user(i).name, self.ceny[i], self.iso(i))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self._row(index)
+
+    def __iter__(self):
+        return (self._row(i) for i in range(len(self)))
+
+    def to_rows(self) -> list:
+        """``[[source, id, name], cena, iso time]`` rows for the journal."""
+        rows = []
+        for i in range(len(self)):
+            ref = self.user(i)
+            rows.append([[ref.source, ref.id, ref.name], self.ceny[i], self.iso(i)])
+        return rows
+
+    @classmethod
+    def from_rows(cls, rows: list, table: UserTable = users) -> "BidHistory":
+        historia = cls(table)
+        for who, cena, ts in rows:
+            # Older journals stored just the display name
+            ref = table.ref(*who) if isinstance(who, list) else table.ref("youtube", None, who)
+            wall = datetime.datetime.fromisoformat(ts).replace(tzinfo=datetime.timezone.utc)
+            historia.append(ref, cena, wall.timestamp() - _EPOCH)
+        return historia
@@ -1,23 +1,59 @@
+from startup import StartupTimer
+
+# Created before the other imports so the import phase is measured too
+startup = StartupTimer()
+
 import os
 from pathlib import Path
 import discord
 from discord.ext import commands, tasks
-import csv
 import asyncio
 import datetime
-import json
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
-import requests
-from string import Template
+import itertools
 import logging
-
+import math
+import re
+import time
+from functools import partial
+import analytics
+from assets import AssetCache, AssetFetcher
+from bid_history import BidHistory, UserRef, users as uczestnicy
+from catalog import CatalogReader
+from chat_sources import ChatBid, ChatSource, TwitchChatSource, YouTubeStreamSource
+from deadlines import DeadlineScheduler, SoftClose
+from ipc import RemoteLedger, RemoteSnapshotWriter, WorkerClient
+from engine import AuctionEngine, BidsApplied
+from throttle import BidThrottle, Limit
+from images import ImageCache
+from fanout import FanOut, Priority, route_of
+import journal as dziennik
+import logs
+import session_trace as slad
+from journal import Journal
+from ledger import Ledger
+from lot_queue import LotQueue
+import metrics
+from overlay import OverlayServer
+from render import RenderScheduler
+from snapshot import SnapshotWriter
+from ttl_map import TTLMap
+from youtube_chat import YouTubeChatPoller, build_client
+
+startup.mark("import")
 load_dotenv()
-logging.basicConfig(level=logging.INFO)
+# Log lines go through a queue to a background thread: LOG_FORMAT is text or json (one object
+# per line), LOG_FILE also writes them to a file; bid and message edit lines are limited to
+# LOG_RATE_LIMIT ("per second,burst" for each kind of line, empty = no limit)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_RATE_LIMIT = Limit.parse(os.getenv("LOG_RATE_LIMIT", "2,10"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+log_listener = logs.setup(LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_RATE_LIMIT, LOG_QUEUE_SIZE)
+bid_log = logging.getLogger(logs.BIDS)
 
 TOKEN = os.getenv("DISCORD_TOKEN")
-if not TOKEN:
-    raise RuntimeError("DISCORD_TOKEN is not set")
 GUILD_ID = int(os.getenv("DISCORD_GUILD_ID", "0"))
 AUKCJE_KANAL_ID = int(os.getenv("AUKCJE_KANAL_ID", "0"))
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
@@ -27,169 +63,317 @@ OGLOSZENIA_KANAL_ID = int(os.getenv("OGLOSZENIA_KANAL_ID", "0"))
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 LIVE_CHAT_ID = os.getenv("LIVE_CHAT_ID")
 POKEMONTCG_API_TOKEN = os.getenv("POKEMONTCG_API_TOKEN")
+# Minimum number of seconds between two edits of the same message
+RENDER_MIN_INTERVAL = float(os.getenv("RENDER_MIN_INTERVAL", "1.0"))
+# Card asset cache: lifetime of found / not found entries (seconds) and size
+ASSET_CACHE_TTL = float(os.getenv("ASSET_CACHE_TTL", str(30 * 24 * 3600)))
+ASSET_NEGATIVE_TTL = float(os.getenv("ASSET_NEGATIVE_TTL", "3600"))
+ASSET_CACHE_SIZE = int(os.getenv("ASSET_CACHE_SIZE", "5000"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+# Daily YouTube Data API quota the chat poller may spend
+YOUTUBE_QUOTA_LIMIT = int(os.getenv("YOUTUBE_QUOTA_LIMIT", "10000"))
+# YouTube chat is streamed where the API allows it and polled otherwise; 0 always polls
+YOUTUBE_CHAT_STREAM = os.getenv("YOUTUBE_CHAT_STREAM", "1") != "0"
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://youtube.googleapis.com")
+# Twitch chat bids: channel to read, optional login (anonymous read-only without it) and server
+TWITCH_CHANNEL = os.getenv("TWITCH_CHANNEL")
+TWITCH_NICK = os.getenv("TWITCH_NICK")
+TWITCH_TOKEN = os.getenv("TWITCH_TOKEN")
+TWITCH_IRC = os.getenv("TWITCH_IRC", "ircs://irc.chat.twitch.tv:6697")
+# SQLite database with auctions, bids and orders; SESSION_ID groups one stream
+LEDGER_PATH = Path(os.getenv("LEDGER_PATH", "orders/aukcje.db"))
+SESSION_ID = os.getenv("SESSION_ID") or datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+# Bid history copied from the ledger into column files for !analityka; absolute, because
+# a ledger worker (LEDGER_WORKER) writes them from its own working directory
+BID_COLUMNS_DIR = Path(os.getenv("BID_COLUMNS_DIR", "orders/oferty")).resolve()
+# Write-ahead journal used to resume a stream after a restart
+JOURNAL_DIR = Path(os.getenv("JOURNAL_DIR", "journal"))
+JOURNAL_CHECKPOINT_EVERY = int(os.getenv("JOURNAL_CHECKPOINT_EVERY", "5000"))
+# Local Prometheus endpoint (http://METRICS_HOST:METRICS_PORT/metrics), 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Lots parsed per batch when loading a catalog; row errors reported back to the admin
+CATALOG_BATCH_SIZE = int(os.getenv("CATALOG_BATCH_SIZE", "500"))
+CATALOG_ERRORS_SHOWN = 10
+# Multi-lot mode: how many auctions run at once and the channels they are spread over
+AUKCJE_ROWNOLEGLE = int(os.getenv("AUKCJE_ROWNOLEGLE", "1"))
+AUKCJE_KANALY = [
+    int(c) for c in os.getenv("AUKCJE_KANALY", "").split(",") if c.strip()
+] or [AUKCJE_KANAL_ID]
+# Unix sockets of worker.py processes; unset keeps ledger and snapshots on local threads
+LEDGER_WORKER = os.getenv("LEDGER_WORKER")
+SNAPSHOT_WORKER = os.getenv("SNAPSHOT_WORKER")
+# Lifetime (seconds) and size of per-user bookkeeping; interaction tokens expire after 15 min
+BID_MESSAGE_TTL = float(os.getenv("BID_MESSAGE_TTL", "840"))
+PENDING_ORDER_TTL = float(os.getenv("PENDING_ORDER_TTL", str(7 * 24 * 3600)))
+PENDING_OK_TTL = float(os.getenv("PENDING_OK_TTL", str(3 * 24 * 3600)))
+BOOKKEEPING_MAX = int(os.getenv("BOOKKEEPING_MAX", "10000"))
+# Discord calls sent at once when an auction ends, and workers for cosmetic edits
+FANOUT_LIMIT = int(os.getenv("FANOUT_LIMIT", "8"))
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "4"))
+# Queued edits sent to one channel per FANOUT_ROUTE_WINDOW seconds
+FANOUT_ROUTE_LIMIT = int(os.getenv("FANOUT_ROUTE_LIMIT", "5"))
+FANOUT_ROUTE_WINDOW = float(os.getenv("FANOUT_ROUTE_WINDOW", "5"))
+# Soft close: a bid in the last SOFT_CLOSE_WINDOW seconds leaves SOFT_CLOSE_EXTEND seconds
+# on the clock, at most SOFT_CLOSE_MAX seconds in total per lot; 0 disables it
+SOFT_CLOSE_WINDOW = float(os.getenv("SOFT_CLOSE_WINDOW", "0"))
+SOFT_CLOSE_EXTEND = float(os.getenv("SOFT_CLOSE_EXTEND", str(SOFT_CLOSE_WINDOW)))
+SOFT_CLOSE_MAX = float(os.getenv("SOFT_CLOSE_MAX", "120"))
+# Bid rate limits as "bids per second,burst,policy" (merge, reject or queue), empty or 0 = none
+BID_LIMIT_DISCORD = Limit.parse(os.getenv("BID_LIMIT_DISCORD", "2,4,merge"))
+BID_LIMIT_YOUTUBE = Limit.parse(os.getenv("BID_LIMIT_YOUTUBE", "1,3,merge"))
+BID_LIMIT_TWITCH = Limit.parse(os.getenv("BID_LIMIT_TWITCH", "1,3,merge"))
+BID_LIMIT_TOTAL = Limit.parse(os.getenv("BID_LIMIT_TOTAL", ""))
+# Directory for a timestamped trace of each session (benchmarks/replay.py), empty disables it
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+# Overlay server with live updates (http://OVERLAY_HOST:OVERLAY_PORT/), 0 disables it;
+# OVERLAY_FILES=0 stops writing aktualna_aukcja.html/.json
+OVERLAY_HOST = os.getenv("OVERLAY_HOST", "127.0.0.1")
+OVERLAY_PORT = int(os.getenv("OVERLAY_PORT", "0"))
+OVERLAY_FILES = os.getenv("OVERLAY_FILES", "1") != "0"
+# Local downscaled copies of card images and logos (cache/images), 0 disables them
+IMAGE_CACHE_MB = int(os.getenv("IMAGE_CACHE_MB", "200"))
 
 # Directory where aktualna_aukcja.html and aktualna_aukcja.json are stored
 OUTPUT_DIR = Path("templates")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR = Path("cache")
 
 bot = commands.Bot(command_prefix='/', intents=discord.Intents.all())
 
-aukcje_kolejka = []
-aktualna_aukcja = None
-youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY) if YOUTUBE_API_KEY else None
-yt_page_token = None
-pending_orders = {}
-pending_ok: dict[int, discord.User] = {}
+
+def instrument_discord_http():
+    """Time every Discord HTTP request and count 429 responses per channel."""
+    request = bot.http.request
+
+    async def timed_request(route, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        finally:
+            metrics.DISCORD_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                f"{route.method} {route.path}",
+                str(route.channel_id or ""),
+            )
+
+    bot.http.request = timed_request
+    logging.getLogger("discord.http").addHandler(RateLimitCounter())
+    logging.getLogger("discord.webhook.async_").addHandler(RateLimitCounter())
+
+
+class RateLimitCounter(logging.Handler):
+    # discord.py retries 429s internally and only reports them in these log lines
+    channel_re = re.compile(r"/channels/(\d+)")
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+
+    def emit(self, record):
+        msg = str(record.msg)
+        if msg.startswith("We are being rate limited.") and len(record.args) >= 3:
+            method, url = record.args[0], str(record.args[1])
+            match = self.channel_re.search(url)
+            metrics.DISCORD_RATE_LIMITED.inc(method, match.group(1) if match else "")
+            fanout.note_rate_limit(route_of(url), float(record.args[2]))
+        elif msg.startswith("Webhook ID %s is rate limited.") and len(record.args) >= 2:
+            metrics.DISCORD_RATE_LIMITED.inc("webhook", "")
+            fanout.note_rate_limit(f"webhooks/{record.args[0]}", float(record.args[1]))
+
+
+instrument_discord_http()
+
+
+def termin_minal(aukcja_id: int):
+    """Zamknij aukcję, której termin właśnie minął."""
+    msg = auction_msgs.get(aukcja_id)
+    if msg is not None:
+        asyncio.create_task(zakoncz_aukcje(aukcja_id, msg))
+
+
+aukcje_kolejka = LotQueue()
+catalog_task: asyncio.Task | None = None
+deadlines = DeadlineScheduler(termin_minal)
+throttle = BidThrottle(
+    {"discord": BID_LIMIT_DISCORD, "youtube": BID_LIMIT_YOUTUBE, "twitch": BID_LIMIT_TWITCH},
+    BID_LIMIT_TOTAL, BOOKKEEPING_MAX,
+)
+engine = AuctionEngine(
+    deadlines, SoftClose(SOFT_CLOSE_WINDOW, SOFT_CLOSE_EXTEND, SOFT_CLOSE_MAX),
+    throttle if throttle.limits or throttle.total else None,
+)
+# order message id -> Aukcja waiting for the admin's ✅
+pending_orders = TTLMap(PENDING_ORDER_TTL, BOOKKEEPING_MAX)
+# DM message id -> id of the winner asked to confirm with ✅
+pending_ok = TTLMap(PENDING_OK_TTL, BOOKKEEPING_MAX)
 seller_panel_msg: discord.Message | None = None
-auction_msg: discord.Message | None = None
-user_bid_messages: dict[int, discord.Message] = {}
+auction_msgs: dict[int, discord.Message] = {}
+# ledger id of the auction -> user id -> that user's ephemeral bid confirmation
+user_bid_messages: dict[int, TTLMap] = {}
 announcement_msg: discord.Message | None = None
 paused = False
+rownolegle = AUKCJE_ROWNOLEGLE
+start_lock = asyncio.Lock()
+# id() -> (lot taken off the queue whose auction has not started yet, whether it had priority)
+pobrane: dict[int, tuple['Aukcja', bool]] = {}
+# Lots sold since the first auction of this process, for the throughput figure
+pierwszy_start: float | None = None
+zakonczone = 0
+renderer = RenderScheduler(RENDER_MIN_INTERVAL)
+fanout = FanOut(FANOUT_LIMIT, FANOUT_WORKERS, FANOUT_ROUTE_LIMIT, FANOUT_ROUTE_WINDOW)
+asset_cache = AssetCache(
+    CACHE_DIR / "card_assets.json", ASSET_CACHE_TTL, ASSET_NEGATIVE_TTL, ASSET_CACHE_SIZE
+)
+asset_cache.load()
+workers = {path: WorkerClient(path) for path in {LEDGER_WORKER, SNAPSHOT_WORKER} if path}
+if SNAPSHOT_WORKER:
+    snapshots = RemoteSnapshotWriter(
+        workers[SNAPSHOT_WORKER], OUTPUT_DIR, OUTPUT_DIR / "auction_template.html"
+    )
+else:
+    snapshots = SnapshotWriter(OUTPUT_DIR, OUTPUT_DIR / "auction_template.html")
+overlay = OverlayServer(snapshots, CACHE_DIR / "images") if OVERLAY_PORT else None
+if LEDGER_WORKER:
+    ledger = RemoteLedger(workers[LEDGER_WORKER], LEDGER_PATH, SESSION_ID)
+else:
+    ledger = Ledger(LEDGER_PATH, SESSION_ID)
+journal = Journal(JOURNAL_DIR, JOURNAL_CHECKPOINT_EVERY)
+trace = slad.TraceWriter(Path(TRACE_DIR) / ("trace-" + re.sub(r"[^\w.-]", "_", SESSION_ID) + ".jsonl"))
+recovered = False
+assets = AssetFetcher(asset_cache, POKEMONTCG_API_TOKEN, PREFETCH_CONCURRENCY)
+images = ImageCache(CACHE_DIR / "images", IMAGE_CACHE_MB * 2**20, PREFETCH_CONCURRENCY) if IMAGE_CACHE_MB else None
+if images:
+    images.load()
 
 
-def fetch_card_assets(nazwa: str, numer: str) -> tuple[str | None, str | None]:
-    """Return card and set logo image URLs from PokemonTCG API if available."""
-    base = "https://api.pokemontcg.io/v2/cards"
-    numer = numer.strip().lower()
-    headers = {}
-    if POKEMONTCG_API_TOKEN:
-        headers["X-Api-Key"] = POKEMONTCG_API_TOKEN
+async def fetch_card_assets_async(nazwa: str, numer: str) -> tuple[str | None, str | None]:
+    """Return card assets from the cache, fetching them off the event loop on a miss."""
+    misses = asset_cache.misses
+    result = await assets.get(nazwa, numer)
+    if asset_cache.misses != misses:
+        asyncio.create_task(assets.save())
+    return result
 
-    def _parse(card):
-        if card:
-            return (
-                card.get("images", {}).get("large"),
-                card.get("set", {}).get("images", {}).get("logo"),
-            )
-        return None, None
 
-    # First try to fetch by card ID (e.g. sv2-10)
-    try:
-        resp = requests.get(f"{base}/{numer}", headers=headers, timeout=5)
-        logging.info("GET %s -> %s", resp.url, resp.status_code)
-        resp.raise_for_status()
-        card = resp.json().get("data")
-        logging.info("Lookup result: %s", card.get("name") if card else "None")
-        return _parse(card)
-    except Exception as e:
-        logging.warning("Direct lookup for %s failed: %s", numer, e)
-
-    # Fallback to search query if direct lookup failed
-    try:
-        set_id = ""
-        card_no = numer
-        if "-" in numer:
-            set_id, card_no = numer.split("-", 1)
-        parts = [f'name:"{nazwa}"', f'number:"{card_no}"']
-        if set_id:
-            parts.append(f'set.id:{set_id}')
-        query = " ".join(parts)
-        params = {"q": query, "pageSize": 1}
-        logging.info("Search query: %s", query)
-        resp = requests.get(base, params=params, headers=headers, timeout=5)
-        logging.info("GET %s -> %s", resp.url, resp.status_code)
-        resp.raise_for_status()
-        cards = resp.json().get("data")
-        logging.info("Search returned %s result(s)", len(cards) if cards else 0)
-        if cards:
-            return _parse(cards[0])
-        logging.warning("No results for query: %s", query)
-    except Exception as e:
-        logging.warning("Search request for %s failed: %s", numer, e)
-    logging.warning("Card image for %s (%s) not found", nazwa, numer)
-    return None, None
+def pozostalo_sekund(aukcja) -> int:
+    """Sekundy do końca według tego samego terminu, który zamyka aukcję."""
+    pozostalo = deadlines.remaining(aukcja.ledger_id)
+    return aukcja.czas if pozostalo is None else math.ceil(pozostalo)
 
 
-async def fetch_card_assets_async(nazwa: str, numer: str) -> tuple[str | None, str | None]:
-    """Asynchronously fetch card assets without blocking the event loop."""
-    return await asyncio.to_thread(fetch_card_assets, nazwa, numer)
+def koniec_aukcji(aukcja_id: int) -> str | None:
+    """Termin aukcji jako czas UTC, do zapisania w dzienniku."""
+    pozostalo = deadlines.remaining(aukcja_id)
+    if pozostalo is None:
+        return None
+    return (datetime.datetime.utcnow() + datetime.timedelta(seconds=pozostalo)).isoformat()
 
 
 async def update_panel_embed():
-    """Update or create the seller control panel embed."""
-    channel = bot.get_channel(SELLER_CHANNEL_ID)
-    if channel is None:
-        return
+    """Schedule a refresh of the seller control panel embed."""
+    renderer.mark_dirty("panel")
+
+
+def render_panel():
+    """Build the seller control panel embed."""
     embed = discord.Embed(title="Panel aukcji", color=0x00FF90)
     queue_preview = "\n".join(
-        f"{a.nazwa} ({a.numer})" for a in aukcje_kolejka[:5]
+        f"{'⭐ ' if i < aukcje_kolejka.priority else ''}{a.nazwa} ({a.numer})"
+        for i, a in enumerate(aukcje_kolejka.head(5))
     ) or "Brak"
-    embed.add_field(name="W kolejce", value=queue_preview, inline=False)
-    if aktualna_aukcja:
-        info = f"{aktualna_aukcja.nazwa} ({aktualna_aukcja.numer})\nCena: {aktualna_aukcja.cena:.2f} PLN"
-        if aktualna_aukcja.zwyciezca:
-            info += f"\nProwadzi: {aktualna_aukcja.zwyciezca}"
-        if aktualna_aukcja.start_time:
-            koniec = aktualna_aukcja.start_time + datetime.timedelta(seconds=aktualna_aukcja.czas)
-            pozostalo = int((koniec - datetime.datetime.utcnow()).total_seconds())
-            if pozostalo < 0:
-                pozostalo = 0
-            info += f"\nPozostało: {pozostalo}s"
+    embed.add_field(name=f"W kolejce ({len(aukcje_kolejka)})", value=queue_preview, inline=False)
+    for aukcja in itertools.islice(engine.aukcje.values(), 10):
+        info = f"{aukcja.nazwa} ({aukcja.numer})\nCena: {aukcja.cena:.2f} PLN"
+        if aukcja.zwyciezca:
+            info += f"\nProwadzi: {aukcja.zwyciezca}"
+        if aukcja.start_time:
+            info += f"\nPozostało: {pozostalo_sekund(aukcja)}s"
         embed.add_field(name="Aktualna aukcja", value=info, inline=False)
-    view = PanelView()
+    if len(engine.aukcje) > 10:
+        embed.add_field(name="…", value=f"i {len(engine.aukcje) - 10} więcej", inline=False)
+    return {"embed": embed, "view": PanelView()}
+
+
+async def send_panel(payload: dict):
+    """Edit the seller panel message or post a new one."""
+    channel = bot.get_channel(SELLER_CHANNEL_ID)
+    if channel is None:
+        return
     global seller_panel_msg
     if seller_panel_msg:
         try:
-            await seller_panel_msg.edit(embed=embed, view=view)
+            await seller_panel_msg.edit(**payload)
         except discord.NotFound:
-            seller_panel_msg = await channel.send(embed=embed, view=view)
+            seller_panel_msg = await channel.send(**payload)
     else:
-        seller_panel_msg = await channel.send(embed=embed, view=view)
-
+        seller_panel_msg = await channel.send(**payload)
 
 
 async def update_announcement_embed():
-    """Uaktualnij lub utwórz embed z ogłoszeniem aukcji."""
-    channel = bot.get_channel(OGLOSZENIA_KANAL_ID)
-    if channel is None:
-        return
+    """Zaplanuj odświeżenie embeda z ogłoszeniem aukcji."""
+    renderer.mark_dirty("announcement")
+
 
+def render_announcement():
+    """Zbuduj embed z ogłoszeniem aukcji."""
     embed = discord.Embed(title="🔔 Ogłoszenie aukcji", color=0x00BFFF)
 
-    if aktualna_aukcja:
+    if len(engine.aukcje) > 1:
+        for aukcja in itertools.islice(engine.aukcje.values(), 10):
+            embed.add_field(
+                name=f"{aukcja.nazwa} ({aukcja.numer})",
+                value=(
+                    f"{aukcja.cena:.2f} PLN • {aukcja.zwyciezca or 'Brak'}"
+                    f" • {pozostalo_sekund(aukcja)}s"
+                ),
+                inline=False,
+            )
+    elif engine.aktualna:
         embed.add_field(
             name="Aktualna karta",
-            value=f"{aktualna_aukcja.nazwa} ({aktualna_aukcja.numer})",
+            value=f"{engine.aktualna.nazwa} ({engine.aktualna.numer})",
             inline=False,
         )
         embed.add_field(
             name="Cena",
-            value=f"{aktualna_aukcja.cena:.2f} PLN",
+            value=f"{engine.aktualna.cena:.2f} PLN",
             inline=True,
         )
         embed.add_field(
             name="Prowadzi",
-            value=f"{aktualna_aukcja.zwyciezca or 'Brak'}",
+            value=f"{engine.aktualna.zwyciezca or 'Brak'}",
             inline=True,
         )
 
-        if aktualna_aukcja.start_time:
-            koniec = aktualna_aukcja.start_time + datetime.timedelta(seconds=aktualna_aukcja.czas)
-            pozostalo = int((koniec - datetime.datetime.utcnow()).total_seconds())
-            pozostalo = max(pozostalo, 0)
+        if engine.aktualna.start_time:
             embed.add_field(
                 name="Koniec za",
-                value=f"{pozostalo}s",
+                value=f"{pozostalo_sekund(engine.aktualna)}s",
                 inline=True,
             )
 
-        if aktualna_aukcja.obraz_url:
-            embed.set_thumbnail(url=aktualna_aukcja.obraz_url)
+        if engine.aktualna.obraz_url:
+            embed.set_thumbnail(url=engine.aktualna.obraz_url)
     else:
         embed.add_field(name="Status", value="Brak aktywnej aukcji", inline=False)
 
-    kolejka = "\n".join(f"{a.nazwa} ({a.numer})" for a in aukcje_kolejka[:5]) or "Brak"
+    kolejka = "\n".join(f"{a.nazwa} ({a.numer})" for a in aukcje_kolejka.head(5)) or "Brak"
     embed.add_field(name="W kolejce", value=kolejka, inline=False)
+    return {"embed": embed, "view": AnnouncementView()}
 
-    view = AnnouncementView()
+
+async def send_announcement(payload: dict):
+    """Edytuj wiadomość z ogłoszeniem albo wyślij nową."""
+    channel = bot.get_channel(OGLOSZENIA_KANAL_ID)
+    if channel is None:
+        return
     global announcement_msg
     if announcement_msg:
         try:
-            await announcement_msg.edit(embed=embed, view=view)
+            await announcement_msg.edit(**payload)
         except discord.NotFound:
-            announcement_msg = await channel.send(embed=embed, view=view)
+            announcement_msg = await channel.send(**payload)
     else:
-        announcement_msg = await channel.send(embed=embed, view=view)
+        announcement_msg = await channel.send(**payload)
 
 async def announce_winner(aukcja: 'Aukcja'):
     """Wyświetl w ogłoszeniach wynik zakończonej aukcji."""
@@ -230,15 +414,10 @@ async def announce_winner(aukcja: 'Aukcja'):
             value="Brak kolejnych aukcji",
             inline=False,
         )
-    view = AnnouncementView()
-    global announcement_msg
-    if announcement_msg:
-        try:
-            await announcement_msg.edit(embed=embed, view=view)
-        except discord.NotFound:
-            announcement_msg = await channel.send(embed=embed, view=view)
-    else:
-        announcement_msg = await channel.send(embed=embed, view=view)
+    # Result is edited directly, so a queued live refresh must not replace it
+    renderer.forget("announcement")
+    fanout.discard("announcement")
+    await send_announcement({"embed": embed, "view": AnnouncementView()})
 
 async def notify_seller_end(aukcja: 'Aukcja'):
     """Przekaż wynik aukcji na kanał sprzedawcy."""
@@ -256,72 +435,115 @@ async def notify_seller_end(aukcja: 'Aukcja'):
 
 
 
-async def update_auction_embed():
-    """Aktualizuje embed licytacyjny z grafiką, ceną, prowadzącym i odliczaniem."""
-    if not aktualna_aukcja or not auction_msg:
-        return
+def zalaczniki_grafik(aukcja: 'Aukcja') -> list[discord.File]:
+    """Lokalne kopie grafiki karty i logo jako załączniki wiadomości aukcji."""
+    aukcja.zalaczniki = None
+    if not images:
+        return []
+    pliki, nazwy = [], []
+    for url, wariant, nazwa in ((aukcja.obraz_url, "embed", "karta"), (aukcja.logo_url, "thumb", "logo")):
+        path = images.path(url, wariant, touch=True)
+        if path is None:
+            nazwy.append(None)
+            continue
+        nazwy.append(f"{nazwa}{path.suffix}")
+        pliki.append(discord.File(path, filename=nazwy[-1]))
+    if pliki:
+        aukcja.zalaczniki = tuple(nazwy)
+    return pliki
+
+
+def obraz_aukcji(aukcja: 'Aukcja') -> str | None:
+    """Obraz karty w embedzie wiadomości aukcji: załącznik, a bez niego zdalny URL."""
+    nazwa = aukcja.zalaczniki[0] if aukcja.zalaczniki else None
+    return f"attachment://{nazwa}" if nazwa else aukcja.obraz_url
+
+
+def logo_aukcji(aukcja: 'Aukcja') -> str | None:
+    nazwa = aukcja.zalaczniki[1] if aukcja.zalaczniki else None
+    return f"attachment://{nazwa}" if nazwa else aukcja.logo_url
+
+
+async def update_auction_embed(aukcja_id: int):
+    """Planuje odświeżenie embeda licytacyjnego."""
+    renderer.mark_dirty(f"auction:{aukcja_id}")
+
+
+def render_auction(aukcja_id: int):
+    """Buduje embed licytacyjny z grafiką, ceną, prowadzącym i odliczaniem."""
+    aukcja = engine.aukcje.get(aukcja_id)
+    if not aukcja or aukcja_id not in auction_msgs:
+        return None
 
     embed = discord.Embed(
-        title=f"🎴 {aktualna_aukcja.nazwa} ({aktualna_aukcja.numer})",
-        description=aktualna_aukcja.opis or "Brak opisu.",
+        title=f"🎴 {aukcja.nazwa} ({aukcja.numer})",
+        description=aukcja.opis or "Brak opisu.",
         color=0xFFD700
     )
 
     embed.add_field(
         name="💸 Aktualna cena",
-        value=f"**{aktualna_aukcja.cena:.2f} PLN**",
+        value=f"**{aukcja.cena:.2f} PLN**",
         inline=True
     )
 
     embed.add_field(
         name="➕ Kwota przebicia",
-        value=f"{aktualna_aukcja.przebicie:.2f} PLN",
+        value=f"{aukcja.przebicie:.2f} PLN",
         inline=True
     )
 
     embed.add_field(
         name="🏆 Prowadzi",
-        value=str(aktualna_aukcja.zwyciezca) if aktualna_aukcja.zwyciezca else "Brak",
+        value=str(aukcja.zwyciezca) if aukcja.zwyciezca else "Brak",
         inline=True
     )
 
-    if aktualna_aukcja.start_time:
-        koniec = aktualna_aukcja.start_time + datetime.timedelta(seconds=aktualna_aukcja.czas)
-        pozostalo = int((koniec - datetime.datetime.utcnow()).total_seconds())
-        pozostalo = max(pozostalo, 0)
-        embed.set_footer(text=f"⏳ Pozostało: {pozostalo}s")
+    if aukcja.start_time:
+        dogrywka = f" (dogrywka +{aukcja.przedluzenie:.0f}s)" if aukcja.przedluzenie else ""
+        embed.set_footer(text=f"⏳ Pozostało: {pozostalo_sekund(aukcja)}s{dogrywka}")
 
-    if aktualna_aukcja.logo_url:
-        embed.set_author(name="Aukcja Pokémon", icon_url=aktualna_aukcja.logo_url)
+    if aukcja.logo_url:
+        embed.set_author(name="Aukcja Pokémon", icon_url=logo_aukcji(aukcja))
 
-    if aktualna_aukcja.obraz_url:
-        embed.set_image(url=aktualna_aukcja.obraz_url)
+    if aukcja.obraz_url:
+        embed.set_image(url=obraz_aukcji(aukcja))
     else:
         embed.add_field(name="Obraz", value="Brak zdjęcia karty", inline=False)
 
-    await auction_msg.edit(embed=embed)
+    return {"embed": embed}
 
-async def countdown_task(message: discord.Message, seconds: int):
-    await update_auction_embed()
-    await update_announcement_embed()
-    remaining = float(seconds)
-    interval = 0.5
-    while remaining > 0:
-        await asyncio.sleep(interval)
-        remaining -= interval
-        await update_auction_embed()
-        await update_announcement_embed()
-    await zakoncz_aukcje(message)
-    await update_panel_embed()
+
+async def send_auction(aukcja_id: int, payload: dict):
+    msg = auction_msgs.get(aukcja_id)
+    if msg:
+        return fanout.defer(
+            f"channels/{msg.channel.id}", partial(msg.edit, **payload), Priority.AUCTION,
+            key=f"auction:{aukcja_id}",
+        )
+
+
+def w_kolejce(priorytet: Priority, key: str, route: str, send):
+    """Funkcja wysyłki dla renderera, która kolejkuje edycję zamiast na nią czekać."""
+    async def queued(payload: dict):
+        return fanout.defer(route, partial(send, payload), priorytet, key=key)
+    return queued
 
 
+renderer.register(
+    "panel", render_panel, w_kolejce(Priority.PANEL, "panel", f"channels/{SELLER_CHANNEL_ID}", send_panel)
+)
+renderer.register(
+    "announcement", render_announcement,
+    w_kolejce(Priority.ANNOUNCEMENT, "announcement", f"channels/{OGLOSZENIA_KANAL_ID}", send_announcement),
+)
+
 async def start_next_auction(interaction: discord.Interaction | None = None):
-    global aktualna_aukcja
     if paused:
         if interaction:
             await interaction.response.send_message("Panel wstrzymany.", ephemeral=True)
         return
-    if aktualna_aukcja:
+    if len(engine.aukcje) >= rownolegle:
         if interaction:
             await interaction.response.send_message("Aukcja w toku.", ephemeral=True)
         return
@@ -331,59 +553,147 @@ async def start_next_auction(interaction: discord.Interaction | None = None):
         return
     if interaction:
         await interaction.response.defer()
-
-    aktualna_aukcja = aukcje_kolejka.pop(0)
-    aktualna_aukcja.start_time = datetime.datetime.utcnow()
-    img, logo = await fetch_card_assets_async(
-        aktualna_aukcja.nazwa, aktualna_aukcja.numer
+    await uzupelnij_aukcje()
+
+
+async def uzupelnij_aukcje():
+    """Uruchamiaj loty z kolejki, aż będzie ich ``rownolegle`` naraz."""
+    async with start_lock:
+        while not paused and aukcje_kolejka and len(engine.aukcje) < rownolegle:
+            priorytet = aukcje_kolejka.priority > 0
+            aukcja = aukcje_kolejka.popleft()
+            # Journaled with the pop: a lot moved or removed while this one starts
+            # is recorded at its index without it
+            pobrane[id(aukcja)] = (aukcja, priorytet)
+            journal.append({"t": dziennik.TAKE, "lot": lot_do_dziennika(aukcja), "p": priorytet})
+            await uruchom_lot(aukcja)
+
+
+def kanal_aukcji() -> int:
+    """Kanał z najmniejszą liczbą trwających aukcji."""
+    zajete = [m.channel.id for m in auction_msgs.values()]
+    return min(AUKCJE_KANALY, key=zajete.count)
+
+
+async def uruchom_lot(aukcja: 'Aukcja'):
+    global pierwszy_start
+    if pierwszy_start is None:
+        pierwszy_start = time.monotonic()
+    aukcja.start_time = datetime.datetime.utcnow()
+    aukcja.ledger_id = await ledger.run(ledger.start_auction, {
+        "nazwa": aukcja.nazwa,
+        "numer": aukcja.numer,
+        "opis": aukcja.opis,
+        "cena": aukcja.cena,
+        "start_time": aukcja.start_time.isoformat(),
+    })
+    aukcja_id = aukcja.ledger_id
+    engine.rozpocznij(aukcja)
+    pobrane.pop(id(aukcja), None)
+    journal.append({"t": dziennik.START, "a": aukcja_do_dziennika(aukcja)})
+    trace.record(slad.START, id=aukcja_id, numer=aukcja.numer)
+    renderer.register(
+        f"auction:{aukcja_id}", partial(render_auction, aukcja_id), partial(send_auction, aukcja_id)
     )
-    aktualna_aukcja.obraz_url = img
-    aktualna_aukcja.logo_url = logo
+    img, logo = await fetch_card_assets_async(aukcja.nazwa, aukcja.numer)
+    aukcja.obraz_url = img
+    aukcja.logo_url = logo
     logging.info(
         "Fetched assets for %s (%s): image=%s logo=%s",
-        aktualna_aukcja.nazwa,
-        aktualna_aukcja.numer,
+        aukcja.nazwa,
+        aukcja.numer,
         bool(img),
         bool(logo),
     )
+    if images:
+        # Normally done by the queue prefetch already; downloads only on a miss
+        await images.prefetch([img, logo])
+    pliki = zalaczniki_grafik(aukcja)
 
     embed = discord.Embed(
-        title=f"🏁 **{aktualna_aukcja.nazwa}** ({aktualna_aukcja.numer})",
-        description=aktualna_aukcja.opis,
+        title=f"🏁 **{aukcja.nazwa}** ({aukcja.numer})",
+        description=aukcja.opis,
         color=0x00ff90,
     )
-    embed.add_field(name="Numer", value=f"**{aktualna_aukcja.numer}**", inline=True)
-    embed.add_field(name="Cena startowa", value=f"**{aktualna_aukcja.cena:.2f} PLN**", inline=True)
-    embed.set_footer(text=f"⏳ Czas trwania: {aktualna_aukcja.czas} s")
-    if aktualna_aukcja.logo_url:
-        embed.set_thumbnail(url=aktualna_aukcja.logo_url)
-    if aktualna_aukcja.obraz_url:
-        embed.set_image(url=aktualna_aukcja.obraz_url)
+    embed.add_field(name="Numer", value=f"**{aukcja.numer}**", inline=True)
+    embed.add_field(name="Cena startowa", value=f"**{aukcja.cena:.2f} PLN**", inline=True)
+    embed.set_footer(text=f"⏳ Czas trwania: {aukcja.czas} s")
+    if aukcja.logo_url:
+        embed.set_thumbnail(url=logo_aukcji(aukcja))
+    if aukcja.obraz_url:
+        embed.set_image(url=obraz_aukcji(aukcja))
     else:
         embed.add_field(name="Obraz", value="Brak zdjęcia karty", inline=False)
 
-    channel = bot.get_channel(AUKCJE_KANAL_ID)
-    msg = await channel.send(embed=embed, view=LicytacjaView())
-    global auction_msg
-    auction_msg = msg
+    channel = bot.get_channel(kanal_aukcji())
+    msg = await channel.send(embed=embed, view=LicytacjaView(aukcja_id), files=pliki)
+    auction_msgs[aukcja_id] = msg
+    # The clock starts once bidders can see the lot
+    deadlines.schedule(aukcja_id, time.monotonic() + aukcja.czas)
+    trace.record(slad.OPEN, id=aukcja_id, czas=aukcja.czas)
+    journal.append({
+        "t": dziennik.MSG, "id": aukcja_id, "m": [msg.channel.id, msg.id], "k": koniec_aukcji(aukcja_id),
+        "z": aukcja.zalaczniki,
+    })
 
-    await update_auction_embed()
+    await update_auction_embed(aukcja_id)
 
-    zapisz_html(aktualna_aukcja)
-    zapisz_json(aktualna_aukcja)
+    zapisz_stan(aukcja)
 
-    bot.loop.create_task(countdown_task(msg, aktualna_aukcja.czas))
     await update_panel_embed()
     await update_announcement_embed()
 
 
+close_bot = bot.close
+
+
+async def close():
+    """Zatrzymaj kolejkę wysyłki przed rozłączeniem z Discordem."""
+    await fanout.close()
+    await close_bot()
+
+
+bot.close = close
+
+
+@bot.event
+async def setup_hook():
+    # Called by discord.py after logging in, before connecting to the gateway
+    startup.mark("login")
+
+
 @bot.event
 async def on_ready():
-    if youtube:
-        check_youtube_chat.start()
-    refresh_panel.start()
+    engine.start()
+    global recovered
+    if not recovered:
+        recovered = True
+        startup.mark("gateway")
+        if METRICS_PORT:
+            await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        if overlay:
+            await overlay.start(OVERLAY_HOST, OVERLAY_PORT)
+        await przywroc_stan()
+        startup.mark("recovery")
+        logging.info("Startup: %s", startup.report())
+    ledger.submit(ledger.seed_order_counter, legacy_order_counter())
+    for source in chat_sources:
+        source.start()
+    if youtube_poller and not YOUTUBE_CHAT_STREAM:
+        youtube_poller.start()
+    # on_ready fires again after every gateway reconnect
+    if not refresh_panel.is_running():
+        refresh_panel.start()
+    if not refresh_countdowns.is_running():
+        refresh_countdowns.start()
 
 class Aukcja:
+    __slots__ = (
+        "nazwa", "numer", "opis", "cena", "przebicie", "czas", "historia", "zwyciezca",
+        "start_time", "order_number", "payment_method", "obraz_url", "logo_url", "ledger_id",
+        "przedluzenie", "zalaczniki",
+    )
+
     def __init__(self, nazwa, numer, opis, cena_start, przebicie, czas):
         self.nazwa = nazwa
         self.numer = numer
@@ -392,36 +702,185 @@ class Aukcja:
         self.cena = float(str(cena_start).replace(",", "."))
         self.przebicie = float(str(przebicie).replace(",", "."))
         self.czas = int(czas)
-        self.historia = []
-        self.zwyciezca = None
+        self.historia = BidHistory()
+        self.zwyciezca: UserRef | None = None
         self.start_time = None
         self.order_number = None
         self.payment_method = None
         self.obraz_url = None
         self.logo_url = None
+        self.ledger_id = None
+        self.przedluzenie = 0.0   # seconds added by soft close
+        self.zalaczniki = None    # (card, logo) file names attached to the auction message
 
     def licytuj(self, user):
         self.cena += self.przebicie
-        self.historia.append((str(user), self.cena, datetime.datetime.utcnow().isoformat()))
-        self.zwyciezca = user
+        self.zwyciezca = uczestnicy.intern(user)
+        self.historia.append(self.zwyciezca, self.cena)
 
 @bot.command()
-async def zaladuj(ctx):
+async def zaladuj(ctx, tryb: str = "", plik: str = "aukcje.csv"):
+    """/zaladuj [dodaj] [plik] – wczytaj katalog; „dodaj” dopisuje do kolejki zamiast ją zastąpić."""
     if ctx.author.id != ADMIN_ID:
         await ctx.send('Brak uprawnień.')
         return
-    global aukcje_kolejka
-    aukcje_kolejka.clear()
-    with open('aukcje.csv', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            aukcja = Aukcja(row['nazwa_karty'], row['numer_karty'], row['opis'], row['cena_początkowa'], row['kwota_przebicia'], row['czas_trwania'])
-            aukcje_kolejka.append(aukcja)
-    await ctx.send(f'Załadowano {len(aukcje_kolejka)} aukcji.')
+    global catalog_task
+    if catalog_task is not None and not catalog_task.done():
+        await ctx.send('Wczytywanie katalogu w toku.')
+        return
+    catalog_task = asyncio.create_task(wczytaj_katalog(ctx, Path(plik), tryb != "dodaj"))
+
+
+async def przygotuj_grafiki(karty: list[tuple[str, str]]):
+    """Pobierz adresy grafik kart, a potem same grafiki do lokalnej pamięci."""
+    found = await assets.prefetch(karty)
+    if images:
+        await images.prefetch(url for obraz, logo in found for url in (obraz, logo))
+
+
+async def wczytaj_katalog(ctx, path: Path, replace: bool):
+    """Dodawaj loty do kolejki partiami w miarę parsowania pliku."""
+    reader = CatalogReader(path, CATALOG_BATCH_SIZE)
+    started = time.perf_counter()
+    batches = reader.batches()
+    try:
+        # The file is opened and its columns checked before a replace empties the queue
+        lots = await anext(batches, None)
+        if replace:
+            aukcje_kolejka.clear()
+            journal.append({"t": dziennik.LOAD, "replace": True, "lots": []})
+            trace.record(slad.LOAD, replace=True, lots=[])
+        while lots is not None:
+            aukcje_kolejka.extend(Aukcja(*lot) for lot in lots)
+            journal.append({"t": dziennik.LOAD, "replace": False, "lots": lots})
+            trace.record(slad.LOAD, replace=False, lots=lots)
+            asyncio.create_task(przygotuj_grafiki([(lot[0], lot[1]) for lot in lots]))
+            await update_panel_embed()
+            if len(engine.aukcje) < rownolegle:
+                # Start selling as soon as the first lots are in the queue
+                await start_next_auction()
+                await update_announcement_embed()
+            lots = await anext(batches, None)
+    except (OSError, ValueError) as e:
+        logging.warning("Loading catalog %s failed: %s", path, e)
+        await ctx.send(f'Nie udało się wczytać {path}: {e}')
+        return
+    finally:
+        await batches.aclose()
+        journal.maybe_checkpoint(stan_dziennika)
+    logging.info(
+        "Loaded %s/%s row(s) from %s in %.1f ms",
+        reader.loaded, reader.rows, path, (time.perf_counter() - started) * 1000,
+    )
+    lines = [f'Załadowano {reader.loaded} aukcji.']
+    if reader.errors:
+        lines.append(f'Pominięto {len(reader.errors)} błędnych wierszy:')
+        lines.extend(str(e) for e in reader.errors[:CATALOG_ERRORS_SHOWN])
+        if len(reader.errors) > CATALOG_ERRORS_SHOWN:
+            lines.append('…')
+    await ctx.send("\n".join(lines)[:2000])
+    await update_panel_embed()
+
+async def przestaw_lot(aukcja, old: int):
+    """Zapisz przestawienie lotu w dzienniku i odśwież podglądy kolejki."""
+    journal.append({
+        "t": dziennik.MOVE,
+        "i": old,
+        "to": aukcje_kolejka.index(aukcja),
+        "p": aukcje_kolejka.priority,
+    })
     await update_panel_embed()
-    await start_next_auction()
     await update_announcement_embed()
 
+
+async def lot_z_kolejki(ctx, numer: str):
+    aukcja = aukcje_kolejka.find(numer)
+    if aukcja is None:
+        await ctx.send(f'Nie ma karty {numer} w kolejce.')
+    return aukcja
+
+
+@bot.command()
+async def szukaj(ctx, *, fraza: str):
+    """/szukaj <numer lub początek nazwy> – pozycje pasujących kart w kolejce."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    lines = [
+        f"{aukcje_kolejka.index(a) + 1}. {a.nazwa} ({a.numer})"
+        for a in aukcje_kolejka.search(fraza.strip())
+    ]
+    await ctx.send("\n".join(lines) or 'Brak pasujących kart w kolejce.')
+
+
+@bot.command()
+async def przesun(ctx, numer: str, pozycja: int):
+    """/przesun <numer> <pozycja> – 1 oznacza następną kartę."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    aukcja = await lot_z_kolejki(ctx, numer)
+    if aukcja is None:
+        return
+    await przestaw_lot(aukcja, aukcje_kolejka.move(aukcja, pozycja - 1))
+    await ctx.send(f'{aukcja.nazwa} ({aukcja.numer}) jest teraz na pozycji {aukcje_kolejka.index(aukcja) + 1}.')
+
+
+@bot.command()
+async def priorytet(ctx, numer: str):
+    """/priorytet <numer> – sprzedaj kartę przed zwykłą kolejką."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    aukcja = await lot_z_kolejki(ctx, numer)
+    if aukcja is None:
+        return
+    await przestaw_lot(aukcja, aukcje_kolejka.prioritize(aukcja))
+    await ctx.send(f'{aukcja.nazwa} ({aukcja.numer}) ma priorytet, pozycja {aukcje_kolejka.index(aukcja) + 1}.')
+
+
+@bot.command()
+async def pomin(ctx, numer: str = None):
+    """/pomin [numer] – przenieś kartę (domyślnie następną) na koniec kolejki."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    aukcja = await pomin_lot(numer)
+    await ctx.send(
+        f'{aukcja.nazwa} ({aukcja.numer}) przeniesiona na koniec kolejki.' if aukcja
+        else 'Nie ma takiej karty w kolejce.'
+    )
+
+
+async def pomin_lot(numer: str | None = None):
+    if numer is None:
+        aukcja = aukcje_kolejka[0] if aukcje_kolejka else None
+    else:
+        aukcja = aukcje_kolejka.find(numer)
+    if aukcja is not None:
+        await przestaw_lot(aukcja, aukcje_kolejka.skip(aukcja))
+    return aukcja
+
+
+@bot.command()
+async def usun(ctx, numer: str):
+    """/usun <numer> – usuń kartę z kolejki."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    aukcja = await lot_z_kolejki(ctx, numer)
+    if aukcja is None:
+        return
+    journal.append({
+        "t": dziennik.REMOVE,
+        "i": aukcje_kolejka.remove(aukcja),
+        "p": aukcje_kolejka.priority,
+    })
+    await update_panel_embed()
+    await update_announcement_embed()
+    await ctx.send(f'Usunięto {aukcja.nazwa} ({aukcja.numer}) z kolejki.')
+
+
 @bot.command()
 async def start_aukcja(ctx):
     if ctx.author.id != ADMIN_ID:
@@ -429,37 +888,124 @@ async def start_aukcja(ctx):
         return
     await start_next_auction()
 
+@bot.command()
+async def rownolegle_aukcje(ctx, liczba: int):
+    """/rownolegle_aukcje <k> – ile aukcji ma trwać jednocześnie (1 = jedna karta naraz)."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    global rownolegle
+    rownolegle = max(1, liczba)
+    trace.record(slad.PARALLEL, n=rownolegle)
+    await ctx.send(f'Równoległe aukcje: {rownolegle}.')
+    if rownolegle > 1:
+        await uzupelnij_aukcje()
 
-def zapisz_html(aukcja: Aukcja, template_path: str = "templates/auction_template.html"):
-    with open(template_path, encoding="utf-8") as f:
-        template = Template(f.read())
-
-    historia_html = ""
-    last = list(reversed(aukcja.historia[-4:]))
-    for i, (u, c, _t) in enumerate(last):
-        strong = " font-weight:bold;" if i == 0 else ""
-        historia_html += (
-            f'<li style="{strong}"><span class="user">{u}</span> - '
-            f'<span class="price">{c:.2f} PLN</span></li>'
+@bot.command()
+async def statystyki(ctx):
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    lines = [
+        f"{key}: żądania {s['requested']}, scalone {s['merged']}, "
+        f"bez zmian {s['skipped']}, w kolejce {s['queued']}, wysłane {s['sent']}"
+        for key, s in renderer.stats().items()
+    ]
+    if engine.throttle:
+        odrzucone = ", ".join(f"{limit}/{policy} {n}" for (limit, policy), n in sorted(throttle.shed.items()))
+        lines.append(f"Limity ofert: {odrzucone or 'bez przekroczeń'}, czeka {engine.held}")
+    lines.append(
+        f"Kolejka Discord: wysłane {fanout.sent}, nieaktualne pominięte {fanout.dropped}, "
+        f"błędy {fanout.failed}, czeka {len(fanout)}"
+    )
+    lines.extend(source.status() for source in chat_sources)
+    if youtube_poller and (youtube_poller.polls or not YOUTUBE_CHAT_STREAM):
+        lines.append(
+            f"YouTube: zapytania {youtube_poller.polls}, błędy {youtube_poller.errors}, "
+            f"limit zużyty {youtube_poller.quota_used}/{youtube_poller.quota_limit}"
+        )
+        if youtube_poller.client_seconds is not None:
+            startup.add("youtube_client", youtube_poller.client_seconds)
+    lines.append(f"Start: {startup.report()}")
+    if pierwszy_start is not None:
+        godziny = (time.monotonic() - pierwszy_start) / 3600
+        lines.append(
+            f"Aukcje: zakończone {zakonczone}, trwające {len(engine.aukcje)}/{rownolegle}, "
+            f"{zakonczone / godziny:.1f} lotów/h"
         )
+    await ctx.send(("Edycje wiadomości:\n" + "\n".join(lines))[:2000])
 
-    html = template.safe_substitute(
-        nazwa=aukcja.nazwa,
-        numer=aukcja.numer,
-        opis=aukcja.opis,
-        cena=f"{aukcja.cena:.2f}",
-        zwyciezca=aukcja.zwyciezca or "",
-        historia=historia_html,
-        obraz=aukcja.obraz_url or "",
-    )
 
-    out_html = OUTPUT_DIR / "aktualna_aukcja.html"
-    with open(out_html, "w", encoding="utf-8") as f:
-        f.write(html)
+def format_orders(orders: list[dict]) -> str:
+    return "\n".join(
+        f"{o['order_number']}: {o['nazwa']} ({o['numer']}) – {o['cena']:.2f} PLN, "
+        f"{o['buyer']}, {o['status']}{'' if o['paid'] else ', nieopłacone'}"
+        for o in orders
+    ) or "Brak zamówień."
 
-def zapisz_json(aukcja: Aukcja):
+@bot.command()
+async def zamowienia(ctx, *, kupujacy: str):
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    buyer = ctx.message.mentions[0].id if ctx.message.mentions else kupujacy.strip()
+    await ctx.send(format_orders(await ledger.run(ledger.orders_by_buyer, buyer)))
+
+@bot.command()
+async def nieoplacone(ctx):
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    await ctx.send(format_orders(await ledger.run(ledger.unpaid_orders)))
+
+@bot.command()
+async def oplacone(ctx, numer_zamowienia: str):
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    if await ledger.run(ledger.mark_paid, numer_zamowienia):
+        await ctx.send(f'Zamówienie {numer_zamowienia} oznaczone jako opłacone.')
+    else:
+        await ctx.send(f'Brak nieopłaconego zamówienia {numer_zamowienia}.')
+
+@bot.command()
+async def przychod(ctx):
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    rows = await ledger.run(ledger.revenue_per_session)
+    await ctx.send("\n".join(
+        f"{r['session']}: {r['orders']} zamówień, {r['revenue']:.2f} PLN" for r in rows
+    ) or "Brak zamówień.")
+
+@bot.command()
+async def analityka(ctx, *, sesja: str = None):
+    """Statystyki ofert sesji (domyślnie bieżącej, "wszystko" = cały sezon)."""
+    if ctx.author.id != ADMIN_ID:
+        await ctx.send('Brak uprawnień.')
+        return
+    sesja = sesja or SESSION_ID
+    await ledger.run(ledger.export_bids, str(BID_COLUMNS_DIR))
+    try:
+        podsumowanie = await asyncio.to_thread(
+            analytics.summarize, BID_COLUMNS_DIR, None if sesja == "wszystko" else sesja
+        )
+    except RuntimeError as e:
+        await ctx.send(str(e))
+        return
+    except OSError as e:
+        logging.warning("Reading bid columns from %s failed: %s", BID_COLUMNS_DIR, e)
+        await ctx.send("Brak danych ofert do analizy.")
+        return
+    await ctx.send(analytics.format_summary(podsumowanie))
+
+
+def zapisz_stan(aukcja: Aukcja):
+    """Zapisz stan aukcji do aktualna_aukcja.html/.json w tle."""
     next_nazwa = aukcje_kolejka[0].nazwa if aukcje_kolejka else None
     next_numer = aukcje_kolejka[0].numer if aukcje_kolejka else None
+    koniec = koniec_aukcji(aukcja.ledger_id)
+    lokalny = images.path(aukcja.obraz_url, "overlay") if images else None
     dane = {
         "nazwa": aukcja.nazwa,
         "numer": aukcja.numer,
@@ -469,51 +1015,39 @@ def zapisz_json(aukcja: Aukcja):
         "historia": aukcja.historia[-4:],
         "start_time": (aukcja.start_time.isoformat() + "Z") if aukcja.start_time else None,
         "czas": aukcja.czas,
+        "koniec": (koniec + "Z") if koniec else None,
         "obraz": aukcja.obraz_url,
+        "obraz_lokalny": f"img/{lokalny.name}" if lokalny else None,
         "logo": aukcja.logo_url,
         "next_nazwa": next_nazwa,
         "next_numer": next_numer,
     }
-    out_json = OUTPUT_DIR / 'aktualna_aukcja.json'
-    with open(out_json, 'w', encoding='utf-8') as f:
-        json.dump(dane, f, ensure_ascii=False, indent=2)
-
-def generate_order_number() -> str:
-    now = datetime.datetime.utcnow()
-    prefix = f"AUC-{now.year}-{now.month:02d}-"
-    os.makedirs('orders', exist_ok=True)
-    counter_file = 'orders/counter.txt'
+    if overlay:
+        overlay.publish(dane)
+    if OVERLAY_FILES:
+        snapshots.submit(dane)
+
+def legacy_order_counter() -> int:
+    """Ostatni numer z orders/counter.txt, żeby numeracja zamówień była ciągła."""
     try:
-        with open(counter_file, 'r') as f:
-            counter = int(f.read().strip())
-    except FileNotFoundError:
-        counter = 0
-    counter += 1
-    with open(counter_file, 'w') as f:
-        f.write(str(counter))
-    return prefix + f"{counter:04d}"
-
-def zapisz_zamowienie(aukcja: Aukcja):
-    order_number = generate_order_number()
-    aukcja.order_number = order_number
-    os.makedirs('orders', exist_ok=True)
-    with open(f'orders/zamowienie_{order_number}.txt', 'w', encoding='utf-8') as f:
-        f.write(
-            f'Uzytkownik: {aukcja.zwyciezca}\n'
-            f'Karta: {aukcja.nazwa}\n'
-            f'Cena: {aukcja.cena:.2f}\n'
-            f'Numer zamowienia: {order_number}\n'
-        )
+        with open('orders/counter.txt') as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+async def zapisz_zamowienie(aukcja: Aukcja):
+    aukcja.order_number = await ledger.run(ledger.create_order, {
+        "auction_id": aukcja.ledger_id,
+        "buyer": str(aukcja.zwyciezca),
+        "buyer_id": getattr(aukcja.zwyciezca, "id", None),
+        "nazwa": aukcja.nazwa,
+        "numer": aukcja.numer,
+        "cena": aukcja.cena,
+        "payment_method": aukcja.payment_method,
+    })
 
 async def send_order_dm(aukcja: Aukcja):
-    user = None
-    if isinstance(aukcja.zwyciezca, discord.abc.User):
-        user = aukcja.zwyciezca
-    elif hasattr(aukcja.zwyciezca, "id"):
-        try:
-            user = await bot.fetch_user(aukcja.zwyciezca.id)
-        except Exception:
-            user = None
+    user = await uzytkownik_discord(aukcja.zwyciezca)
     if user is None:
         return
     message = (
@@ -525,7 +1059,8 @@ async def send_order_dm(aukcja: Aukcja):
             message += f"\n{aukcja.obraz_url}"
         dm = await user.send(message)
         await dm.add_reaction("✅")
-        pending_ok[dm.id] = user
+        pending_ok[dm.id] = user.id
+        journal.append({"t": dziennik.OK, "m": dm.id, "u": user.id})
     except discord.Forbidden:
         pass
 
@@ -549,72 +1084,102 @@ async def notify_order_channel(aukcja: Aukcja):
     embed.set_footer(text="Status: oczekuje na potwierdzenie")
     msg = await channel.send(embed=embed)
     pending_orders[msg.id] = aukcja
+    journal.append({
+        "t": dziennik.ORDER, "m": msg.id, "o": aukcja_do_dziennika(aukcja, historia=False)
+    })
     await msg.add_reaction("✅")
 
-async def zakoncz_aukcje(msg):
-    global aktualna_aukcja, auction_msg
-    if aktualna_aukcja:
-        zapisz_html(aktualna_aukcja)
-        zapisz_json(aktualna_aukcja)
+async def zakoncz_aukcje(aukcja_id: int, msg):
+    global zakonczone
+    started = time.perf_counter()
+    # The final embed is sent directly; stop live refreshes of this message
+    auction_msgs.pop(aukcja_id, None)
+    renderer.unregister(f"auction:{aukcja_id}")
+    fanout.discard(f"auction:{aukcja_id}")
+    trace.record(slad.CLOSE, id=aukcja_id)
+    aukcja = await engine.zakoncz(aukcja_id)
+    if aukcja:
+        zapisz_stan(aukcja)
 
         embed = discord.Embed(
-            title=f"✅ Aukcja zako\u0144czona: {aktualna_aukcja.nazwa}",
+            title=f"✅ Aukcja zako\u0144czona: {aukcja.nazwa}",
             color=0xff0000,
         )
         embed.add_field(
             name="💵 Cena ko\u0144cowa",
-            value=f"**{aktualna_aukcja.cena:.2f} PLN**",
+            value=f"**{aukcja.cena:.2f} PLN**",
             inline=True,
         )
         embed.add_field(
             name="🏆 Zwyci\u0119zca",
-            value=f"**{aktualna_aukcja.zwyciezca or 'Brak'}**",
+            value=f"**{aukcja.zwyciezca or 'Brak'}**",
             inline=True,
         )
-        if aktualna_aukcja.logo_url:
-            embed.set_thumbnail(url=aktualna_aukcja.logo_url)
-        if aktualna_aukcja.obraz_url:
-            embed.set_image(url=aktualna_aukcja.obraz_url)
-        try:
-            await msg.edit(embed=embed, view=None)
-        except discord.NotFound:
-            pass
-
-        await announce_winner(aktualna_aukcja)
-        await notify_seller_end(aktualna_aukcja)
-
-        if aktualna_aukcja.zwyciezca:
-            try:
-                await msg.channel.send(
-                    f"Gratuluję!\nwygrał: {aktualna_aukcja.zwyciezca}\nczekaj na wiadomość DM"
-                )
-            except discord.HTTPException:
-                pass
+        if aukcja.logo_url:
+            embed.set_thumbnail(url=logo_aukcji(aukcja))
+        if aukcja.obraz_url:
+            embed.set_image(url=obraz_aukcji(aukcja))
 
         if aukcje_kolejka:
             next_text = f"Za chwilę kolejna karta: {aukcje_kolejka[0].nazwa} ({aukcje_kolejka[0].numer})"
         else:
             next_text = "Brak kolejnych kart"
-        try:
+
+        async def wynik_na_kanale():
+            # Two messages in one channel: keep their order
+            if aukcja.zwyciezca:
+                await msg.channel.send(
+                    f"Gratuluję!\nwygrał: {aukcja.zwyciezca}\nczekaj na wiadomość DM"
+                )
             await msg.channel.send(f"Aukcja zakończona. {next_text}")
-        except discord.HTTPException:
-            pass
 
-        if aktualna_aukcja.zwyciezca:
-            zapisz_zamowienie(aktualna_aukcja)
-            bot.loop.create_task(send_order_dm(aktualna_aukcja))
+        async def zamowienie():
+            if aukcja.zwyciezca:
+                await zapisz_zamowienie(aukcja)
 
-        # finalize user bid messages
-        for m in list(user_bid_messages.values()):
-            try:
-                await m.edit(content=f"Aukcja zakończona. Cena końcowa: {aktualna_aukcja.cena:.2f} PLN")
-            except (discord.NotFound, discord.HTTPException):
-                pass
-        user_bid_messages.clear()
+        ledger.submit(
+            ledger.end_auction,
+            aukcja.ledger_id,
+            aukcja.cena,
+            str(aukcja.zwyciezca) if aukcja.zwyciezca else None,
+            getattr(aukcja.zwyciezca, "id", None),
+        )
+        # Everything the viewers and the next lot depend on, sent at once
+        await fanout.run(
+            partial(msg.edit, embed=embed, view=None),
+            partial(announce_winner, aukcja),
+            partial(notify_seller_end, aukcja),
+            wynik_na_kanale,
+            zamowienie,
+        )
+        metrics.AUCTION_CLOSE_SECONDS.observe(time.perf_counter() - started)
+        journal.append({"t": dziennik.END, "id": aukcja_id})
+        trace.record(
+            slad.END, id=aukcja_id, cena=aukcja.cena, zwyciezca=str(aukcja.zwyciezca) if aukcja.zwyciezca else None
+        )
+        trace.flush()
+        ledger.submit(ledger.export_bids, str(BID_COLUMNS_DIR))
+        if aukcja.zwyciezca:
+            asyncio.create_task(send_order_dm(aukcja))
+
+        # Ephemeral bid confirmations are cosmetic; edit them in the background
+        wiadomosci = user_bid_messages.pop(aukcja_id, None)
+        content = f"Aukcja zakończona. Cena końcowa: {aukcja.cena:.2f} PLN"
+        for user_id, m in wiadomosci.items() if wiadomosci else ():
+            # Same key as the bid acks, so a stale "Twoja oferta" edit is not sent after this
+            fanout.defer(
+                f"webhooks/{bot.application_id}", partial(m.edit, content=content), key=f"ack:{aukcja_id}:{user_id}"
+            )
 
-        aktualna_aukcja = None
-        auction_msg = None
+        engine.zwolnij(aukcja_id)
+        deadlines.cancel(aukcja_id)
+        zakonczone += 1
+        metrics.AUCTIONS_ENDED.inc("sold" if aukcja.zwyciezca else "unsold")
+        journal.maybe_checkpoint(stan_dziennika)
         await update_panel_embed()
+        if rownolegle > 1:
+            # Lightning rounds keep every slot busy without the seller pressing a button
+            await uzupelnij_aukcje()
 
 
 class PanelView(discord.ui.View):
@@ -639,6 +1204,46 @@ class PanelView(discord.ui.View):
         await interaction.response.defer()
         await update_panel_embed()
 
+    @discord.ui.button(label='⏭ Pomiń następną', style=discord.ButtonStyle.secondary)
+    async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != ADMIN_ID:
+            await interaction.response.send_message('Brak uprawnień.', ephemeral=True)
+            return
+        aukcja = await pomin_lot()
+        if aukcja is None:
+            await interaction.response.send_message("Brak aukcji w kolejce.", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f'{aukcja.nazwa} ({aukcja.numer}) przeniesiona na koniec kolejki.', ephemeral=True
+        )
+
+    @discord.ui.button(label='↕ Przesuń', style=discord.ButtonStyle.secondary)
+    async def move(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != ADMIN_ID:
+            await interaction.response.send_message('Brak uprawnień.', ephemeral=True)
+            return
+        await interaction.response.send_modal(PrzesunModal())
+
+class PrzesunModal(discord.ui.Modal, title='Przesuń kartę w kolejce'):
+    numer = discord.ui.TextInput(label='Numer karty')
+    pozycja = discord.ui.TextInput(label='Nowa pozycja (1 = następna)', default='1', max_length=6)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        aukcja = aukcje_kolejka.find(self.numer.value.strip())
+        if aukcja is None:
+            await interaction.response.send_message(f'Nie ma karty {self.numer.value} w kolejce.', ephemeral=True)
+            return
+        try:
+            pozycja = int(self.pozycja.value)
+        except ValueError:
+            await interaction.response.send_message('Pozycja musi być liczbą.', ephemeral=True)
+            return
+        await przestaw_lot(aukcja, aukcje_kolejka.move(aukcja, pozycja - 1))
+        await interaction.response.send_message(
+            f'{aukcja.nazwa} ({aukcja.numer}) jest teraz na pozycji {aukcje_kolejka.index(aukcja) + 1}.',
+            ephemeral=True,
+        )
+
 class AnnouncementView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
@@ -651,90 +1256,374 @@ class AnnouncementView(discord.ui.View):
         await start_next_auction(interaction)
 
 class LicytacjaView(discord.ui.View):
-    def __init__(self):
+    def __init__(self, aukcja_id: int):
         super().__init__(timeout=None)
+        self.aukcja_id = aukcja_id
 
     @discord.ui.button(label='🔼 LICYTUJ', style=discord.ButtonStyle.green)
     async def licytuj(self, interaction: discord.Interaction, button: discord.ui.Button):
-        global aktualna_aukcja
-        if not aktualna_aukcja:
-            await interaction.response.send_message("Brak aktywnej aukcji.", ephemeral=True)
+        started = time.perf_counter()
+        try:
+            await self._licytuj(interaction)
+        finally:
+            metrics.BID_HANDLER_SECONDS.observe(time.perf_counter() - started)
+
+    async def _licytuj(self, interaction: discord.Interaction):
+        trace.record(
+            slad.BID, src="discord", u=interaction.user.id, n=str(interaction.user), id=self.aukcja_id
+        )
+        future = engine.push("discord", interaction.user, self.aukcja_id)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), 2.0)
+        except asyncio.TimeoutError:
+            # Held back by the bid limit; Discord wants an answer within 3 s
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            result = await future
+        if not result.accepted:
+            await odpowiedz(interaction, result.reason)
             return
-        if aktualna_aukcja.start_time:
-            end_time = aktualna_aukcja.start_time + datetime.timedelta(seconds=aktualna_aukcja.czas)
-            if datetime.datetime.utcnow() >= end_time:
-                await interaction.response.send_message("Aukcja już zakończona.", ephemeral=True)
-                return
-        aktualna_aukcja.licytuj(interaction.user)
-        zapisz_html(aktualna_aukcja)
-        zapisz_json(aktualna_aukcja)
-        content = f"✅ Twoja oferta: {aktualna_aukcja.cena:.2f} PLN"
-        msg = user_bid_messages.get(interaction.user.id)
-        if msg:
+        content = f"✅ Twoja oferta: {result.cena:.2f} PLN"
+        if result.extended:
+            content += f"\n⏱ Aukcja przedłużona o {result.extended:.0f}s"
+        wiadomosci = user_bid_messages.get(self.aukcja_id)
+        if wiadomosci is None:
+            wiadomosci = user_bid_messages[self.aukcja_id] = TTLMap(BID_MESSAGE_TTL, BOOKKEEPING_MAX)
+        msg = wiadomosci.get(interaction.user.id)
+        if msg and not interaction.response.is_done():
             await interaction.response.defer()
+            # Each interaction message has its own bucket, so no route to wait for;
+            # a newer bid of the same user replaces an edit still queued
+            fanout.defer(
+                "", partial(popraw_potwierdzenie, interaction, msg, content, wiadomosci), Priority.ACK,
+                key=f"ack:{self.aukcja_id}:{interaction.user.id}",
+            )
+        else:
             try:
-                await msg.edit(content=content)
-            except discord.NotFound:
-                msg = None
-        if not msg:
-            await interaction.response.send_message(content, ephemeral=True)
-            try:
-                user_bid_messages[interaction.user.id] = await interaction.original_response()
+                wiadomosci[interaction.user.id] = await odpowiedz(interaction, content)
             except Exception:
-                pass
-        await update_panel_embed()
-        await update_auction_embed()
-        await update_announcement_embed()
+                logging.exception("Bid confirmation failed")
 
 
+async def odpowiedz(interaction: discord.Interaction, content: str):
+    """Ephemeral reply to a button press, also after a deferred ("thinking") response."""
+    if interaction.response.is_done():
+        return await interaction.followup.send(content, ephemeral=True, wait=True)
+    await interaction.response.send_message(content, ephemeral=True)
+    return await interaction.original_response()
+
+
+async def popraw_potwierdzenie(interaction: discord.Interaction, msg, content: str, wiadomosci: TTLMap):
+    """Edit the bidder's earlier confirmation, or post a new one if it is gone."""
+    try:
+        await msg.edit(content=content)
+    except discord.NotFound:
+        wiadomosci[interaction.user.id] = await interaction.followup.send(content, ephemeral=True, wait=True)
+
+
+def on_bids_applied(event: BidsApplied):
+    """Persist and re-render once per batch of applied bids."""
+    zapisz_stan(event.aukcja)
+    bid_log.info(
+        "Auction %s: %s bid(s) applied, price %.2f, leading %s",
+        event.aukcja.ledger_id, len(event.accepted), event.aukcja.cena, event.aukcja.zwyciezca,
+    )
+    ledger.submit(ledger.record_bids, [
+        (
+            event.aukcja.ledger_id,
+            result.seq,
+            intent.source,
+            str(intent.user),
+            getattr(intent.user, "id", None),
+            result.cena,
+            intent.received.isoformat(),
+        )
+        for intent, result in event.accepted
+    ])
+    journal.append(*(
+        {
+            "t": dziennik.BID,
+            "id": event.aukcja.ledger_id,
+            "u": ref_uzytkownika(intent.user),
+            "c": result.cena,
+            "ts": intent.received.isoformat(),
+            "s": result.seq,
+        }
+        for intent, result in event.accepted
+    ))
+    if event.extended:
+        journal.append({
+            "t": dziennik.EXTEND,
+            "id": event.aukcja.ledger_id,
+            "k": koniec_aukcji(event.aukcja.ledger_id),
+            "x": event.aukcja.przedluzenie,
+        })
+    renderer.mark_dirty("panel")
+    renderer.mark_dirty(f"auction:{event.aukcja.ledger_id}")
+    renderer.mark_dirty("announcement")
+
+
+engine.subscribe(on_bids_applied)
+
+
+def on_throttle(what: str, intent, limit: Limit | None):
+    """Zapisz w śladzie, co limit ofert zrobił z ofertą, żeby powtórka postąpiła tak samo."""
+    fields = {"policy": limit.policy} if limit is not None else {}
+    trace.record(
+        slad.LIMIT, what=what, src=intent.source, u=getattr(intent.user, "id", None) or str(intent.user), **fields
+    )
+
+
+engine.on_throttle = on_throttle
+
+metrics.REGISTRY.gauge("auction_queue_length", "Lots waiting in the queue.", lambda: len(aukcje_kolejka))
+metrics.REGISTRY.gauge("auction_bid_seq", "Sequence number of the last applied bid.", lambda: engine.seq)
+metrics.REGISTRY.gauge("auctions_running", "Auctions currently accepting bids.", lambda: len(engine.aukcje))
+if images:
+    metrics.REGISTRY.gauge("image_cache_bytes", "Size of the local card image cache.", lambda: images.total_bytes)
+for _faza in ("import", "setup", "login", "gateway", "recovery"):
+    metrics.REGISTRY.gauge(
+        f"bot_startup_{_faza}_seconds", f"Duration of the {_faza} phase of the last start.",
+        partial(lambda faza: startup.phases.get(faza, 0.0), _faza),
+    )
+if overlay:
+    metrics.REGISTRY.gauge("overlay_clients", "Overlays connected to /events.", lambda: overlay.clients)
+
 
 @tasks.loop(seconds=1)
 async def refresh_panel():
     await update_panel_embed()
 
-@tasks.loop(seconds=5)
-async def check_youtube_chat():
-    global yt_page_token
-    if not youtube or not LIVE_CHAT_ID or not aktualna_aukcja:
-        return
-    try:
-        resp = youtube.liveChatMessages().list(
-            liveChatId=LIVE_CHAT_ID,
-            part="snippet,authorDetails",
-            pageToken=yt_page_token
-        ).execute()
-        yt_page_token = resp.get("nextPageToken")
-        for item in resp.get("items", []):
-            msg_text = item["snippet"]["displayMessage"].lower()
-            if "!bit" in msg_text:
-                user = item["authorDetails"]["displayName"]
-                aktualna_aukcja.licytuj(user)
-                zapisz_html(aktualna_aukcja)
-                zapisz_json(aktualna_aukcja)
-                await update_panel_embed()
-                await update_auction_embed()
-                await update_announcement_embed()
-    except Exception:
-        pass
+@tasks.loop(seconds=0.5)
+async def refresh_countdowns():
+    """Odśwież odliczanie; sekundy czytane są z harmonogramu terminów."""
+    for aukcja_id in auction_msgs:
+        await update_auction_embed(aukcja_id)
+    if auction_msgs:
+        await update_announcement_embed()
+
+def push_chat_bids(bids: list[ChatBid]):
+    """Queue every !bit read from a chat at once so the engine applies them as one batch."""
+    trace.record(slad.BID, src=bids[0].user.source, u=[bid.user.name for bid in bids])
+    for bid in bids:
+        future = engine.push(bid.user.source, bid.user)
+        if bid.sent is not None:
+            future.add_done_callback(partial(chat_bid_applied, bid))
+
+
+def chat_bid_applied(bid: ChatBid, _future: asyncio.Future):
+    metrics.CHAT_BID_SECONDS.observe(max(0.0, time.time() - bid.sent), bid.user.source)
+
+
+youtube_poller = (
+    YouTubeChatPoller(
+        # Built in the polling thread on the first poll, not at import
+        partial(build_client, YOUTUBE_API_KEY),
+        LIVE_CHAT_ID,
+        push_chat_bids,
+        lambda: engine.aktualna is not None,
+        quota_limit=YOUTUBE_QUOTA_LIMIT,
+    )
+    if YOUTUBE_API_KEY and LIVE_CHAT_ID
+    else None
+)
+if youtube_poller:
+    metrics.REGISTRY.gauge(
+        "youtube_quota_units_used", "YouTube Data API units spent today.",
+        lambda: youtube_poller.quota_used,
+    )
+
+chat_sources: list[ChatSource] = []
+if youtube_poller and YOUTUBE_CHAT_STREAM:
+    chat_sources.append(YouTubeStreamSource(
+        YOUTUBE_API_KEY, LIVE_CHAT_ID, push_chat_bids, YOUTUBE_API_URL, fallback=youtube_poller,
+    ))
+if TWITCH_CHANNEL:
+    chat_sources.append(TwitchChatSource(TWITCH_CHANNEL, push_chat_bids, TWITCH_NICK, TWITCH_TOKEN, TWITCH_IRC))
 
 
 @bot.event
-async def on_reaction_add(reaction, user):
-    if user.bot:
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    # Raw event, so reactions on messages sent before a restart are seen too
+    if bot.user and payload.user_id == bot.user.id:
+        return
+    if str(payload.emoji) != "✅":
         return
-    if reaction.message.id in pending_orders and str(reaction.emoji) == "✅" and user.id == ADMIN_ID:
-        aukcja = pending_orders.pop(reaction.message.id)
-        if isinstance(aukcja.zwyciezca, discord.User):
+    if payload.message_id in pending_orders and payload.user_id == ADMIN_ID:
+        aukcja = pending_orders.pop(payload.message_id)
+        journal.append({"t": dziennik.ORDER_DONE, "m": payload.message_id})
+        ledger.submit(ledger.set_order_status, aukcja.order_number, "potwierdzone")
+        zwyciezca = await uzytkownik_discord(aukcja.zwyciezca)
+        if zwyciezca is not None:
             try:
-                await aukcja.zwyciezca.send(
+                await zwyciezca.send(
                     f"✅ Twoje zamówienie {aukcja.order_number} zostało potwierdzone.\nWkrótce karta trafi do wysyłki. Dzięki za udział w licytacji!"
                 )
             except discord.Forbidden:
                 pass
-    if reaction.message.id in pending_ok and str(reaction.emoji) == "✅" and user == pending_ok.get(reaction.message.id):
-        pending_ok.pop(reaction.message.id, None)
+    owner_id = pending_ok.get(payload.message_id)
+    if owner_id is not None and payload.user_id == owner_id:
+        pending_ok.pop(payload.message_id, None)
+        journal.append({"t": dziennik.OK_DONE, "m": payload.message_id})
         channel = bot.get_channel(SELLER_CHANNEL_ID)
         if channel:
-            await channel.send(f"Użytkownik {user} zaznaczył OK.")
+            await channel.send(f"Użytkownik {bot.get_user(owner_id) or owner_id} zaznaczył OK.")
+
+
+def ref_uzytkownika(user) -> list | None:
+    """Zapisywalna referencja do licytującego: [źródło, id, nazwa]."""
+    if user is None:
+        return None
+    ref = uczestnicy.intern(user)
+    return [ref.source, ref.id, ref.name]
+
+
+async def uzytkownik_discord(ref: UserRef | None) -> discord.abc.User | None:
+    """Użytkownik Discorda dla referencji albo None (np. widz z YouTube)."""
+    if ref is None or ref.id is None:
+        return None
+    user = bot.get_user(ref.id)
+    if user is None:
+        try:
+            user = await bot.fetch_user(ref.id)
+        except discord.HTTPException:
+            user = None
+    return user
+
+
+def lot_do_dziennika(aukcja: Aukcja) -> list:
+    return [aukcja.nazwa, aukcja.numer, aukcja.opis, aukcja.cena, aukcja.przebicie, aukcja.czas]
+
+
+def aukcja_do_dziennika(aukcja: Aukcja, historia: bool = True) -> dict:
+    return {
+        "lot": lot_do_dziennika(aukcja),
+        "cena": aukcja.cena,
+        "start": aukcja.start_time.isoformat() if aukcja.start_time else None,
+        "koniec": koniec_aukcji(aukcja.ledger_id) if aukcja.ledger_id is not None else None,
+        "przedluzenie": aukcja.przedluzenie,
+        "zalaczniki": aukcja.zalaczniki,
+        "ledger_id": aukcja.ledger_id,
+        "obraz": aukcja.obraz_url,
+        "logo": aukcja.logo_url,
+        "order_number": aukcja.order_number,
+        "payment_method": aukcja.payment_method,
+        "zwyciezca": ref_uzytkownika(aukcja.zwyciezca),
+        "historia": aukcja.historia.to_rows() if historia else [],
+    }
+
+
+def aukcja_z_dziennika(dane: dict) -> Aukcja:
+    aukcja = Aukcja(*dane["lot"])
+    aukcja.cena = dane["cena"]
+    if dane["start"]:
+        aukcja.start_time = datetime.datetime.fromisoformat(dane["start"])
+    aukcja.przedluzenie = dane.get("przedluzenie", 0.0)
+    if dane.get("zalaczniki"):
+        aukcja.zalaczniki = tuple(dane["zalaczniki"])
+    aukcja.ledger_id = dane["ledger_id"]
+    aukcja.obraz_url = dane["obraz"]
+    aukcja.logo_url = dane["logo"]
+    aukcja.order_number = dane["order_number"]
+    aukcja.payment_method = dane["payment_method"]
+    aukcja.zwyciezca = uczestnicy.ref(*dane["zwyciezca"]) if dane["zwyciezca"] else None
+    aukcja.historia = BidHistory.from_rows(dane["historia"])
+    return aukcja
+
+
+def stan_dziennika() -> dict:
+    """Pełny stan do skompaktowanego punktu kontrolnego dziennika."""
+    aukcje = {}
+    for aukcja_id, aukcja in engine.aukcje.items():
+        dane = aukcje[str(aukcja_id)] = aukcja_do_dziennika(aukcja)
+        msg = auction_msgs.get(aukcja_id)
+        if msg:
+            dane["msg"] = [msg.channel.id, msg.id]
+    return {
+        "queue": [lot_do_dziennika(a) for a in aukcje_kolejka],
+        "priority": aukcje_kolejka.priority,
+        "taken": [[lot_do_dziennika(a), p] for a, p in pobrane.values()],
+        "aukcje": aukcje,
+        "pending_orders": {
+            str(m): aukcja_do_dziennika(a, historia=False) for m, a in pending_orders.items()
+        },
+        "pending_ok": {str(m): user_id for m, user_id in pending_ok.items()},
+        "seq": engine.seq,
+    }
+
+
+async def przywroc_stan():
+    """Odtwórz kolejkę, trwającą aukcję i oczekujące potwierdzenia z dziennika."""
+    stan = journal.recover()
+    journal.open()
+    if TRACE_DIR:
+        trace.open(
+            session=SESSION_ID,
+            rownolegle=rownolegle,
+            soft_close=[SOFT_CLOSE_WINDOW, SOFT_CLOSE_EXTEND, SOFT_CLOSE_MAX],
+            render_min_interval=RENDER_MIN_INTERVAL,
+            bid_limits={
+                name: [limit.rate, limit.burst, limit.policy]
+                for name, limit in (("discord", BID_LIMIT_DISCORD), ("youtube", BID_LIMIT_YOUTUBE),
+                                    ("twitch", BID_LIMIT_TWITCH),
+                                    ("total", BID_LIMIT_TOTAL))
+            },
+            recovered=len(stan["queue"]) + len(stan["aukcje"]),
+        )
+    aukcje_kolejka.clear()
+    aukcje_kolejka.extend((Aukcja(*lot) for lot in stan["queue"]), stan["priority"])
+    engine.seq = stan["seq"]
+    for m, dane in stan["pending_orders"].items():
+        pending_orders[int(m)] = aukcja_z_dziennika(dane)
+    for m, user_id in stan["pending_ok"].items():
+        pending_ok[int(m)] = user_id
+    wznowione = []
+    for dane in stan["aukcje"].values():
+        aukcja = aukcja_z_dziennika(dane)
+        aukcja_id = aukcja.ledger_id
+        engine.rozpocznij(aukcja)
+        renderer.register(
+            f"auction:{aukcja_id}", partial(render_auction, aukcja_id), partial(send_auction, aukcja_id)
+        )
+        msg = None
+        if dane.get("msg"):
+            channel_id, message_id = dane["msg"]
+            channel = bot.get_channel(channel_id)
+            try:
+                msg = await channel.fetch_message(message_id)
+                # Button ids do not survive a restart, attach a fresh view
+                await msg.edit(view=LicytacjaView(aukcja_id))
+            except (AttributeError, discord.HTTPException):
+                msg = None
+        if msg is None:
+            # A new message has none of the old attachments
+            aukcja.zalaczniki = None
+            channel = bot.get_channel(kanal_aukcji())
+            msg = await channel.send(
+                embed=discord.Embed(title=f"🎴 {aukcja.nazwa} ({aukcja.numer})"),
+                view=LicytacjaView(aukcja_id),
+            )
+        auction_msgs[aukcja_id] = msg
+        if dane.get("koniec"):
+            koniec = datetime.datetime.fromisoformat(dane["koniec"])
+        else:
+            # Journals from before the deadline scheduler only had the start time
+            koniec = aukcja.start_time + datetime.timedelta(seconds=aukcja.czas)
+        pozostalo = max((koniec - datetime.datetime.utcnow()).total_seconds(), 0)
+        logging.info("Resuming %s (%s) with %.0fs left", aukcja.nazwa, aukcja.numer, pozostalo)
+        wznowione.append((aukcja_id, pozostalo))
+    for aukcja_id, pozostalo in wznowione:
+        deadlines.schedule(aukcja_id, time.monotonic() + pozostalo)
+    # Compact the replayed journal so the next start replays nothing
+    journal.checkpoint(stan_dziennika())
+    if wznowione:
+        await update_panel_embed()
+
+
+startup.mark("setup")
+
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    if not TOKEN:
+        raise RuntimeError("DISCORD_TOKEN is not set")
+    # discord.py would add its own synchronous handler to the root logger
+    bot.run(TOKEN, log_handler=None)
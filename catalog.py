@@ -0,0 +1,107 @@
+import asyncio
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+
+KOLUMNY = (
+    "nazwa_karty",
+    "numer_karty",
+    "opis",
+    "cena_początkowa",
+    "kwota_przebicia",
+    "czas_trwania",
+)
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+    def __str__(self):
+        return f"wiersz {self.line}: {self.message}"
+
+
+def _liczba(row: dict, column: str) -> float:
+    raw = (row.get(column) or "").strip()
+    try:
+        # Support both comma and dot as decimal separators
+        value = float(raw.replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{column} nie jest liczbą: {raw!r}") from None
+    if value != value or value in (float("inf"), float("-inf")):
+        raise ValueError(f"{column} nie jest liczbą: {raw!r}")
+    return value
+
+
+def parse_row(row: dict) -> list:
+    """Validate one CSV row and return it as ``[nazwa, numer, opis, cena, przebicie, czas]``."""
+    nazwa = (row.get("nazwa_karty") or "").strip()
+    if not nazwa:
+        raise ValueError("brak nazwa_karty")
+    numer = (row.get("numer_karty") or "").strip()
+    cena = _liczba(row, "cena_początkowa")
+    if cena < 0:
+        raise ValueError("cena_początkowa jest ujemna")
+    przebicie = _liczba(row, "kwota_przebicia")
+    if przebicie <= 0:
+        raise ValueError("kwota_przebicia musi być większa od zera")
+    czas = (row.get("czas_trwania") or "").strip()
+    try:
+        czas = int(czas)
+    except ValueError:
+        raise ValueError(f"czas_trwania nie jest liczbą całkowitą: {czas!r}") from None
+    if czas <= 0:
+        raise ValueError("czas_trwania musi być większy od zera")
+    return [nazwa, numer, (row.get("opis") or "").strip(), cena, przebicie, czas]
+
+
+class CatalogReader:
+    """Parse a catalog CSV in batches on a worker thread.
+
+    ``async for lots in reader.batches()`` yields lists of at most ``batch_size``
+    validated lots; rows that fail validation are collected in ``errors``
+    and skipped, so one bad price does not abort a 50k-row catalog.
+    """
+
+    def __init__(self, path: Path, batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self.errors: list[RowError] = []
+        self.rows = 0
+        self.loaded = 0
+
+    def _open(self):
+        f = open(self.path, newline="", encoding="utf-8-sig")
+        reader = csv.DictReader(f)
+        missing = [c for c in KOLUMNY if c not in (reader.fieldnames or ())]
+        if missing:
+            f.close()
+            raise ValueError(f"Brak kolumn w {self.path}: {', '.join(missing)}")
+        return f, reader
+
+    def _batch(self, reader) -> list:
+        lots = []
+        for row in reader:
+            self.rows += 1
+            try:
+                lots.append(parse_row(row))
+            except ValueError as e:
+                self.errors.append(RowError(reader.line_num, str(e)))
+            if len(lots) >= self.batch_size:
+                break
+        self.loaded += len(lots)
+        return lots
+
+    async def batches(self):
+        f, reader = await asyncio.to_thread(self._open)
+        try:
+            while True:
+                lots = await asyncio.to_thread(self._batch, reader)
+                if lots:
+                    yield lots
+                if len(lots) < self.batch_size:
+                    # A short batch means the reader hit the end of the file
+                    return
+        finally:
+            f.close()
@@ -0,0 +1,328 @@
+"""Live chats that bids come from, behind one interface.
+
+Every source keeps its own connection, picks ``!bit`` messages with
+:func:`is_bid` and hands their authors to a single ``on_bids`` callback as a
+list of :class:`ChatBid`. Authors are :class:`ChatUser` values keyed by
+platform and display name, so the bid path, rate limits, journal and ledger
+treat a YouTube or Twitch viewer the same way. ``url`` points a source at a
+local stand-in (``benchmarks/fakes.py``) instead of the real service.
+"""
+import asyncio
+import codecs
+import datetime
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+
+# "!bit" as a word of its own: "!bit", "!BIT 50", "ok !bit!" but not "!bitcoin"
+BID_COMMAND = re.compile(r"(?<!\S)!bit(?![\w-])", re.IGNORECASE)
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+# A connection closed after this many seconds is reopened at once
+STABLE_SECONDS = 10.0
+
+
+def is_bid(text: str) -> bool:
+    return BID_COMMAND.search(text) is not None
+
+
+@dataclass(frozen=True, slots=True)
+class ChatUser:
+    """A chat author; the same platform and name is the same bidder."""
+
+    source: str
+    name: str
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass(slots=True)
+class ChatBid:
+    user: ChatUser
+    sent: float | None = None   # Unix time the message was posted, if the chat says
+
+
+class ChatSource:
+    """A persistent chat connection, reopened with exponential backoff.
+
+    Subclasses implement :meth:`read`, which connects, calls :meth:`online`
+    once the chat is joined and :meth:`emit` for every batch of bids, and
+    returns or raises when the connection ends.
+    """
+
+    name = "chat"
+
+    def __init__(self, on_bids: Callable[[list[ChatBid]], None]):
+        self.on_bids = on_bids
+        self.connected = False
+        self.connects = 0
+        self.messages = 0
+        self.bids = 0
+        self.errors = 0
+        self.backoff = 0.0
+        self._since = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.read() is False:
+                    return
+                # Servers close long-lived connections now and then; bids must not wait for that
+                stable = self.connected and time.monotonic() - self._since >= STABLE_SECONDS
+                delay = 0.0 if stable else MIN_BACKOFF
+                logging.info("%s chat connection closed, reconnecting", self.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.backoff = delay = min(max(self.backoff * 2, MIN_BACKOFF), MAX_BACKOFF)
+                logging.warning("%s chat connection failed, retrying in %.0fs: %s", self.name, self.backoff, e)
+            finally:
+                self.connected = False
+            await asyncio.sleep(delay)
+
+    async def read(self) -> bool | None:
+        """Read the chat until the connection ends; False stops the source for good."""
+        raise NotImplementedError
+
+    def online(self):
+        self.connected = True
+        self.connects += 1
+        self.backoff = 0.0
+        self._since = time.monotonic()
+
+    def emit(self, bids: list[ChatBid]):
+        if not bids:
+            return
+        self.bids += len(bids)
+        now = time.time()
+        for bid in bids:
+            if bid.sent is not None:
+                metrics.CHAT_LAG_SECONDS.observe(max(0.0, now - bid.sent), self.name)
+        self.on_bids(bids)
+
+    def status(self) -> str:
+        """One line for ``/statystyki``."""
+        stan = "połączony" if self.connected else "rozłączony"
+        return (
+            f"{self.name}: {stan}, połączenia {self.connects}, wiadomości {self.messages}, "
+            f"oferty {self.bids}, błędy {self.errors}"
+        )
+
+
+class _JsonObjects:
+    """Split a streamed body into JSON objects, with or without an enclosing array."""
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk: bytes) -> list:
+        self._buffer += self._text.decode(chunk)
+        objects = []
+        pos = 0
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in " \t\r\n,[]":
+                pos += 1
+            if pos == len(self._buffer):
+                break
+            try:
+                obj, pos = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break   # the rest of the object is still on its way
+            objects.append(obj)
+        self._buffer = self._buffer[pos:]
+        return objects
+
+
+class YouTubeStreamSource(ChatSource):
+    """YouTube live chat over the ``liveChatMessages.streamList`` endpoint.
+
+    The response stays open and carries each new page of messages as soon as
+    it is posted, so there is no polling interval to wait out. Where the
+    endpoint is not available (an HTTP 404/405/501) the source stops and
+    starts ``fallback``, the polling :class:`~youtube_chat.YouTubeChatPoller`.
+    """
+
+    name = "youtube"
+    path = "/youtube/v3/liveChat/messages/stream"
+    unavailable = (404, 405, 501)
+    # A quiet chat may send nothing for a while, a dead connection never does
+    idle_timeout = 300
+
+    def __init__(
+        self,
+        api_key: str,
+        live_chat_id: str,
+        on_bids: Callable[[list[ChatBid]], None],
+        url: str = "https://youtube.googleapis.com",
+        fallback=None,
+    ):
+        super().__init__(on_bids)
+        self.api_key = api_key
+        self.live_chat_id = live_chat_id
+        self.url = url.rstrip("/")
+        self.fallback = fallback
+        self.page_token: str | None = None
+        self.ended = False
+
+    async def read(self):
+        params = {"liveChatId": self.live_chat_id, "part": "snippet,authorDetails", "key": self.api_key}
+        if self.page_token:
+            params["pageToken"] = self.page_token
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.idle_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(self.url + self.path, params=params) as resp:
+                if resp.status in self.unavailable and self.fallback is not None:
+                    logging.warning("YouTube chat streaming unavailable (%s), polling instead", resp.status)
+                    self.fallback.start()
+                    return False
+                resp.raise_for_status()
+                self.online()
+                objects = _JsonObjects()
+                async for chunk in resp.content.iter_any():
+                    for page in objects.feed(chunk):
+                        self._page(page)
+                    if self.ended:
+                        logging.info("YouTube live chat ended")
+                        return False
+
+    def _page(self, page: dict):
+        if "error" in page:
+            raise RuntimeError(page["error"].get("message", page["error"]))
+        self.page_token = page.get("nextPageToken", self.page_token)
+        items = page.get("items", [])
+        self.messages += len(items)
+        bids = []
+        for item in items:
+            snippet = item.get("snippet", {})
+            if not is_bid(snippet.get("displayMessage", "")):
+                continue
+            published = snippet.get("publishedAt")
+            bids.append(ChatBid(
+                ChatUser("youtube", item["authorDetails"]["displayName"]),
+                datetime.datetime.fromisoformat(published.replace("Z", "+00:00")).timestamp() if published else None,
+            ))
+        self.emit(bids)
+        if page.get("offlineAt"):
+            self.ended = True
+
+
+def _irc_tag(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: {"s": " ", ":": ";", "r": "\r", "n": "\n"}.get(m.group(1), m.group(1)), value)
+
+
+def parse_irc(line: str) -> tuple[dict, str, str, list[str]]:
+    """Split an IRC line into ``(tags, prefix, command, params)``."""
+    tags = {}
+    if line.startswith("@"):
+        raw, line = line[1:].split(" ", 1)
+        for tag in raw.split(";"):
+            key, _, value = tag.partition("=")
+            tags[key] = _irc_tag(value)
+    prefix = ""
+    if line.startswith(":"):
+        prefix, line = line[1:].split(" ", 1)
+    line, colon, trailing = line.partition(" :")
+    params = line.split()
+    command = params.pop(0) if params else ""
+    if colon:
+        params.append(trailing)
+    return tags, prefix, command, params
+
+
+class TwitchChatSource(ChatSource):
+    """Twitch chat over one persistent IRC connection.
+
+    Without ``nick``/``token`` it logs in anonymously, which is enough to read
+    a channel. Display names come from IRC tags; the time Twitch received
+    the message (``tmi-sent-ts``) is kept to measure the delay to the auction.
+    """
+
+    name = "twitch"
+    # Twitch pings about every five minutes; nothing for longer means a dead link
+    idle_timeout = 360
+
+    def __init__(
+        self,
+        channel: str,
+        on_bids: Callable[[list[ChatBid]], None],
+        nick: str | None = None,
+        token: str | None = None,
+        url: str = "ircs://irc.chat.twitch.tv:6697",
+    ):
+        super().__init__(on_bids)
+        self.channel = channel.lstrip("#").lower()
+        self.nick = (nick or f"justinfan{random.randint(10000, 99999)}").lower()
+        self.token = token
+        self.url = url
+        self._writer: asyncio.StreamWriter | None = None
+
+    def _send(self, line: str):
+        self._writer.write(line.encode("utf-8") + b"\r\n")
+
+    async def read(self):
+        url = urlsplit(self.url)
+        secure = url.scheme == "ircs"
+        reader, self._writer = await asyncio.open_connection(
+            url.hostname, url.port or (6697 if secure else 6667), ssl=secure or None, limit=2**16
+        )
+        try:
+            self._send("CAP REQ :twitch.tv/tags twitch.tv/commands")
+            if self.token:
+                self._send(f"PASS oauth:{self.token.removeprefix('oauth:')}")
+            self._send(f"NICK {self.nick}")
+            self._send(f"JOIN #{self.channel}")
+            await self._writer.drain()
+            while True:
+                raw = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                if not raw:
+                    return
+                self._line(raw.decode("utf-8", "replace").rstrip("\r\n"))
+        finally:
+            self._writer.close()
+            self._writer = None
+
+    def _line(self, line: str):
+        if not line:
+            return
+        tags, prefix, command, params = parse_irc(line)
+        if command == "PRIVMSG" and len(params) == 2:
+            self.messages += 1
+            if is_bid(params[1]):
+                sent = tags.get("tmi-sent-ts")
+                name = tags.get("display-name") or prefix.split("!", 1)[0]
+                self.emit([ChatBid(ChatUser("twitch", name), int(sent) / 1000 if sent else None)])
+        elif command == "PING":
+            self._send(f"PONG :{params[-1] if params else 'tmi.twitch.tv'}")
+        elif command == "JOIN" and prefix.split("!", 1)[0] == self.nick:
+            logging.info("Joined Twitch chat #%s", self.channel)
+            self.online()
+        elif command == "RECONNECT":
+            raise ConnectionError("Twitch asked to reconnect")
+        elif command == "NOTICE" and params and "authentication failed" in params[-1].lower():
+            raise PermissionError(params[-1])
@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+import metrics
+
+
+@dataclass
+class SoftClose:
+    """Anti-sniping rule: a bid in the last ``window`` seconds leaves at least
+    ``extend`` seconds on the clock, up to ``limit`` seconds in total per auction
+    (0 = no limit). A ``window`` of 0 disables it.
+    """
+
+    window: float = 0.0
+    extend: float = 0.0
+    limit: float = 0.0
+
+    def extension(self, remaining: float, extended: float) -> float:
+        """Seconds to add to the deadline for a bid with ``remaining`` seconds left."""
+        if self.window <= 0 or remaining >= self.window:
+            return 0.0
+        added = self.extend - remaining
+        if self.limit:
+            added = min(added, self.limit - extended)
+        return max(added, 0.0)
+
+
+class DeadlineScheduler:
+    """Call ``on_expire(key)`` once the ``time.monotonic()`` deadline of ``key`` passes.
+
+    All deadlines share one task that sleeps until the earliest of them, so
+    waiting costs the same for one auction or a hundred, and an auction ends
+    on time no matter how long rendering or Discord edits take. Moving a
+    deadline leaves its old heap entry behind; stale entries are skipped.
+    An expired key keeps its deadline until :meth:`cancel`, so late bids can
+    still be checked against it.
+    """
+
+    def __init__(self, on_expire: Callable[[Hashable], None]):
+        self.on_expire = on_expire
+        self._deadlines: dict[Hashable, float] = {}
+        self._expired: set = set()
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def schedule(self, key: Hashable, deadline: float) -> bool:
+        """Set or move the deadline of ``key``; False if it has already expired."""
+        if key in self._expired:
+            return False
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        self._changed.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+        self._expired.discard(key)
+        self._changed.set()
+
+    def deadline(self, key: Hashable) -> float | None:
+        return self._deadlines.get(key)
+
+    def remaining(self, key: Hashable) -> float | None:
+        deadline = self._deadlines.get(key)
+        return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines) - len(self._expired)
+
+    def _stale(self, entry: tuple) -> bool:
+        deadline, _n, key = entry
+        return key in self._expired or self._deadlines.get(key) != deadline
+
+    async def _run(self):
+        while True:
+            while self._heap and self._stale(self._heap[0]):
+                heapq.heappop(self._heap)
+            self._changed.clear()
+            if not self._heap:
+                await self._changed.wait()
+                continue
+            deadline, _n, key = self._heap[0]
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            self._expired.add(key)
+            metrics.AUCTION_END_LATENESS.observe(-wait)
+            try:
+                self.on_expire(key)
+            except Exception:
+                logging.exception("Deadline callback for %s failed", key)
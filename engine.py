@@ -0,0 +1,270 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import metrics
+from deadlines import DeadlineScheduler, SoftClose
+from throttle import BidThrottle, Limit
+
+
+@dataclass
+class BidIntent:
+    """A request to raise the price, queued until the engine applies it."""
+
+    source: str
+    user: Any
+    aukcja_id: int | None = None
+    received: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    future: asyncio.Future | None = None
+    # Compared with the deadline; ``received`` is only recorded
+    at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class BidResult:
+    accepted: bool
+    cena: float | None = None
+    seq: int | None = None
+    reason: str | None = None
+    extended: float = 0.0   # seconds the bid added to the deadline (soft close)
+
+
+@dataclass
+class BidsApplied:
+    """State-change event published once per processed batch."""
+
+    aukcja: Any
+    results: list[tuple[BidIntent, BidResult]]
+
+    @property
+    def accepted(self) -> list[tuple[BidIntent, BidResult]]:
+        return [(i, r) for i, r in self.results if r.accepted]
+
+    @property
+    def extended(self) -> float:
+        return sum(r.extended for _i, r in self.results)
+
+
+def _bidder(user):
+    user_id = getattr(user, "id", None)
+    return user_id if user_id is not None else str(user)
+
+
+class _Close:
+    def __init__(self, aukcja_id: int, future: asyncio.Future):
+        self.aukcja_id = aukcja_id
+        self.future = future
+
+
+class AuctionEngine:
+    """Single writer of auction state.
+
+    Every bid source only pushes :class:`BidIntent` objects into the queue;
+    the engine applies them strictly in arrival order, numbers accepted bids
+    with a monotonically increasing sequence and publishes one
+    :class:`BidsApplied` event per auction per batch.
+
+    Several auctions can run at once; they are keyed by ``ledger_id`` and a
+    bid without an explicit auction goes to the oldest running one. Bids are
+    checked against the auction's deadline in ``deadlines``, and a late bid
+    moves that deadline according to ``soft_close``.
+
+    Bids over a ``throttle`` limit never reach the queue: they are refused,
+    or held back until the limit allows them (see :data:`throttle.POLICIES`).
+    """
+
+    def __init__(
+        self,
+        deadlines: DeadlineScheduler | None = None,
+        soft_close: SoftClose | None = None,
+        throttle: BidThrottle | None = None,
+        max_held: int = 1000,
+    ):
+        self.deadlines = deadlines
+        self.soft_close = soft_close or SoftClose()
+        self.throttle = throttle
+        self.max_held = max_held
+        self._held: deque[BidIntent] = deque()
+        self._merged: dict[tuple, BidIntent] = {}
+        self._release_task: asyncio.Task | None = None
+        # Told ("held", "merged", "rejected" or "released") about every bid the throttle
+        # stops or lets go, with the limit it exceeded; the session trace records these
+        self.on_throttle: Callable[[str, BidIntent, Limit | None], None] | None = None
+        self.aukcje: dict[int, Any] = {}
+        self._otwarte: set[int] = set()
+        self.seq = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._listeners: list[Callable[[BidsApplied], None]] = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, listener: Callable[[BidsApplied], None]):
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    @property
+    def aktualna(self):
+        """The oldest running auction, or ``None``."""
+        return next(iter(self.aukcje.values()), None)
+
+    def otwarta(self, aukcja_id: int) -> bool:
+        return aukcja_id in self._otwarte
+
+    def rozpocznij(self, aukcja):
+        """Start accepting bids for ``aukcja``."""
+        self.aukcje[aukcja.ledger_id] = aukcja
+        self._otwarte.add(aukcja.ledger_id)
+
+    def zwolnij(self, aukcja_id: int):
+        """Forget a closed auction once its results have been announced."""
+        self.aukcje.pop(aukcja_id, None)
+        self._otwarte.discard(aukcja_id)
+
+    def push(self, source: str, user, aukcja_id: int | None = None) -> asyncio.Future:
+        """Queue a bid and return a future resolved with its :class:`BidResult`."""
+        future = asyncio.get_running_loop().create_future()
+        intent = BidIntent(source, user, aukcja_id, future=future)
+        if self.throttle is None:
+            self._queue.put_nowait(intent)
+        else:
+            self._admit(intent)
+        return future
+
+    @property
+    def held(self) -> int:
+        """Bids waiting for the throttle to let them through."""
+        return len(self._held)
+
+    def _admit(self, intent: BidIntent):
+        key = (intent.source, _bidder(intent.user))
+        limit = self.throttle.admit(*key)
+        if limit is None:
+            self._queue.put_nowait(intent)
+            return
+        if limit.policy == "merge" and key in self._merged:
+            # Answered together with the bid of this user that is already waiting
+            self._throttled("merged", intent, limit)
+            self._merged[key].future.add_done_callback(
+                lambda f: intent.future.done() or intent.future.set_result(f.result())
+            )
+            return
+        if limit.policy == "reject" or len(self._held) >= self.max_held:
+            self._throttled("rejected", intent, limit)
+            metrics.BIDS.inc(intent.source, "rejected")
+            intent.future.set_result(BidResult(False, reason="Za szybko! Odczekaj chwilę przed kolejną ofertą."))
+            return
+        if intent.aukcja_id is None and self.aktualna is not None:
+            # A held chat bid is for the lot running now, not whatever runs when it is let through
+            intent.aukcja_id = self.aktualna.ledger_id
+        if limit.policy == "merge":
+            self._merged[key] = intent
+        self._throttled("held", intent, limit)
+        self._held.append(intent)
+        if self._release_task is None or self._release_task.done():
+            self._release_task = asyncio.create_task(self._release())
+
+    def _throttled(self, what: str, intent: BidIntent, limit: Limit | None):
+        if self.on_throttle is not None:
+            self.on_throttle(what, intent, limit)
+
+    def release_held(self) -> float | None:
+        """Pass on the held bids their limits allow now, oldest first.
+
+        Returns the seconds until the next one may go, or ``None`` if none is left.
+        """
+        waits = []
+        for intent in list(self._held):
+            key = (intent.source, _bidder(intent.user))
+            if self.throttle.admit(*key, count=False) is None:
+                self._held.remove(intent)
+                if self._merged.get(key) is intent:
+                    del self._merged[key]
+                self._throttled("released", intent, None)
+                self._queue.put_nowait(intent)
+            else:
+                waits.append(self.throttle.wait(*key))
+        return min(waits) if waits else None
+
+    async def _release(self):
+        while (wait := self.release_held()) is not None:
+            # Capped so a bid held meanwhile with a shorter wait is not kept longer
+            await asyncio.sleep(min(max(wait, 0.01), 0.1))
+
+    async def licytuj(self, source: str, user, aukcja_id: int | None = None) -> BidResult:
+        return await self.push(source, user, aukcja_id)
+
+    async def zakoncz(self, aukcja_id: int):
+        """Apply every bid queued so far, then stop accepting bids for ``aukcja_id``.
+
+        Returns the closed auction; it stays in :attr:`aukcje` until
+        :meth:`zwolnij` is called.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Close(aukcja_id, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                self._process(batch)
+            except Exception:
+                logging.exception("Bid batch failed")
+
+    def _process(self, batch: list):
+        results: dict[int, list] = {}
+        for item in batch:
+            if isinstance(item, _Close):
+                self._publish(item.aukcja_id, results.pop(item.aukcja_id, []))
+                self._otwarte.discard(item.aukcja_id)
+                item.future.set_result(self.aukcje.get(item.aukcja_id))
+                continue
+            aukcja_id, result = self._apply(item)
+            results.setdefault(aukcja_id, []).append((item, result))
+            if item.future is not None and not item.future.done():
+                item.future.set_result(result)
+        for aukcja_id, applied in results.items():
+            self._publish(aukcja_id, applied)
+
+    def _apply(self, intent: BidIntent) -> tuple[int | None, BidResult]:
+        aukcja = self.aukcje.get(intent.aukcja_id) if intent.aukcja_id is not None else self.aktualna
+        result = self._check(intent, aukcja)
+        metrics.BIDS.inc(intent.source, "accepted" if result.accepted else "rejected")
+        return (aukcja.ledger_id if aukcja is not None else None), result
+
+    def _check(self, intent: BidIntent, aukcja) -> BidResult:
+        if aukcja is None:
+            return BidResult(False, reason="Brak aktywnej aukcji.")
+        if aukcja.ledger_id not in self._otwarte:
+            return BidResult(False, aukcja.cena, reason="Aukcja już zakończona.")
+        koniec = self.deadlines.deadline(aukcja.ledger_id) if self.deadlines else None
+        if koniec is not None and intent.at >= koniec:
+            return BidResult(False, aukcja.cena, reason="Aukcja już zakończona.")
+        aukcja.licytuj(intent.user)
+        self.seq += 1
+        extended = 0.0
+        if koniec is not None:
+            extended = self.soft_close.extension(koniec - intent.at, aukcja.przedluzenie)
+            if extended and self.deadlines.schedule(aukcja.ledger_id, koniec + extended):
+                aukcja.przedluzenie += extended
+            else:
+                extended = 0.0
+        return BidResult(True, aukcja.cena, self.seq, extended=extended)
+
+    def _publish(self, aukcja_id: int | None, results: list):
+        if not results or not any(r.accepted for _i, r in results):
+            return
+        event = BidsApplied(self.aukcje[aukcja_id], results)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logging.exception("Bid listener failed")
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable
+
+import discord
+
+import metrics
+
+Call = Callable[[], Awaitable]
+
+# Discord reports rate limits per channel or per webhook (interaction replies use
+# the application's webhook), so those are the routes calls are grouped by
+_ROUTE_RE = re.compile(r"/(channels|webhooks)/(\d+)")
+
+
+def route_of(url: str) -> str:
+    match = _ROUTE_RE.search(url)
+    return f"{match.group(1)}/{match.group(2)}" if match else ""
+
+
+class Priority(IntEnum):
+    """Order in which queued calls are sent, most urgent first."""
+
+    ACK = 0           # edits of a bidder's "Twoja oferta" message
+    AUCTION = 1       # live auction embeds
+    ANNOUNCEMENT = 2
+    PANEL = 3
+    COSMETIC = 4      # e.g. bid messages of a finished auction
+
+
+class _Job:
+    __slots__ = ("route", "call", "priority", "key", "done")
+
+    def __init__(self, route: str, call: Call | None, priority: Priority, key: str | None):
+        self.route = route
+        self.call = call      # None once replaced by a newer job with the same key
+        self.priority = priority
+        self.key = key
+        # True once sent, False if it failed, None if dropped unsent
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def finish(self, result: bool | None):
+        if not self.done.done():
+            self.done.set_result(result)
+
+
+class FanOut:
+    """Run many Discord calls concurrently without tripping rate limits.
+
+    ``run`` awaits a group of calls the caller depends on, at most ``limit``
+    in flight. ``defer`` queues everything else: ``workers`` background tasks
+    send the most urgent queued call first (see :class:`Priority`), and one
+    of them takes only acks, so a bidder's reply never waits for an edit
+    already in flight. Each channel gets at most ``route_limit`` calls per
+    ``route_window`` seconds, Discord's usual bucket for message edits, and
+    a route (channel or webhook) that answered 429 waits out its
+    retry-after. Calls to a busy route stay queued while other routes are
+    served. A queued call with a ``key`` is dropped when a newer call with the
+    same key arrives, so only the latest state of a message is sent.
+    """
+
+    def __init__(self, limit: int = 8, workers: int = 4, route_limit: int = 5, route_window: float = 5.0):
+        self.limit = limit
+        self.workers = max(workers, 2)
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self._semaphore = asyncio.Semaphore(limit)
+        self._queues: list[deque[_Job]] = [deque() for _ in Priority]
+        self._keyed: dict[str, _Job] = {}
+        self._ready = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._closed = False
+        self._blocked: dict[str, float] = {}
+        self._recent: dict[str, deque[float]] = {}
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    async def _call(self, call: Call, name: str, semaphore: asyncio.Semaphore | None = None):
+        try:
+            if semaphore is None:
+                await call()
+            else:
+                async with semaphore:
+                    await call()
+            return True
+        except discord.NotFound:
+            # The message was deleted in the meantime; nothing left to update
+            return True
+        except Exception:
+            logging.exception("Discord call %s failed", name)
+            return False
+
+    async def run(self, *calls: Call) -> list[bool]:
+        """Run ``calls`` concurrently and wait for all; failures are logged."""
+        return list(await asyncio.gather(
+            *(self._call(call, getattr(call, "__name__", "?"), self._semaphore) for call in calls)
+        ))
+
+    def defer(
+        self, route: str, call: Call, priority: Priority = Priority.COSMETIC, key: str | None = None
+    ) -> asyncio.Future:
+        """Queue ``call`` to be sent in the background, replacing a queued call with ``key``.
+
+        The returned future resolves to True once the call was sent, False if
+        it failed and None if it was dropped before being sent.
+        """
+        job = _Job(route, call, priority, key)
+        if self._closed:
+            job.finish(None)
+            return job.done
+        if key is not None:
+            self.discard(key)
+            self._keyed[key] = job
+        self._queues[priority].append(job)
+        self._ready.set()
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i == 0)) for i in range(self.workers)]
+        return job.done
+
+    def discard(self, key: str):
+        """Drop the queued call with ``key``, e.g. when its message is edited directly."""
+        old = self._keyed.pop(key, None)
+        if old is not None and old.call is not None:
+            old.call = None
+            old.finish(None)
+            self.dropped += 1
+            metrics.DISCORD_DEFERRED.inc(old.priority.name.lower(), "dropped")
+
+    async def close(self):
+        """Stop the workers; calls still queued are dropped unsent."""
+        self._closed = True
+        self._ready.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._queues:
+            for job in queue:
+                job.finish(None)
+            queue.clear()
+        self._keyed.clear()
+
+    def note_rate_limit(self, route: str, retry_after: float):
+        """Hold deferred calls to ``route`` for ``retry_after`` seconds."""
+        if route:
+            until = time.monotonic() + retry_after
+            self._blocked[route] = max(self._blocked.get(route, 0.0), until)
+
+    def __len__(self):
+        return sum(job.call is not None for queue in self._queues for job in queue)
+
+    def _free_at(self, route: str, now: float) -> float:
+        """When ``route`` may take another call (``now`` or earlier if it may already)."""
+        if not route:
+            return now
+        free = self._blocked.get(route, 0.0)
+        recent = self._recent.get(route)
+        # Webhook messages (interaction replies) each have their own bucket
+        if recent and route.startswith("channels/"):
+            while recent and recent[0] <= now - self.route_window:
+                recent.popleft()
+            if len(recent) >= self.route_limit:
+                free = max(free, recent[0] + self.route_window)
+        return free
+
+    def _next(self, now: float, acks_only: bool) -> _Job | None:
+        for queue in self._queues[:1] if acks_only else self._queues:
+            i = 0
+            while i < len(queue):
+                job = queue[i]
+                if job.call is None:
+                    # Replaced by a newer call while queued
+                    del queue[i]
+                elif self._free_at(job.route, now) > now:
+                    i += 1
+                else:
+                    del queue[i]
+                    if job.route.startswith("channels/"):
+                        self._recent.setdefault(job.route, deque()).append(now)
+                    if job.key is not None and self._keyed.get(job.key) is job:
+                        del self._keyed[job.key]
+                    return job
+        return None
+
+    def _wait(self, now: float, acks_only: bool) -> float | None:
+        waits = [
+            self._free_at(job.route, now) - now
+            for queue in (self._queues[:1] if acks_only else self._queues)
+            for job in queue if job.call is not None
+        ]
+        return min(waits) if waits else None
+
+    async def _worker(self, acks_only: bool):
+        while not self._closed:
+            now = time.monotonic()
+            job = self._next(now, acks_only)
+            if job is None:
+                wait = self._wait(now, acks_only)
+                if wait is None:
+                    self._ready.clear()
+                    await self._ready.wait()
+                else:
+                    # Every queued call waits for a busy route; new calls may not.
+                    # asyncio.wait, unlike wait_for, never swallows a cancel from close()
+                    ready = asyncio.ensure_future(self._ready.wait())
+                    try:
+                        await asyncio.wait({ready}, timeout=max(wait, 0.05))
+                    finally:
+                        ready.cancel()
+                    self._ready.clear()
+                continue
+            # Workers bound the background calls on their own, so critical calls
+            # in ``run`` never wait for a semaphore slot held by a cosmetic edit
+            try:
+                ok = await self._call(job.call, job.route)
+            except asyncio.CancelledError:
+                job.finish(None)
+                raise
+            job.finish(ok)
+            if ok:
+                self.sent += 1
+                metrics.DISCORD_DEFERRED.inc(job.priority.name.lower(), "sent")
+            else:
+                self.failed += 1
+                metrics.DISCORD_DEFERRED.inc(job.priority.name.lower(), "failed")
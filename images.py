@@ -0,0 +1,186 @@
+"""Local copies of card images and set logos in the sizes the bot shows them.
+
+Each image is downloaded once and stored as one file per variant: ``thumb``
+(set logos and thumbnails), ``embed`` (the Discord auction embed) and
+``overlay`` (the OBS page). With Pillow installed the variants are
+downscaled and recompressed as WebP; without it the downloaded file is kept
+as is and used for every variant. Files are named after a hash of the URL,
+so the directory itself is the index; the least recently used images are
+deleted once it grows past ``max_bytes``.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+from assets import make_session
+
+try:
+    from PIL import Image
+except ImportError:  # optional: without Pillow originals are cached unchanged
+    Image = None
+
+# Longest side in pixels of each variant
+VARIANTS = {"thumb": 128, "embed": 512, "overlay": 768}
+WEBP_QUALITY = 85
+ORIGINAL = "orig"
+
+
+class ImageCache:
+    def __init__(self, directory: Path, max_bytes: int, concurrency: int = 4):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        # url hash -> variant -> file, least recently used first
+        self._entries: OrderedDict[str, dict[str, Path]] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self.total_bytes = 0
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="images")
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.downloads = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+
+    def load(self):
+        """Index the files already on disk, oldest modification time first."""
+        if Image is None:
+            logging.warning("Pillow is not installed; cached images are not downscaled")
+        if not self.directory.is_dir():
+            return
+        files = []
+        for path in self.directory.iterdir():
+            parts = path.name.split(".")
+            if len(parts) == 3 and (parts[1] in VARIANTS or parts[1] == ORIGINAL):
+                stat = path.stat()
+                files.append((stat.st_mtime, parts[0], parts[1], path, stat.st_size))
+        for _mtime, key, variant, path, size in sorted(files):
+            entry = self._entries.setdefault(key, {})
+            if variant == ORIGINAL:
+                entry.update(dict.fromkeys(VARIANTS, path))
+            else:
+                entry[variant] = path
+            self._entries.move_to_end(key)
+            self._sizes[key] = self._sizes.get(key, 0) + size
+            self.total_bytes += size
+
+    def path(self, url: str | None, variant: str, touch: bool = False) -> Path | None:
+        """Local file of ``url`` in ``variant``, or None if it is not cached.
+
+        ``touch`` also checks the file is still there and marks it as recently
+        used on disk; once per auction is enough, the state save after every
+        bid batch only needs the name.
+        """
+        if not url:
+            return None
+        key = self.key(url)
+        entry = self._entries.get(key)
+        if entry is None or variant not in entry:
+            return None
+        self._entries.move_to_end(key)
+        if touch:
+            try:
+                # The modification time orders eviction after a restart
+                os.utime(entry[variant])
+            except FileNotFoundError:
+                self._forget(key)
+                return None
+        return entry[variant]
+
+    async def ensure(self, url: str | None):
+        """Download and convert ``url`` unless it is cached already."""
+        if not url or self.key(url) in self._entries:
+            return
+        key = self.key(url)
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(url))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        await asyncio.shield(fut)
+
+    async def prefetch(self, urls):
+        """Cache every URL in ``urls``; failures are logged and skipped."""
+        started = time.monotonic()
+        downloads = self.downloads
+        await asyncio.gather(*(self.ensure(url) for url in dict.fromkeys(urls) if url))
+        if self.downloads != downloads:
+            logging.info(
+                "Cached %s image(s) in %.1fs, %.1f MB in use",
+                self.downloads - downloads, time.monotonic() - started, self.total_bytes / 2**20,
+            )
+
+    async def _fetch(self, url: str):
+        loop = asyncio.get_running_loop()
+        try:
+            files = await loop.run_in_executor(self._executor, self._download, url)
+        except Exception as e:
+            metrics.IMAGE_CACHE.inc("error")
+            logging.warning("Caching image %s failed: %s", url, e)
+            return
+        key = self.key(url)
+        self._entries[key] = {variant: path for variant, (path, _size) in files.items()}
+        self._sizes[key] = sum(size for _path, size in set(files.values()))
+        self.total_bytes += self._sizes[key]
+        self.downloads += 1
+        metrics.IMAGE_CACHE.inc("download")
+        self._evict()
+
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = make_session(None, self.concurrency)
+            return self._session
+
+    def _download(self, url: str) -> dict[str, tuple[Path, int]]:
+        resp = self.session().get(url, timeout=10)
+        resp.raise_for_status()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        key = self.key(url)
+        if Image is None:
+            suffix = Path(url.split("?", 1)[0]).suffix.lower() or ".png"
+            path = self._store(f"{key}.{ORIGINAL}{suffix}", resp.content)
+            return dict.fromkeys(VARIANTS, (path, len(resp.content)))
+        with Image.open(io.BytesIO(resp.content)) as original:
+            original.load()
+            files = {}
+            for variant, size in VARIANTS.items():
+                image = original.copy()
+                image.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, "WEBP", quality=WEBP_QUALITY)
+                data = buffer.getvalue()
+                files[variant] = (self._store(f"{key}.{variant}.webp", data), len(data))
+        return files
+
+    def _store(self, name: str, data: bytes) -> Path:
+        path = self.directory / name
+        tmp = path.with_name(f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        self.total_bytes -= self._sizes.pop(key, 0)
+        for path in set(entry.values()) if entry else ():
+            path.unlink(missing_ok=True)
+
+    def _evict(self):
+        # The newest image stays even if it alone is larger than the limit
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._forget(next(iter(self._entries)))
+            self.evicted += 1
+            metrics.IMAGE_CACHE.inc("evicted")
@@ -0,0 +1,150 @@
+"""Talk to a ``worker.py`` process over a Unix socket.
+
+Messages are one JSON object per line: ``{"id": n, "op": ..., ...}``. The
+worker answers ``{"id": n, "result": ...}`` or ``{"id": n, "error": ...}``;
+requests sent with ``"id": null`` are fire-and-forget. One connection and
+one writer task keep requests in the order they were issued, so ledger
+writes are applied in the same order as with the in-process thread.
+A request the connection dropped before it was written out is sent again
+after reconnecting; callers of requests already sent get a ConnectionError.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import metrics
+from ledger import Ledger
+from snapshot import SnapshotWriter
+
+MAX_LINE = 16 * 1024 * 1024
+
+
+class WorkerError(Exception):
+    """The worker reported a failure for a request."""
+
+
+def encode(msg: dict) -> bytes:
+    return json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class WorkerClient:
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        # Taken off the outbox but not written out yet; sent first after a reconnect
+        self._unsent: dict | None = None
+        self._written: set[int] = set()   # ids of requests sent on this connection
+        self._task: asyncio.Task | None = None
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def call(self, op: str, **payload):
+        """Send a request and wait for the worker's result."""
+        self._start()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._outbox.put_nowait({"id": request_id, "op": op, **payload})
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def send(self, op: str, **payload):
+        """Queue a request without waiting for it; failures are logged by the worker."""
+        self._start()
+        self._outbox.put_nowait({"id": None, "op": op, **payload})
+
+    async def _run(self):
+        backoff = 0.1
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+            except OSError as e:
+                logging.warning("Worker %s unavailable: %s", self.path, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 5.0)
+                continue
+            backoff = 0.1
+            responses = asyncio.create_task(self._read(reader))
+            try:
+                while True:
+                    if self._unsent is None:
+                        get = asyncio.ensure_future(self._outbox.get())
+                        await asyncio.wait({get, responses}, return_when=asyncio.FIRST_COMPLETED)
+                        if get.done():
+                            self._unsent = get.result()
+                        else:
+                            get.cancel()
+                    if responses.done():
+                        # The worker closed the connection; reconnect before sending more
+                        break
+                    writer.write(encode(self._unsent))
+                    await writer.drain()
+                    if self._unsent["id"] is not None:
+                        self._written.add(self._unsent["id"])
+                    self._unsent = None
+            except (OSError, ConnectionError) as e:
+                logging.warning("Lost connection to worker %s: %s", self.path, e)
+            finally:
+                responses.cancel()
+                writer.close()
+                self._fail_pending()
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while line := await reader.readline():
+            msg = json.loads(line)
+            self._written.discard(msg.get("id"))
+            future = self._pending.get(msg.get("id"))
+            if future is None or future.done():
+                continue
+            if "error" in msg:
+                future.set_exception(WorkerError(msg["error"]))
+            else:
+                future.set_result(msg.get("result"))
+
+    def _fail_pending(self):
+        # Requests already sent may or may not have been applied; the rest are still
+        # to be sent after the reconnect, so their callers keep waiting
+        for request_id in self._written:
+            future = self._pending.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_exception(ConnectionError(f"worker {self.path} disconnected"))
+        self._written.clear()
+
+
+class RemoteLedger(Ledger):
+    """:class:`Ledger` whose queries run in a worker process instead of a thread."""
+
+    def __init__(self, client: WorkerClient, path, session: str):
+        super().__init__(path, session)
+        self.client = client
+
+    async def run(self, fn, *args):
+        return await self.client.call("ledger", session=self.session, fn=fn.__name__, args=args)
+
+    def submit(self, fn, *args):
+        self.client.send("ledger", session=self.session, fn=fn.__name__, args=args)
+
+    def close(self):
+        pass
+
+
+class RemoteSnapshotWriter(SnapshotWriter):
+    """:class:`SnapshotWriter` that hands the latest snapshot to a worker process."""
+
+    def __init__(self, client: WorkerClient, output_dir, template_path):
+        super().__init__(output_dir, template_path)
+        self.client = client
+
+    async def _write(self, dane: dict):
+        started = time.perf_counter()
+        await self.client.call("snapshot", dane=dane)
+        metrics.SNAPSHOT_WRITE_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+# Record types, kept short because every bid is one line in the journal
+LOAD = "load"        # {"lots": [...], "replace": bool}
+TAKE = "take"        # {"lot": lot, "p": whether it was a priority lot}; taken from the head of
+                     #  the queue to be started, written with the pop so later indices match
+START = "start"      # {"a": auction}; started from the lot of an earlier take record
+MSG = "msg"          # {"id": ledger id, "m": [channel id, message id], "k": deadline iso time,
+                     #  "z": attached image file names}
+BID = "bid"          # {"id": ledger id, "u": user ref, "c": price, "ts": iso time, "s": seq}
+END = "end"          # {"id": ledger id}
+EXTEND = "extend"    # {"id": ledger id, "k": new deadline iso time, "x": seconds added so far}
+ORDER = "order"      # {"m": message id, "o": order}
+ORDER_DONE = "order_done"  # {"m": message id}
+OK = "ok"            # {"m": message id, "u": user id}
+OK_DONE = "ok_done"  # {"m": message id}
+MOVE = "move"        # {"i": old index, "to": new index, "p": priority lots after the move}
+REMOVE = "remove"    # {"i": index, "p": priority lots after the removal}
+
+
+def empty_state() -> dict:
+    return {
+        "queue": deque(),
+        "priority": 0,
+        "taken": [],
+        "aukcje": {},
+        "pending_orders": {},
+        "pending_ok": {},
+        "seq": 0,
+    }
+
+
+def _running(state: dict, rec: dict) -> dict | None:
+    return state["aukcje"].get(str(rec["id"]))
+
+
+def apply(state: dict, rec: dict):
+    """Apply one journal record to a plain-data state."""
+    t = rec["t"]
+    if t == LOAD:
+        if rec.get("replace"):
+            state["queue"] = deque()
+            state["priority"] = 0
+        state["queue"].extend(rec["lots"])
+    elif t == TAKE:
+        if state["queue"]:
+            state["queue"].popleft()
+            state["priority"] = max(0, state["priority"] - 1)
+        state["taken"].append([rec["lot"], rec["p"]])
+    elif t == START:
+        # Matched by contents; a checkpoint written mid-start may hold no take record
+        for i, (lot, _p) in enumerate(state["taken"]):
+            if lot == rec["a"]["lot"]:
+                del state["taken"][i]
+                break
+        state["aukcje"][str(rec["a"]["ledger_id"])] = rec["a"]
+    elif t == MOVE:
+        lot = state["queue"][rec["i"]]
+        del state["queue"][rec["i"]]
+        state["queue"].insert(rec["to"], lot)
+        state["priority"] = rec["p"]
+    elif t == REMOVE:
+        del state["queue"][rec["i"]]
+        state["priority"] = rec["p"]
+    elif t == MSG:
+        cur = _running(state, rec)
+        if cur is not None:
+            cur["msg"] = rec["m"]
+            if rec.get("k"):
+                cur["koniec"] = rec["k"]
+            cur["zalaczniki"] = rec["z"]
+    elif t == EXTEND:
+        cur = _running(state, rec)
+        if cur is not None:
+            cur["koniec"] = rec["k"]
+            cur["przedluzenie"] = rec["x"]
+    elif t == BID:
+        cur = _running(state, rec)
+        if cur is not None:
+            cur["cena"] = rec["c"]
+            cur["zwyciezca"] = rec["u"]
+            cur["historia"].append([rec["u"], rec["c"], rec["ts"]])
+        state["seq"] = max(state["seq"], rec["s"])
+    elif t == END:
+        cur = _running(state, rec)
+        if cur is not None:
+            del state["aukcje"][str(cur["ledger_id"])]
+    elif t == ORDER:
+        state["pending_orders"][str(rec["m"])] = rec["o"]
+    elif t == ORDER_DONE:
+        state["pending_orders"].pop(str(rec["m"]), None)
+    elif t == OK:
+        state["pending_ok"][str(rec["m"])] = rec["u"]
+    elif t == OK_DONE:
+        state["pending_ok"].pop(str(rec["m"]), None)
+
+
+class Journal:
+    """Append-only write-ahead log of live auction state with compacted checkpoints.
+
+    ``checkpoint.json`` holds the state as of generation N and
+    ``journal.N.log`` every record written after it. A new checkpoint is
+    written atomically under generation N+1 before the old log is removed,
+    so a crash at any point leaves a consistent pair to recover from.
+    """
+
+    def __init__(self, directory: Path, checkpoint_every: int = 5000):
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.generation = 0
+        self.since_checkpoint = 0
+        self._file = None
+
+    def _log_path(self, generation: int) -> Path:
+        return self.directory / f"journal.{generation}.log"
+
+    def recover(self) -> dict:
+        """Rebuild state from the checkpoint and the journal that follows it."""
+        started = time.perf_counter()
+        state = empty_state()
+        checkpoint = self.directory / "checkpoint.json"
+        try:
+            with open(checkpoint, encoding="utf-8") as f:
+                data = json.load(f)
+            self.generation = data["generation"]
+            state = data["state"]
+            state["queue"] = deque(state["queue"])
+        except FileNotFoundError:
+            pass
+        records = 0
+        try:
+            with open(self._log_path(self.generation), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        logging.warning("Skipping corrupt journal line")
+                        continue
+                    apply(state, rec)
+                    records += 1
+        except FileNotFoundError:
+            pass
+        self.since_checkpoint = records
+        # Taken for an auction that never started: back to where it was taken from
+        for lot, priority in reversed(state.pop("taken")):
+            state["queue"].insert(0 if priority else state["priority"], lot)
+            state["priority"] += 1 if priority else 0
+        logging.info(
+            "Recovered %s queued lot(s), %s running auction(s) from %s record(s) in %.1f ms",
+            len(state["queue"]),
+            len(state["aukcje"]),
+            records,
+            (time.perf_counter() - started) * 1000,
+        )
+        return state
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._log_path(self.generation), "a", encoding="utf-8")
+
+    def append(self, *records: dict):
+        """Append records and hand them to the OS so they survive a process crash."""
+        if self._file is None:
+            return
+        self._file.write(
+            "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+        )
+        self._file.flush()
+        self.since_checkpoint += len(records)
+
+    def checkpoint(self, state: dict):
+        """Write ``state`` as a new generation and drop the old journal."""
+        if self._file is None:
+            return
+        generation = self.generation + 1
+        tmp = self.directory / "checkpoint.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "state": state}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.directory / "checkpoint.json")
+        self._file.close()
+        old = self._log_path(self.generation)
+        self.generation = generation
+        self.since_checkpoint = 0
+        self._file = open(self._log_path(generation), "a", encoding="utf-8")
+        old.unlink(missing_ok=True)
+
+    def maybe_checkpoint(self, state_fn):
+        if self.since_checkpoint >= self.checkpoint_every:
+            self.checkpoint(state_fn())
@@ -0,0 +1,213 @@
+import asyncio
+import datetime
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import analytics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS auctions (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    nazwa TEXT NOT NULL,
+    numer TEXT NOT NULL,
+    opis TEXT,
+    cena_start REAL NOT NULL,
+    cena_koncowa REAL,
+    zwyciezca TEXT,
+    zwyciezca_id INTEGER,
+    start_time TEXT NOT NULL,
+    end_time TEXT
+);
+CREATE INDEX IF NOT EXISTS auctions_session ON auctions(session);
+CREATE INDEX IF NOT EXISTS auctions_numer ON auctions(numer);
+CREATE TABLE IF NOT EXISTS bids (
+    id INTEGER PRIMARY KEY,
+    auction_id INTEGER NOT NULL REFERENCES auctions(id),
+    seq INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    user TEXT NOT NULL,
+    user_id INTEGER,
+    cena REAL NOT NULL,
+    ts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bids_auction ON bids(auction_id, seq);
+CREATE INDEX IF NOT EXISTS bids_user ON bids(user_id);
+CREATE TABLE IF NOT EXISTS orders (
+    order_number TEXT PRIMARY KEY,
+    auction_id INTEGER REFERENCES auctions(id),
+    session TEXT NOT NULL,
+    buyer TEXT NOT NULL,
+    buyer_id INTEGER,
+    nazwa TEXT NOT NULL,
+    numer TEXT NOT NULL,
+    cena REAL NOT NULL,
+    payment_method TEXT,
+    status TEXT NOT NULL DEFAULT 'nowe',
+    paid INTEGER NOT NULL DEFAULT 0,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_buyer ON orders(buyer COLLATE NOCASE, created);
+CREATE INDEX IF NOT EXISTS orders_buyer_id ON orders(buyer_id, created);
+CREATE INDEX IF NOT EXISTS orders_unpaid ON orders(created) WHERE paid = 0;
+CREATE INDEX IF NOT EXISTS orders_session ON orders(session, cena);
+"""
+
+
+def _now() -> str:
+    return datetime.datetime.utcnow().isoformat()
+
+
+class Ledger:
+    """SQLite (WAL) store of auctions, bids and orders.
+
+    All queries run on one dedicated worker thread, so the connection is
+    never shared and callers on the event loop never block on disk.
+    """
+
+    def __init__(self, path: Path, session: str):
+        self.path = path
+        self.session = session
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="ledger")
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def run(self, fn, *args):
+        """Run ``fn(conn, *args)`` on the ledger thread and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    def submit(self, fn, *args):
+        """Queue ``fn(conn, *args)`` without waiting for it (writes stay ordered)."""
+        future = self._executor.submit(self._call, fn, args)
+        future.add_done_callback(_log_failure)
+
+    def _call(self, fn, args):
+        return fn(self._connect(), *args)
+
+    # Writes
+
+    def seed_order_counter(self, conn: sqlite3.Connection, value: int):
+        """Start the order sequence at ``value`` unless it already exists."""
+        conn.execute(
+            "INSERT OR IGNORE INTO sequences(name, value) VALUES ('orders', ?)", (value,)
+        )
+
+    def start_auction(self, conn: sqlite3.Connection, aukcja: dict) -> int:
+        cur = conn.execute(
+            "INSERT INTO auctions(session, nazwa, numer, opis, cena_start, start_time) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.session, aukcja["nazwa"], aukcja["numer"], aukcja["opis"],
+             aukcja["cena"], aukcja["start_time"]),
+        )
+        return cur.lastrowid
+
+    def record_bids(self, conn: sqlite3.Connection, rows: list[tuple]):
+        """Insert ``(auction_id, seq, source, user, user_id, cena, ts)`` rows."""
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO bids(auction_id, seq, source, user, user_id, cena, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def end_auction(self, conn: sqlite3.Connection, auction_id: int, cena: float,
+                    zwyciezca: str | None, zwyciezca_id: int | None):
+        conn.execute(
+            "UPDATE auctions SET cena_koncowa = ?, zwyciezca = ?, zwyciezca_id = ?, end_time = ? "
+            "WHERE id = ?",
+            (cena, zwyciezca, zwyciezca_id, _now(), auction_id),
+        )
+
+    def create_order(self, conn: sqlite3.Connection, order: dict) -> str:
+        """Insert an order and return its number (AUC-YYYY-MM-NNNN).
+
+        The sequence bump and the insert share one transaction, so a crash can
+        neither reuse nor skip a number.
+        """
+        now = datetime.datetime.utcnow()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO sequences(name, value) VALUES ('orders', 0)")
+            (counter,) = conn.execute(
+                "UPDATE sequences SET value = value + 1 WHERE name = 'orders' RETURNING value"
+            ).fetchone()
+            order_number = f"AUC-{now.year}-{now.month:02d}-{counter:04d}"
+            conn.execute(
+                "INSERT INTO orders(order_number, auction_id, session, buyer, buyer_id, nazwa, "
+                "numer, cena, payment_method, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (order_number, order.get("auction_id"), self.session, order["buyer"],
+                 order.get("buyer_id"), order["nazwa"], order["numer"], order["cena"],
+                 order.get("payment_method"), now.isoformat()),
+            )
+        return order_number
+
+    def set_order_status(self, conn: sqlite3.Connection, order_number: str, status: str):
+        conn.execute("UPDATE orders SET status = ? WHERE order_number = ?", (status, order_number))
+
+    def mark_paid(self, conn: sqlite3.Connection, order_number: str) -> bool:
+        cur = conn.execute(
+            "UPDATE orders SET paid = 1 WHERE order_number = ? AND paid = 0", (order_number,)
+        )
+        return cur.rowcount > 0
+
+    # Admin queries
+
+    def orders_by_buyer(self, conn: sqlite3.Connection, buyer: str | int, limit: int = 20):
+        if isinstance(buyer, int):
+            sql = "SELECT * FROM orders WHERE buyer_id = ? ORDER BY created DESC LIMIT ?"
+        else:
+            sql = ("SELECT * FROM orders WHERE buyer = ? COLLATE NOCASE "
+                   "ORDER BY created DESC LIMIT ?")
+        return [dict(r) for r in conn.execute(sql, (buyer, limit))]
+
+    def unpaid_orders(self, conn: sqlite3.Connection, limit: int = 20):
+        return [
+            dict(r) for r in conn.execute(
+                "SELECT * FROM orders WHERE paid = 0 ORDER BY created LIMIT ?", (limit,)
+            )
+        ]
+
+    def revenue_per_session(self, conn: sqlite3.Connection, limit: int = 10):
+        return [
+            dict(r) for r in conn.execute(
+                "SELECT session, COUNT(*) AS orders, SUM(cena) AS revenue FROM orders "
+                "GROUP BY session ORDER BY session DESC LIMIT ?",
+                (limit,),
+            )
+        ]
+
+    def export_bids(self, conn: sqlite3.Connection, directory: str) -> int:
+        """Append bids not exported yet to the column files in ``directory``."""
+        return analytics.export(conn, Path(directory))
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close).result()
+        self._executor.shutdown()
+
+
+def _log_failure(future):
+    error = future.exception()
+    if error is not None:
+        logging.error("Ledger write failed: %s", error)
@@ -0,0 +1,159 @@
+"""Logging through a queue, so a log call never waits for the terminal or a file.
+
+:func:`setup` puts a :class:`LogQueueHandler` on the root logger: the calling
+thread (usually the event loop) only formats the message and appends it to an
+in-memory queue, and a :class:`LogListener` thread writes it
+out as text or as one JSON object per line. When the queue is full the record
+is dropped and counted instead of blocking.
+
+High-frequency loggers (:data:`SAMPLED`: every bid batch, every message edit)
+are rate limited per message with a token bucket; the next line that gets
+through says how many similar ones were left out. Warnings and errors are
+never limited.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+import metrics
+from throttle import Limit, TokenBucket
+
+# Loggers of events that happen many times a second during a bid storm
+BIDS = "auction.bids"
+EDITS = "auction.edits"
+SAMPLED = (BIDS, EDITS)
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "suppressed"}
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through ``limit`` records per second per logger and message template."""
+
+    def __init__(self, limit: Limit, loggers=SAMPLED, max_keys: int = 1000):
+        super().__init__()
+        self.limit = limit
+        self.loggers = tuple(loggers)
+        self.max_keys = max_keys
+        self._buckets: dict[tuple, TokenBucket] = {}
+        self._suppressed: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not record.name.startswith(self.loggers):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = TokenBucket(self.limit, now)
+            if not bucket.take(now):
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                metrics.LOG_RECORDS_DROPPED.inc(record.name, "rate_limit")
+                return False
+            record.suppressed = self._suppressed.pop(key, 0)
+        return True
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to the listener thread; drop them rather than wait when it falls behind."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments may be objects that change later, so the message is fixed here;
+        # the traceback is kept apart for the JSON format
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc(record.name, "queue_full")
+
+
+class LogListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full; the thread is still draining it, so waiting is safe here
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        # Also registered with atexit, so it may run twice
+        if self._thread is not None:
+            super().stop()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        if getattr(record, "suppressed", 0):
+            line += f" (+{record.suppressed} similar suppressed)"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extras and traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update((k, v) for k, v in vars(record).items() if k not in _STANDARD)
+        if getattr(record, "suppressed", 0):
+            data["suppressed"] = record.suppressed
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup(
+    level: str = "INFO",
+    fmt: str = "text",
+    path: str = "",
+    rate_limit: Limit | None = None,
+    queue_size: int = 10000,
+) -> LogListener:
+    """Route the root logger through a queue to stderr (and ``path``); returns the started listener."""
+    if fmt not in ("text", "json"):
+        raise ValueError(f"unknown log format {fmt!r}, expected 'text' or 'json'")
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if path:
+        handlers.append(logging.FileHandler(path, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    records = queue.Queue(queue_size)
+    handler = LogQueueHandler(records)
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit))
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    listener = LogListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    # Write out what is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,273 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain, islice
+
+PRIORITY = 0
+NORMAL = 1
+
+
+class SortedBlocks:
+    """Sorted list split into blocks of at most ``2 * load`` items.
+
+    A bisect over the block maxima finds the block, so insert and delete move
+    at most one block's worth of pointers instead of the whole list. A Fenwick
+    tree over the block lengths turns a position into a block (and back) in
+    O(log n); it is rebuilt only when a block is split or dropped.
+    """
+
+    def __init__(self, load: int = 1000):
+        self._load = load
+        self._lists: list[list] = []
+        self._maxes: list = []
+        self._tree: list[int] | None = None
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._lists)
+
+    def clear(self):
+        self._lists.clear()
+        self._maxes.clear()
+        self._tree = None
+        self._len = 0
+
+    def add(self, value):
+        if not self._lists:
+            self._lists.append([value])
+            self._maxes.append(value)
+            self._tree = None
+        else:
+            i = min(bisect_right(self._maxes, value), len(self._lists) - 1)
+            block = self._lists[i]
+            insort(block, value)
+            self._maxes[i] = block[-1]
+            if len(block) > 2 * self._load:
+                self._lists[i:i + 1] = [block[:self._load], block[self._load:]]
+                self._maxes[i:i + 1] = [block[self._load - 1], block[-1]]
+                self._tree = None
+            else:
+                self._update(i, 1)
+        self._len += 1
+
+    def remove(self, value):
+        i = bisect_left(self._maxes, value)
+        block = self._lists[i]
+        del block[bisect_left(block, value)]
+        if block:
+            self._maxes[i] = block[-1]
+            self._update(i, -1)
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+            self._tree = None
+        self._len -= 1
+
+    def _fenwick(self) -> list[int]:
+        if self._tree is None:
+            tree = [0] + [len(b) for b in self._lists]
+            for i in range(1, len(tree)):
+                parent = i + (i & -i)
+                if parent < len(tree):
+                    tree[parent] += tree[i]
+            self._tree = tree
+        return self._tree
+
+    def _update(self, block: int, delta: int):
+        tree = self._tree
+        if tree is None:
+            return
+        i = block + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _before(self, block: int) -> int:
+        """Number of items in the blocks in front of ``block``."""
+        tree = self._fenwick()
+        total = 0
+        while block:
+            total += tree[block]
+            block -= block & -block
+        return total
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        # Descend the tree to the last block whose predecessors hold at most ``index`` items
+        tree = self._fenwick()
+        block = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            nxt = block + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                block = nxt
+                index -= tree[nxt]
+            step >>= 1
+        return self._lists[block][index]
+
+    def index(self, value) -> int:
+        i = bisect_left(self._maxes, value)
+        return self._before(i) + bisect_left(self._lists[i], value)
+
+    def irange(self, start):
+        """Iterate over items ``>= start``."""
+        i = bisect_left(self._maxes, start)
+        if i == len(self._lists):
+            return iter(())
+        block = self._lists[i]
+        return chain(
+            islice(block, bisect_left(block, start), None),
+            chain.from_iterable(self._lists[i + 1:]),
+        )
+
+
+class LotQueue:
+    """Auction queue ordered by ``(tier, position)`` with lookups by numer and name.
+
+    Priority lots are always sold before normal ones. Positions are floats
+    so a lot can be moved between two neighbours without renumbering the
+    rest; iterating or previewing the head never copies the queue.
+    """
+
+    def __init__(self, lots=()):
+        self._order = SortedBlocks()
+        self._names = SortedBlocks()
+        self._entries: dict[int, tuple] = {}   # id(lot) -> ((tier, pos, id), lot)
+        self._numery: dict[str, set[int]] = {}
+        self._tail = 0.0
+        self.priority = 0
+        self.extend(lots)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        entries = self._entries
+        return (entries[key[2]][1] for key in self._order)
+
+    def __getitem__(self, index: int):
+        return self._entries[self._order[index][2]][1]
+
+    def head(self, n: int):
+        return islice(self, n)
+
+    def _insert(self, lot, tier: int, pos: float):
+        key = (tier, pos, id(lot))
+        self._entries[id(lot)] = (key, lot)
+        self._order.add(key)
+        if tier == PRIORITY:
+            self.priority += 1
+
+    def _detach(self, lot) -> int:
+        key, _ = self._entries.pop(id(lot))
+        index = self._order.index(key)
+        self._order.remove(key)
+        if key[0] == PRIORITY:
+            self.priority -= 1
+        return index
+
+    def append(self, lot, priority: bool = False):
+        self._tail += 1
+        self._insert(lot, PRIORITY if priority else NORMAL, self._tail)
+        self._names.add((str(lot.nazwa).casefold(), id(lot)))
+        self._numery.setdefault(str(lot.numer), set()).add(id(lot))
+
+    def extend(self, lots, priority: int = 0):
+        """Append ``lots``; the first ``priority`` of them go to the priority tier."""
+        for i, lot in enumerate(lots):
+            self.append(lot, i < priority)
+
+    def popleft(self):
+        if not self._order:
+            raise IndexError("pop from an empty queue")
+        lot = self[0]
+        self.remove(lot)
+        return lot
+
+    def clear(self):
+        self._order.clear()
+        self._names.clear()
+        self._entries.clear()
+        self._numery.clear()
+        self.priority = 0
+
+    def remove(self, lot) -> int:
+        """Remove ``lot`` and return the index it had."""
+        index = self._detach(lot)
+        self._names.remove((str(lot.nazwa).casefold(), id(lot)))
+        ids = self._numery[str(lot.numer)]
+        ids.discard(id(lot))
+        if not ids:
+            del self._numery[str(lot.numer)]
+        return index
+
+    def index(self, lot) -> int:
+        return self._order.index(self._entries[id(lot)][0])
+
+    def find(self, numer: str):
+        """First queued lot with this ``numer``, or ``None``."""
+        ids = self._numery.get(str(numer))
+        if not ids:
+            return None
+        return self._entries[min(ids, key=lambda i: self._entries[i][0])][1]
+
+    def search(self, fraza: str, limit: int = 10) -> list:
+        """Lots whose numer equals ``fraza`` or whose name starts with it, in queue order."""
+        found = {i: self._entries[i] for i in self._numery.get(fraza, ())}
+        prefix = fraza.casefold()
+        for nazwa, i in self._names.irange((prefix,)):
+            if not nazwa.startswith(prefix) or len(found) >= limit:
+                break
+            found[i] = self._entries[i]
+        return [lot for _key, lot in sorted(found.values(), key=lambda e: e[0])[:limit]]
+
+    def move(self, lot, index: int) -> int:
+        """Move ``lot`` so it ends up at ``index``; return its old index.
+
+        The lot joins the priority tier only if it lands in front of a priority lot.
+        """
+        old = self._detach(lot)
+        index = max(0, min(index, len(self._order)))
+        for _ in range(2):
+            before = self._order[index - 1] if index > 0 else None
+            after = self._order[index] if index < len(self._order) else None
+            if after is None:
+                self._tail += 1
+                tier, pos = NORMAL, self._tail
+            elif before is None or before[0] != after[0]:
+                tier, pos = after[0], after[1] - 1
+            else:
+                tier, pos = after[0], (before[1] + after[1]) / 2
+                if not before[1] < pos < after[1]:
+                    self._renumber()
+                    continue
+            break
+        self._insert(lot, tier, pos)
+        return old
+
+    def _renumber(self):
+        """Respace positions after repeated halving exhausted float precision."""
+        keys = list(self._order)
+        self._order.clear()
+        self.priority = 0
+        for pos, (tier, _pos, i) in enumerate(keys, 1):
+            self._insert(self._entries[i][1], tier, float(pos))
+        self._tail = float(len(keys))
+
+    def prioritize(self, lot) -> int:
+        """Put ``lot`` at the end of the priority tier; return its old index."""
+        old = self._detach(lot)
+        self._tail += 1
+        self._insert(lot, PRIORITY, self._tail)
+        return old
+
+    def skip(self, lot) -> int:
+        """Send ``lot`` to the back of the queue; return its old index."""
+        old = self._detach(lot)
+        self._tail += 1
+        self._insert(lot, NORMAL, self._tail)
+        return old
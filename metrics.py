@@ -0,0 +1,211 @@
+"""In-process counters and histograms exposed in Prometheus text format.
+
+Recording is a dict lookup plus an integer/float add (histograms add one
+``bisect``), so metrics can sit on the bid path. Nothing is formatted until
+the endpoint is scraped.
+"""
+import bisect
+import logging
+import math
+from typing import Callable
+
+from aiohttp import web
+
+# Latency buckets in seconds, from sub-millisecond handler times to slow HTTP calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def count(self, *labels) -> int:
+        row = self.values.get(labels)
+        return sum(row[:-1]) if row else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, row in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), row[:-1]):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_num(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(row[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from ``fn`` when the endpoint is scraped."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            logging.exception("Gauge %s failed", self.name)
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_num(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+BIDS = REGISTRY.counter(
+    "auction_bids_total", "Bids processed by the engine.", ("source", "result")
+)
+BIDS_THROTTLED = REGISTRY.counter(
+    "auction_bids_throttled_total", "Bids over a rate limit, by limit and policy.", ("limit", "policy")
+)
+BID_HANDLER_SECONDS = REGISTRY.histogram(
+    "auction_bid_handler_seconds", "Duration of the Discord bid button handler."
+)
+DISCORD_REQUEST_SECONDS = REGISTRY.histogram(
+    "discord_request_seconds", "Discord HTTP request latency.", ("route", "channel")
+)
+DISCORD_RATE_LIMITED = REGISTRY.counter(
+    "discord_rate_limited_total", "Discord responses with status 429.", ("method", "channel")
+)
+ASSET_LOOKUPS = REGISTRY.counter(
+    "card_asset_lookups_total", "Card asset cache lookups.", ("result",)
+)
+ASSET_FETCH_SECONDS = REGISTRY.histogram(
+    "card_asset_fetch_seconds", "PokemonTCG API lookup latency on a cache miss."
+)
+YOUTUBE_POLL_LAG_SECONDS = REGISTRY.histogram(
+    "youtube_chat_lag_seconds", "Delay between a chat message being published and read."
+)
+YOUTUBE_PAGE_ITEMS = REGISTRY.histogram(
+    "youtube_chat_page_items", "Messages per live chat page.", buckets=SIZE_BUCKETS
+)
+CHAT_LAG_SECONDS = REGISTRY.histogram(
+    "chat_bid_lag_seconds", "Delay between a chat bid being posted and reaching the bot.", ("source",)
+)
+CHAT_BID_SECONDS = REGISTRY.histogram(
+    "chat_bid_applied_seconds", "Delay between a chat bid being posted and applied.", ("source",)
+)
+AUCTIONS_ENDED = REGISTRY.counter(
+    "auctions_ended_total", "Auctions closed, with or without a winner.", ("result",)
+)
+AUCTION_END_LATENESS = REGISTRY.histogram(
+    "auction_end_lateness_seconds", "Delay between an auction's deadline and its timer firing."
+)
+AUCTION_CLOSE_SECONDS = REGISTRY.histogram(
+    "auction_close_seconds", "Time to post the result of an ended auction."
+)
+DISCORD_DEFERRED = REGISTRY.counter(
+    "discord_deferred_calls_total", "Discord calls sent from the background queue, by priority.",
+    ("priority", "result"),
+)
+OVERLAY_EVENTS = REGISTRY.counter(
+    "overlay_events_sent_total", "Server-Sent Events pushed to overlay clients.", ("type",)
+)
+IMAGE_CACHE = REGISTRY.counter(
+    "image_cache_events_total", "Card images downloaded, evicted or failed.", ("event",)
+)
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total", "Log lines left out by the rate limit or a full log queue.", ("logger", "reason")
+)
+SNAPSHOT_WRITE_SECONDS = REGISTRY.histogram(
+    "snapshot_write_seconds", "Time to write aktualna_aukcja.html/.json."
+)
+
+
+async def start_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """Serve ``GET /metrics`` on ``host:port``."""
+
+    async def handle(_request):
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Metrics available on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,133 @@
+"""Local HTTP server for the OBS browser source.
+
+``GET /`` serves the overlay rendered from the latest state,
+``GET /aktualna_aukcja.json`` the state itself, ``GET /img/<file>`` the
+locally cached card images, and ``GET /events`` a
+Server-Sent Events stream: the full state once on connect, or once the first
+auction starts (``event: state``), and afterwards only the fields that
+changed (``event: patch``).
+"""
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from aiohttp import web
+
+import metrics
+from snapshot import SnapshotWriter
+
+# Shown before the first auction starts
+EMPTY_STATE = {
+    "nazwa": "",
+    "numer": "",
+    "opis": "",
+    "ostateczna_cena": 0.0,
+    "zwyciezca": None,
+    "historia": [],
+    "start_time": None,
+    "czas": None,
+    "koniec": None,
+    "obraz": None,
+    "obraz_lokalny": None,
+    "logo": None,
+    "next_nazwa": None,
+    "next_numer": None,
+}
+
+# A comment line keeps idle connections open through proxies and OBS
+KEEPALIVE_SECONDS = 15
+
+
+def _event(name: str, data: dict) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class OverlayServer:
+    """Push auction state to connected overlays as it changes.
+
+    A slow client is never sent a backlog: when it is ready again it gets one
+    patch from the state it last received to the current one.
+    """
+
+    def __init__(self, snapshots: SnapshotWriter, images_dir: Path | None = None):
+        self.snapshots = snapshots
+        self.images_dir = images_dir
+        self.state: dict = EMPTY_STATE
+        self.version = 0
+        self.clients = 0
+        self._changed = asyncio.Event()
+        self._runner: web.AppRunner | None = None
+
+    def publish(self, dane: dict):
+        """Make ``dane`` the current state and wake every connected overlay."""
+        self.state = dane
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def index(self, _request):
+        html = await asyncio.to_thread(self.snapshots.render, self.state)
+        return web.Response(text=html, content_type="text/html")
+
+    async def current(self, _request):
+        return web.json_response(self.state, dumps=lambda d: json.dumps(d, ensure_ascii=False))
+
+    async def image(self, request):
+        # File names are hashes of the source URL, so a file never changes
+        path = self.images_dir / request.match_info["name"]
+        if not path.is_file():
+            raise web.HTTPNotFound()
+        return web.FileResponse(path, headers={"Cache-Control": "public, max-age=86400"})
+
+    async def events(self, request):
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        await response.prepare(request)
+        self.clients += 1
+        try:
+            sent, version = self.state, self.version
+            if version:
+                await response.write(_event("state", sent))
+                metrics.OVERLAY_EVENTS.inc("state")
+            while True:
+                if self.version == version:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        await response.write(b": keepalive\n\n")
+                        continue
+                current, version = self.state, self.version
+                if sent is EMPTY_STATE:
+                    # Connected before the first auction: nothing to patch yet
+                    await response.write(_event("state", current))
+                    metrics.OVERLAY_EVENTS.inc("state")
+                else:
+                    patch = {k: v for k, v in current.items() if sent.get(k) != v}
+                    if patch:
+                        await response.write(_event("patch", patch))
+                        metrics.OVERLAY_EVENTS.inc("patch")
+                sent = current
+        except ConnectionResetError:
+            pass
+        finally:
+            self.clients -= 1
+        return response
+
+    async def start(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get("/", self.index)
+        app.router.add_get("/aktualna_aukcja.json", self.current)
+        app.router.add_get("/events", self.events)
+        if self.images_dir is not None:
+            app.router.add_get("/img/{name}", self.image)
+        self._runner = web.AppRunner(app, access_log=None, shutdown_timeout=1)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logging.info("Overlay available on http://%s:%s/", host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import time
+from functools import partial
+from typing import Any, Awaitable, Callable
+
+import discord
+
+import logs
+
+edit_log = logging.getLogger(logs.EDITS)
+
+RenderFn = Callable[[], dict[str, Any] | None]
+# May return a future (see FanOut.defer) when the edit is only queued
+SendFn = Callable[[dict[str, Any]], Awaitable[asyncio.Future | None]]
+
+
+def payload_signature(payload: dict[str, Any]) -> str:
+    """Return a stable fingerprint of message edit kwargs (embed/view/content)."""
+    data = {}
+    for key, value in payload.items():
+        if isinstance(value, discord.Embed):
+            data[key] = value.to_dict()
+        elif isinstance(value, discord.ui.View):
+            # custom_id is random for every new View instance, so compare only
+            # what the user actually sees.
+            data[key] = [
+                (
+                    type(item).__name__,
+                    getattr(item, "label", None),
+                    str(getattr(item, "style", None)),
+                    getattr(item, "disabled", None),
+                )
+                for item in value.children
+            ]
+        else:
+            data[key] = value
+    return json.dumps(data, sort_keys=True, default=str)
+
+
+class RenderScheduler:
+    """Coalesce embed refreshes into at most one edit per message per interval."""
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._targets: dict[str, tuple[RenderFn, SendFn]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._dirty: set[str] = set()
+        self._last_sent: dict[str, float] = {}
+        self._last_signature: dict[str, str] = {}   # last edit known to be delivered
+        self._queued_signature: dict[str, str] = {}
+        self.requested: dict[str, int] = {}
+        self.merged: dict[str, int] = {}
+        self.queued: dict[str, int] = {}
+        self.sent: dict[str, int] = {}
+        self.skipped: dict[str, int] = {}
+
+    def register(self, key: str, render: RenderFn, send: SendFn):
+        """Register a message under ``key``.
+
+        ``render`` builds the edit kwargs from current state (or returns None
+        when there is nothing to show), ``send`` delivers them to Discord, or
+        queues them and returns a future of the delivery.
+        """
+        self._targets[key] = (render, send)
+        for counter in (self.requested, self.merged, self.queued, self.sent, self.skipped):
+            counter.setdefault(key, 0)
+
+    def mark_dirty(self, key: str):
+        """Request a refresh of ``key``; merged with any refresh already pending."""
+        if key not in self._targets:
+            return
+        self.requested[key] += 1
+        if key in self._dirty:
+            self.merged[key] += 1
+            return
+        self._dirty.add(key)
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self._tasks[key] = asyncio.create_task(self._flush_loop(key))
+
+    def forget(self, key: str):
+        """Drop pending work and the last sent state for ``key``.
+
+        Used when a message is edited outside the scheduler (e.g. the final
+        auction result), so a queued refresh cannot overwrite it.
+        """
+        self._dirty.discard(key)
+        task = self._tasks.pop(key, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        self._last_signature.pop(key, None)
+        self._queued_signature.pop(key, None)
+
+    def unregister(self, key: str):
+        """Forget ``key`` entirely, e.g. once a per-auction message is final."""
+        self.forget(key)
+        self._targets.pop(key, None)
+        self._last_sent.pop(key, None)
+        for counter in (self.requested, self.merged, self.queued, self.sent, self.skipped):
+            counter.pop(key, None)
+
+    async def _flush_loop(self, key: str):
+        render, send = self._targets[key]
+        while key in self._dirty:
+            wait = self._last_sent.get(key, 0.0) + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty.discard(key)
+            try:
+                payload = render()
+                if payload is None:
+                    continue
+                signature = payload_signature(payload)
+                # Compared with the edit still queued, if any, as that is what the message will show
+                if signature == self._queued_signature.get(key, self._last_signature.get(key)):
+                    self.skipped[key] += 1
+                    continue
+                try:
+                    delivery = await send(payload)
+                finally:
+                    self._last_sent[key] = time.monotonic()
+                if isinstance(delivery, asyncio.Future):
+                    self.queued[key] += 1
+                    self._queued_signature[key] = signature
+                    delivery.add_done_callback(partial(self._delivered, key, signature))
+                else:
+                    self._sent(key, signature)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Render of %s failed", key)
+
+    def _sent(self, key: str, signature: str):
+        self._last_signature[key] = signature
+        self.sent[key] += 1
+        edit_log.info("Edited %s (%s sent, %s merged)", key, self.sent[key], self.merged[key])
+
+    def _delivered(self, key: str, signature: str, delivery: asyncio.Future):
+        if self._queued_signature.get(key) == signature:
+            del self._queued_signature[key]
+        if key not in self._targets or delivery.cancelled():
+            return
+        if delivery.result():
+            self._sent(key, signature)
+        elif delivery.result() is False:
+            # The message may show anything now, so the next render is sent even if unchanged
+            self._last_signature.pop(key, None)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Return requested/merged/skipped/queued/sent counters per message."""
+        return {
+            key: {
+                "requested": self.requested[key],
+                "merged": self.merged[key],
+                "skipped": self.skipped[key],
+                "queued": self.queued[key],
+                "sent": self.sent[key],
+            }
+            for key in self._targets
+        }
@@ -0,0 +1,79 @@
+"""Timestamped record of what happened during a stream, for ``benchmarks.replay``.
+
+One JSON object per line with ``"t"`` (seconds since the trace was opened)
+and ``"e"``, the event:
+
+- ``config`` – settings that change how bids play out (first line);
+- ``load`` – lots added to the queue, ``"lots"`` as in the journal;
+- ``parallel`` – ``/rownolegle_aukcje`` changed the number of running lots;
+- ``start`` – auction ``"id"`` (ledger id) started for lot ``"numer"``;
+- ``open`` – the message of auction ``"id"`` is up and its ``"czas"`` seconds
+  started counting down;
+- ``bid`` – a bid as it came in: ``"src"``, ``"u"`` (Discord user id or chat
+  names), ``"n"`` (Discord display name) and ``"id"`` (auction of the button);
+- ``limit`` – a bid limit ``held``, ``merged`` or ``rejected`` (``"what"``)
+  the bid of ``"u"`` from ``"src"`` recorded just before, under the limit's
+  ``"policy"``, or ``released`` a bid it held earlier;
+- ``close`` – auction ``"id"`` stopped taking bids;
+- ``end`` – auction ``"id"`` ended at ``"cena"``, won by ``"zwyciezca"``.
+
+Unlike the journal, the trace keeps every bid attempt, including those that
+were rejected, and is never compacted.
+"""
+import json
+import time
+from pathlib import Path
+
+CONFIG = "config"
+LOAD = "load"
+PARALLEL = "parallel"
+START = "start"
+OPEN = "open"
+BID = "bid"
+LIMIT = "limit"
+CLOSE = "close"
+END = "end"
+
+
+class TraceWriter:
+    def __init__(self, path: Path):
+        self.path = path
+        self.started = time.monotonic()
+        self._file = None
+
+    def open(self, **config):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self.started = time.monotonic()
+        self.record(CONFIG, **config)
+
+    def record(self, event: str, **fields):
+        if self._file is None:
+            return
+        rec = {"t": round(time.monotonic() - self.started, 4), "e": event, **fields}
+        # Flushed when the line buffer fills or at exit; a trace is not crash-critical
+        self._file.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read(path: Path) -> list[dict]:
+    """Records of a trace; a file appended to by several runs yields the last run."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec["e"] == CONFIG:
+                records = []
+            records.append(rec)
+    return records
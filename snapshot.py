@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from string import Template
+
+import metrics
+
+
+def atomic_write(path: Path, text: str):
+    """Write ``text`` to ``path`` so readers never see a partial file."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def render_historia(historia: list) -> str:
+    historia_html = ""
+    for i, (u, c, _t) in enumerate(reversed(historia)):
+        strong = " font-weight:bold;" if i == 0 else ""
+        historia_html += (
+            f'<li style="{strong}"><span class="user">{u}</span> - '
+            f'<span class="price">{c:.2f} PLN</span></li>'
+        )
+    return historia_html
+
+
+class SnapshotWriter:
+    """Write aktualna_aukcja.html/.json off the event loop, keeping only the latest state."""
+
+    def __init__(self, output_dir: Path, template_path: Path):
+        self.output_dir = output_dir
+        self.template_path = template_path
+        self._template: Template | None = None
+        self._template_mtime: int | None = None
+        self._pending: dict | None = None
+        self._task: asyncio.Task | None = None
+        self.submitted = 0
+        self.written = 0
+
+    def template(self) -> Template:
+        """Return the compiled template, reloading it only when the file changed."""
+        mtime = os.stat(self.template_path).st_mtime_ns
+        if self._template is None or mtime != self._template_mtime:
+            with open(self.template_path, encoding="utf-8") as f:
+                self._template = Template(f.read())
+            self._template_mtime = mtime
+        return self._template
+
+    def submit(self, dane: dict):
+        """Queue ``dane`` for writing; replaces any snapshot not written yet."""
+        self.submitted += 1
+        self._pending = dane
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self):
+        """Wait until the latest submitted snapshot is on disk."""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    async def _run(self):
+        while self._pending is not None:
+            dane, self._pending = self._pending, None
+            try:
+                await self._write(dane)
+                self.written += 1
+            except Exception:
+                logging.exception("Writing auction snapshot failed")
+
+    async def _write(self, dane: dict):
+        await asyncio.to_thread(self.write, dane)
+
+    def render(self, dane: dict) -> str:
+        """Fill the overlay template with ``dane``."""
+        return self.template().safe_substitute(
+            nazwa=dane["nazwa"],
+            numer=dane["numer"],
+            opis=dane["opis"],
+            cena=f"{dane['ostateczna_cena']:.2f}",
+            zwyciezca=dane["zwyciezca"] or "",
+            historia=render_historia(dane["historia"]),
+            obraz=dane["obraz"] or "",
+        )
+
+    def write(self, dane: dict):
+        started = time.perf_counter()
+        html = self.render(dane)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.output_dir / "aktualna_aukcja.html", html)
+        atomic_write(
+            self.output_dir / "aktualna_aukcja.json",
+            json.dumps(dane, ensure_ascii=False, indent=2),
+        )
+        metrics.SNAPSHOT_WRITE_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,28 @@
+import time
+
+
+class StartupTimer:
+    """Wall time of each startup phase, measured from the first ``mark`` before it."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: dict[str, float] = {}
+
+    def mark(self, phase: str):
+        """End ``phase`` now; its duration runs from the previous mark."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def add(self, phase: str, seconds: float):
+        """Record a phase measured elsewhere, e.g. a client built on first use."""
+        self.phases[phase] = seconds
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def report(self) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        return f"{parts} (total {self.total * 1000:.0f} ms)"
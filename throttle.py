@@ -0,0 +1,113 @@
+import time
+from dataclasses import dataclass
+
+import metrics
+from ttl_map import TTLMap
+
+# What happens to a bid over a limit: ``merge`` keeps one waiting bid per user and
+# gives later ones its result, ``reject`` refuses it at once, ``queue`` keeps
+# every bid until a token is free
+POLICIES = ("merge", "reject", "queue")
+
+
+@dataclass
+class Limit:
+    """``rate`` bids per second with bursts of up to ``burst``; a rate of 0 disables it."""
+
+    rate: float = 0.0
+    burst: float = 1.0
+    policy: str = "merge"
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        """Parse ``"rate[,burst[,policy]]"``, e.g. ``"2,4,merge"``."""
+        parts = [p.strip() for p in spec.split(",")] if spec.strip() else []
+        limit = cls()
+        if parts:
+            limit.rate = float(parts[0])
+            limit.burst = float(parts[1]) if len(parts) > 1 else max(limit.rate, 1.0)
+        if len(parts) > 2:
+            if parts[2] not in POLICIES:
+                raise ValueError(f"unknown bid limit policy {parts[2]!r}, expected one of {POLICIES}")
+            limit.policy = parts[2]
+        return limit
+
+    def __bool__(self):
+        return self.rate > 0
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, limit: Limit, now: float):
+        self.rate = limit.rate
+        self.burst = limit.burst
+        self.tokens = limit.burst
+        self.stamp = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class BidThrottle:
+    """Token buckets per bidder (one :class:`Limit` per source) and for all bids.
+
+    Buckets of bidders who stopped bidding expire once they would be full
+    again anyway, so the map stays as small as the set of active bidders.
+    """
+
+    def __init__(self, limits: dict[str, Limit], total: Limit, max_users: int = 10000):
+        self.limits = {source: limit for source, limit in limits.items() if limit}
+        self.total = total
+        self._buckets: dict[str, TTLMap] = {
+            source: TTLMap(limit.burst / limit.rate, max_users) for source, limit in self.limits.items()
+        }
+        self._total = TokenBucket(total, time.monotonic()) if total else None
+        self.shed: dict[tuple[str, str], int] = {}
+
+    def _bucket(self, source: str, key, now: float) -> TokenBucket | None:
+        limit = self.limits.get(source)
+        if limit is None:
+            return None
+        buckets = self._buckets[source]
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(limit, now)
+        buckets[key] = bucket
+        return bucket
+
+    def admit(self, source: str, key, count: bool = True) -> Limit | None:
+        """Take a token for a bid of ``key``; the limit it exceeded, or None."""
+        now = time.monotonic()
+        bucket = self._bucket(source, key, now)
+        exceeded, name = None, None
+        if bucket is not None and not bucket.take(now):
+            exceeded, name = self.limits[source], source
+        elif self._total is not None and not self._total.take(now):
+            if bucket is not None:
+                bucket.tokens += 1   # the bid did not go through after all
+            exceeded, name = self.total, "total"
+        if exceeded is not None and count:
+            self.shed[name, exceeded.policy] = self.shed.get((name, exceeded.policy), 0) + 1
+            metrics.BIDS_THROTTLED.inc(name, exceeded.policy)
+        return exceeded
+
+    def wait(self, source: str, key) -> float:
+        """Seconds until a bid of ``key`` would pass every limit."""
+        now = time.monotonic()
+        bucket = self._bucket(source, key, now)
+        waits = [b.wait(now) for b in (bucket, self._total) if b is not None]
+        return max(waits, default=0.0)
@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+
+
+class TTLMap:
+    """Dict whose entries expire ``ttl`` seconds after being set.
+
+    At most ``max_size`` entries are kept; the oldest are dropped first.
+    Expired entries are removed lazily on access and on every insert.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()   # key -> (expires, value)
+        self.expired = 0
+        self.evicted = 0
+
+    def _purge(self, now: float):
+        while self._data:
+            key, (expires, _value) = next(iter(self._data.items()))
+            if expires > now:
+                break
+            del self._data[key]
+            self.expired += 1
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        self._purge(now)
+        self._data.pop(key, None)
+        self._data[key] = (now + self.ttl, value)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        if item[0] <= time.monotonic():
+            del self._data[key]
+            self.expired += 1
+            return default
+        return item[1]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def pop(self, key, *default):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        del self._data[key]
+        return value
+
+    def __len__(self):
+        self._purge(time.monotonic())
+        return len(self._data)
+
+    def items(self):
+        self._purge(time.monotonic())
+        return [(key, value) for key, (_expires, value) in self._data.items()]
+
+    def values(self):
+        return [value for _key, value in self.items()]
+
+
+_MISSING = object()
@@ -0,0 +1,112 @@
+"""Persistence/render worker for the multi-process deployment.
+
+    python -m worker --socket /run/aukcje/worker.sock
+
+Serves ledger queries (SQLite) and overlay snapshot writes for ``bot.py``
+over a Unix socket, so that disk I/O and HTML rendering run on another
+core than the Discord gateway. Point ``LEDGER_WORKER`` and/or
+``SNAPSHOT_WORKER`` of the bot at the socket; one worker can serve both, or
+run one per role.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from ipc import MAX_LINE, encode
+import logs
+from ledger import Ledger
+from snapshot import SnapshotWriter
+
+# Ledger methods a client may call; run/submit/close stay internal to the worker
+LEDGER_METHODS = {
+    "seed_order_counter",
+    "start_auction",
+    "record_bids",
+    "end_auction",
+    "create_order",
+    "set_order_status",
+    "mark_paid",
+    "orders_by_buyer",
+    "unpaid_orders",
+    "revenue_per_session",
+    "export_bids",
+}
+
+
+class Worker:
+    def __init__(self, ledger_path: Path, output_dir: Path):
+        self.ledger_path = ledger_path
+        self.ledgers: dict[str, Ledger] = {}
+        self.snapshots = SnapshotWriter(output_dir, output_dir / "auction_template.html")
+
+    def ledger(self, session: str) -> Ledger:
+        if session not in self.ledgers:
+            self.ledgers[session] = Ledger(self.ledger_path, session)
+        return self.ledgers[session]
+
+    async def handle(self, msg: dict):
+        op = msg["op"]
+        if op == "ledger":
+            if msg["fn"] not in LEDGER_METHODS:
+                raise ValueError(f"unknown ledger call {msg['fn']!r}")
+            ledger = self.ledger(msg["session"])
+            return await ledger.run(getattr(ledger, msg["fn"]), *msg["args"])
+        if op == "snapshot":
+            self.snapshots.submit(msg["dane"])
+            await self.snapshots.flush()
+            return None
+        raise ValueError(f"unknown op {op!r}")
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests of one connection are handled in order, like the ledger thread
+        try:
+            while line := await reader.readline():
+                msg = json.loads(line)
+                try:
+                    reply = {"id": msg["id"], "result": await self.handle(msg)}
+                except Exception as e:
+                    logging.exception("Worker request %s failed", msg.get("op"))
+                    reply = {"id": msg["id"], "error": f"{type(e).__name__}: {e}"}
+                if msg["id"] is not None:
+                    writer.write(encode(reply))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        for ledger in self.ledgers.values():
+            ledger.close()
+
+
+async def main(socket_path: str, ledger_path: Path, output_dir: Path):
+    worker = Worker(ledger_path, output_dir)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(worker.serve, socket_path, limit=MAX_LINE)
+    logging.info("Worker listening on %s", socket_path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        worker.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logs.setup(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--socket", default=os.getenv("WORKER_SOCKET", "worker.sock"))
+    parser.add_argument("--ledger", type=Path, default=Path(os.getenv("LEDGER_PATH", "orders/aukcje.db")))
+    parser.add_argument("--output", type=Path, default=Path("templates"))
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.socket, args.ledger, args.output))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,144 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Any, Callable
+
+import metrics
+from chat_sources import ChatBid, ChatUser, is_bid
+
+# Quota units charged by the YouTube Data API for one liveChatMessages.list call
+LIST_QUOTA_COST = 5
+MIN_INTERVAL = 1.0
+MAX_BACKOFF = 300.0
+
+
+def build_client(api_key: str):
+    """Build the YouTube Data API client.
+
+    googleapiclient is imported here rather than at module level: it is slow
+    to import and Discord-only deployments never need it.
+    """
+    from googleapiclient.discovery import build
+
+    return build("youtube", "v3", developerKey=api_key, cache_discovery=False)
+
+
+class YouTubeChatPoller:
+    """Poll YouTube live chat at the pace the API asks for and forward bids.
+
+    ``on_bids`` is called once per page with a :class:`ChatBid` for every
+    ``!bit`` on it, so a page of bids is applied as one batch. Used when the
+    streaming endpoint (:class:`chat_sources.YouTubeStreamSource`) is not.
+    ``youtube`` may be a zero-argument factory; the client is then built in
+    the polling thread on the first poll.
+    """
+
+    def __init__(
+        self,
+        youtube: Any | Callable[[], Any],
+        live_chat_id: str,
+        on_bids: Callable[[list[ChatBid]], None],
+        active: Callable[[], bool],
+        default_interval: float = 5.0,
+        quota_limit: int = 10000,
+    ):
+        self.youtube = None if callable(youtube) else youtube
+        self._factory = youtube if callable(youtube) else None
+        self.client_seconds: float | None = None
+        self.live_chat_id = live_chat_id
+        self.on_bids = on_bids
+        self.active = active
+        self.default_interval = default_interval
+        self.quota_limit = quota_limit
+        self.page_token: str | None = None
+        self.backoff = 0.0
+        self.quota_used = 0
+        self.quota_day = datetime.datetime.utcnow().date()
+        self.polls = 0
+        self.errors = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self.active():
+                await asyncio.sleep(self.default_interval)
+                continue
+            await asyncio.sleep(await self.poll())
+
+    def _fetch(self) -> dict:
+        if self.youtube is None:
+            started = time.perf_counter()
+            self.youtube = self._factory()
+            self.client_seconds = time.perf_counter() - started
+            logging.info("YouTube client built in %.0f ms", self.client_seconds * 1000)
+        return self.youtube.liveChatMessages().list(
+            liveChatId=self.live_chat_id,
+            part="snippet,authorDetails",
+            pageToken=self.page_token,
+        ).execute()
+
+    async def poll(self) -> float:
+        """Fetch one page and return how long to wait before the next one."""
+        today = datetime.datetime.utcnow().date()
+        if today != self.quota_day:
+            self.quota_day = today
+            self.quota_used = 0
+        if self.quota_used + LIST_QUOTA_COST > self.quota_limit:
+            logging.warning("YouTube quota budget of %s units used up for today", self.quota_limit)
+            return MAX_BACKOFF
+        self.quota_used += LIST_QUOTA_COST
+        self.polls += 1
+        try:
+            resp = await asyncio.to_thread(self._fetch)
+        except Exception as e:
+            return self._on_error(e, _http_status(e))
+        self.backoff = 0.0
+        self.page_token = resp.get("nextPageToken")
+        items = resp.get("items", [])
+        metrics.YOUTUBE_PAGE_ITEMS.observe(len(items))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        bids = []
+        for item in items:
+            published = item["snippet"].get("publishedAt")
+            sent = None
+            if published:
+                sent = datetime.datetime.fromisoformat(published.replace("Z", "+00:00"))
+                metrics.YOUTUBE_POLL_LAG_SECONDS.observe((now - sent).total_seconds())
+            if is_bid(item["snippet"]["displayMessage"]):
+                bids.append(ChatBid(
+                    ChatUser("youtube", item["authorDetails"]["displayName"]),
+                    sent.timestamp() if sent else None,
+                ))
+        if bids:
+            self.on_bids(bids)
+        interval = resp.get("pollingIntervalMillis")
+        if interval is None:
+            return self.default_interval
+        return max(interval / 1000, MIN_INTERVAL)
+
+    def _on_error(self, error: Exception, status: int) -> float:
+        self.errors += 1
+        self.backoff = min(max(self.backoff * 2, self.default_interval), MAX_BACKOFF)
+        if status in (403, 429) or status >= 500:
+            logging.warning(
+                "YouTube chat poll throttled (%s), retrying in %.0fs: %s",
+                status, self.backoff, error,
+            )
+        else:
+            logging.error("YouTube chat poll failed, retrying in %.0fs: %s", self.backoff, error)
+        return self.backoff
+
+
+def _http_status(error: Exception) -> int:
+    """HTTP status of a googleapiclient ``HttpError``, 0 for anything else."""
+    # Already imported by the client that raised it, so this costs nothing
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(error, HttpError):
+        return 0
+    return getattr(error.resp, "status", 0)